@@ -0,0 +1 @@
+from .fake_storage import SimulatedNetwork, InMemoryBlobManager, InMemoryTableStorageManager
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""
+Local load test of the detection activity code path (run_yolov_detection), with Azure Storage replaced by in-memory
+fakes and a synthetic or local image corpus.
+
+Usage (from the repository root):
+    python -m benchmarks.activity_benchmark --concurrency 1 4 8 --requests 200
+    python -m benchmarks.activity_benchmark --source yolov5/data/images --storage-latency-ms 15 --output run.json
+    python -m benchmarks.activity_benchmark --compare previous-run.json
+
+Reports p50/p95/p99 latency, images/sec and a per-stage breakdown (download, decode, preprocess, inference, nms,
+annotate, upload) per concurrency level, and writes the run as JSON so runs can be compared over time.
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import wraps
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ('download', 'decode', 'preprocess', 'inference', 'nms', 'annotate', 'upload')
+
+# function_app builds its storage clients at import time; the development storage strings parse offline and the
+# clients are swapped for the in-memory fakes before any request is made
+BENCHMARK_SETTINGS = {
+    "BlobContainerName": "benchmark-images",
+    "ProcessedBlobsContainerName": "benchmark-predictions",
+    "BlobConnectionString": "UseDevelopmentStorage=true",
+    "TableStorageName": "benchmark",
+    "TableConnectionString": "UseDevelopmentStorage=true",
+}
+
+
+class StageRecorder:
+    """
+    Collects the duration of every call to an instrumented stage, from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def timed(self, stage: str, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start_time)
+        return wrapper
+
+
+def latency_summary(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1e3
+    p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+    return {
+        "count": len(samples),
+        "meanMs": round(float(ms.mean()), 3),
+        "p50Ms": round(float(p50), 3),
+        "p95Ms": round(float(p95), 3),
+        "p99Ms": round(float(p99), 3),
+        "maxMs": round(float(ms.max()), 3)
+    }
+
+
+def synthetic_image(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Draws a noisy gradient with a few filled rectangles, so the encoded size and decode cost resemble a photo more than
+    a flat image would.
+    """
+    im = np.empty((height, width, 3), dtype=np.uint8)
+    im[...] = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    im = cv2.add(im, rng.integers(0, 48, im.shape, dtype=np.uint8))
+    for _ in range(int(rng.integers(3, 12))):
+        x1, y1 = int(rng.integers(0, width - 16)), int(rng.integers(0, height - 16))
+        x2, y2 = x1 + int(rng.integers(16, width // 3)), y1 + int(rng.integers(16, height // 3))
+        cv2.rectangle(im, (x1, y1), (x2, y2), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+    return im
+
+
+def load_corpus(opt) -> list:
+    """
+    Returns (file_name, encoded bytes) pairs, read from --source or generated from --img-sizes.
+    """
+    if opt.source:
+        files = sorted(f for ext in ('jpg', 'jpeg', 'png', 'bmp', 'webp')
+                       for f in glob.glob(os.path.join(opt.source, f'*.{ext}')))
+        if not files:
+            raise FileNotFoundError(f"No images found in '{opt.source}'.")
+        corpus = []
+        for f in files:
+            with open(f, 'rb') as file:
+                corpus.append((os.path.basename(f), file.read()))
+        return corpus
+
+    rng = np.random.default_rng(opt.seed)
+    corpus = []
+    for i in range(opt.corpus_size):
+        width, height = (int(x) for x in opt.img_sizes[i % len(opt.img_sizes)].lower().split('x'))
+        ok, encoded = cv2.imencode('.jpg', synthetic_image(width, height, rng), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        assert ok, f"Synthetic image {i} could not be encoded."
+        corpus.append((f"synthetic_{i:04d}_{width}x{height}.jpg", encoded.tobytes()))
+    return corpus
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_app(opt):
+    """
+    Imports function_app with its storage managers replaced by the in-memory fakes, and instruments every stage.
+    """
+    for name, value in BENCHMARK_SETTINGS.items():
+        os.environ.setdefault(name, value)
+    os.environ["ResultCacheEnabled"] = str(opt.cache).lower()
+
+    import function_app
+    from benchmarks.fake_storage import InMemoryBlobManager, InMemoryTableStorageManager, SimulatedNetwork
+    from detectors import get_yolov_engine
+    from managers import DetectionResultCache
+
+    logging.getLogger().setLevel(logging.INFO if opt.verbose else logging.WARNING)
+
+    network = SimulatedNetwork(opt.storage_latency_ms, opt.storage_bandwidth_mbps)
+    images = InMemoryBlobManager(function_app.blob_container_name, network)
+    predictions = InMemoryBlobManager(function_app.predictions_blob_container_name, network)
+    table = InMemoryTableStorageManager(function_app.table_storage_name, network)
+    function_app.azure_blob_manager = images
+    function_app.predictions_azure_blob_manager = predictions
+    function_app.azure_table_storage_manager = table
+    function_app.result_cache_enabled = opt.cache
+    function_app.result_cache = DetectionResultCache(table, int(os.environ.get("ResultCacheSize", 1024)))
+
+    recorder = StageRecorder()
+    engine = get_yolov_engine(opt.model_name, opt.model_version)
+    images.download_blob_to_buffer = recorder.timed('download', images.download_blob_to_buffer)
+    function_app.decode_image = recorder.timed('decode', function_app.decode_image)
+    engine.preprocess = recorder.timed('preprocess', engine.preprocess)
+    engine.forward = recorder.timed('inference', engine.forward)
+    engine.postprocess = recorder.timed('nms', engine.postprocess)
+    engine.annotate = recorder.timed('annotate', engine.annotate)
+    predictions.upload_bytes_to_blob = recorder.timed('upload', predictions.upload_bytes_to_blob)
+    return function_app, engine, images, recorder
+
+
+def run_level(function_app, corpus: list, concurrency: int, requests: int, offset: int) -> tuple:
+    """
+    Runs requests through run_yolov_detection with concurrency worker threads, the way the Functions host runs
+    synchronous activities. Every request gets its own blob name, cycling through the corpus content.
+    """
+    from models import VisioDetectorHttpRequest
+    from models.enums import DetectorType
+
+    def run(i):
+        file_name = f"{offset + i:06d}_{corpus[i % len(corpus)][0]}"
+        request = VisioDetectorHttpRequest(file_name=file_name, source_blob_uri=None, detector_type=DetectorType.YoloV5)
+        start_time = time.perf_counter()
+        result = function_app.run_yolov_detection(request)
+        return time.perf_counter() - start_time, result.has_errors
+
+    for i in range(requests):
+        function_app.azure_blob_manager.put_blob(f"{offset + i:06d}_{corpus[i % len(corpus)][0]}", corpus[i % len(corpus)][1])
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(run, range(requests)))
+    return time.perf_counter() - start_time, outcomes
+
+
+def compare(current: dict, previous: dict):
+    """
+    Prints the throughput and latency deltas against a previous run, matched by concurrency level.
+    """
+    previous_levels = {level['concurrency']: level for level in previous['levels']}
+    for level in current['levels']:
+        before = previous_levels.get(level['concurrency'])
+        if before is None:
+            continue
+        deltas = []
+        for label, now, then in (('images/s', level['imagesPerSec'], before['imagesPerSec']),
+                                 ('p50', level['latency'].get('p50Ms'), before['latency'].get('p50Ms')),
+                                 ('p95', level['latency'].get('p95Ms'), before['latency'].get('p95Ms')),
+                                 ('p99', level['latency'].get('p99Ms'), before['latency'].get('p99Ms'))):
+            if now is not None and then:
+                deltas.append(f"{label} {then:.1f} -> {now:.1f} ({(now - then) / then * 100:+.1f}%)")
+        print(f"concurrency {level['concurrency']:>3}: " + ", ".join(deltas))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 8], help='concurrent activity invocations')
+    parser.add_argument('--requests', type=int, default=100, help='requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests before the first level')
+    parser.add_argument('--source', type=str, default=None, help='directory of images to use instead of synthetic ones')
+    parser.add_argument('--corpus-size', type=int, default=16, help='number of synthetic images')
+    parser.add_argument('--img-sizes', nargs='+', default=['640x480', '1280x720', '1920x1080'],
+                        help='synthetic image sizes, WIDTHxHEIGHT, used round-robin')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic corpus seed')
+    parser.add_argument('--storage-latency-ms', type=float, default=0, help='simulated storage round-trip latency')
+    parser.add_argument('--storage-bandwidth-mbps', type=float, default=0, help='simulated storage bandwidth, 0 = unlimited')
+    parser.add_argument('--cache', action='store_true', help='keep the detection result cache enabled')
+    parser.add_argument('--model-name', type=str, default=None, help='registry model to benchmark')
+    parser.add_argument('--model-version', type=str, default=None, help='registry model version to benchmark')
+    parser.add_argument('--output', type=str, default=None, help='JSON result path, default benchmark-<timestamp>.json')
+    parser.add_argument('--compare', type=str, default=None, help='previous JSON result to compare against')
+    parser.add_argument('--verbose', action='store_true', help='keep the app INFO logging')
+    return parser.parse_args()
+
+
+def main(opt):
+    sys.path.insert(0, ROOT)
+
+    corpus = load_corpus(opt)
+    function_app, engine, images, recorder = setup_app(opt)
+
+    offset = 0
+    if opt.warmup:
+        run_level(function_app, corpus, 1, opt.warmup, offset)
+        offset += opt.warmup
+
+    levels = []
+    for concurrency in opt.concurrency:
+        recorder.reset()
+        engine.nms_stats.clear()
+        wall_time, outcomes = run_level(function_app, corpus, concurrency, opt.requests, offset)
+        offset += opt.requests
+
+        succeeded = [seconds for seconds, has_errors in outcomes if not has_errors]
+        level = {
+            "concurrency": concurrency,
+            "requests": len(outcomes),
+            "errors": len(outcomes) - len(succeeded),
+            "wallTimeSec": round(wall_time, 3),
+            "imagesPerSec": round(len(succeeded) / wall_time, 3) if wall_time else 0,
+            "latency": latency_summary(succeeded),
+            "stages": {stage: latency_summary(recorder.samples.get(stage, [])) for stage in STAGES},
+            "nmsCandidates": dict(engine.nms_stats)
+        }
+        levels.append(level)
+        print(f"concurrency {concurrency:>3}: {level['imagesPerSec']:.1f} images/s, "
+              f"p50 {level['latency'].get('p50Ms', 0):.1f}ms, p95 {level['latency'].get('p95Ms', 0):.1f}ms, "
+              f"p99 {level['latency'].get('p99Ms', 0):.1f}ms, {level['errors']} errors")
+
+    import torch
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "gitCommit": git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "torch": torch.__version__,
+            "device": str(engine.device),
+            "backend": engine.backend,
+            "modelName": engine.model_name,
+            "modelVersion": engine.model_version,
+            "imgsz": list(engine.imgsz),
+            "nmsTopK": engine.nms_topk,
+            "maxBatchSize": int(os.environ.get("YoloV5MaxBatchSize", 1))
+        },
+        "config": {k: v for k, v in vars(opt).items() if k not in ('output', 'compare', 'verbose')},
+        "corpus": {"images": len(corpus), "bytes": sum(len(data) for _, data in corpus)},
+        "levels": levels
+    }
+
+    output = opt.output or f"benchmark-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
+
+    if opt.compare:
+        with open(opt.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main(parse_opt())
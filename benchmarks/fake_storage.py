@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+
+class SimulatedNetwork:
+    """
+    Adds a fixed round-trip latency plus a transfer time proportional to the payload, standing in for the network
+    between the function host and Azure Storage.
+    """
+
+    def __init__(self, latency_ms: float = 0, bandwidth_mbps: float = 0):
+        self.latency = latency_ms / 1e3
+        self.bytes_per_second = bandwidth_mbps * 1e6 / 8
+
+    def transfer(self, size: int = 0):
+        delay = self.latency + (size / self.bytes_per_second if self.bytes_per_second else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class InMemoryBlobManager:
+    """
+    Drop-in replacement for AzureBlobManager that keeps the container in a dict. Implements the methods the
+    detection activities call, with the same signatures and errors.
+    """
+
+    def __init__(self, container_name: str, network: SimulatedNetwork = None):
+        self.container_name = container_name
+        self.network = network or SimulatedNetwork()
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def put_blob(self, file_name, data: bytes):
+        with self._lock:
+            self._blobs[file_name] = bytes(data)
+
+    def list_blob_names(self, prefix=None) -> list:
+        self.network.transfer()
+        with self._lock:
+            return [name for name in self._blobs if not prefix or name.startswith(prefix)]
+
+    def get_blob_properties(self, file_name):
+        self.network.transfer()
+        with self._lock:
+            data = self._blobs.get(file_name)
+        if data is None:
+            raise FileNotFoundError(f"Blob '{file_name}' does not exist in container '{self.container_name}'.")
+        content_md5 = hashlib.md5(data).digest()
+        return SimpleNamespace(size=len(data), etag=f'"{content_md5.hex()}"',
+                               content_settings=SimpleNamespace(content_md5=bytearray(content_md5)))
+
+    def get_blob_content_key(self, file_name, properties=None) -> str:
+        if properties is None:
+            properties = self.get_blob_properties(file_name)
+        return f"md5:{bytes(properties.content_settings.content_md5).hex()}"
+
+    def download_blob_to_buffer(self, file_name, max_concurrency=4, max_size=None, properties=None) -> bytearray:
+        with self._lock:
+            data = self._blobs.get(file_name)
+        if data is None:
+            raise FileNotFoundError(f"Blob '{file_name}' does not exist in container '{self.container_name}'.")
+        if max_size is not None and len(data) > max_size:
+            raise ValueError(f"Blob '{file_name}' is {len(data)} bytes, larger than the {max_size} bytes limit.")
+
+        self.network.transfer(len(data))
+        return bytearray(data)
+
+    def download_blobs(self, file_names, max_concurrency=16, max_size=None) -> dict:
+        results = {}
+        for file_name in file_names:
+            try:
+                results[file_name] = self.download_blob_to_buffer(file_name, max_size=max_size)
+            except Exception as ex:
+                results[file_name] = ex
+        return results
+
+    def download_and_upload_file(self, file_name, upload_dir) -> str:
+        download_file_path = os.path.join(upload_dir, file_name)
+        os.makedirs(os.path.dirname(download_file_path), exist_ok=True)
+        with open(download_file_path, "wb") as download_file:
+            download_file.write(self.download_blob_to_buffer(file_name))
+        return download_file_path
+
+    def upload_file_to_blob(self, file_path, file_name) -> str:
+        if not file_path:
+            raise ValueError("File path is null or empty.")
+        if not file_name:
+            raise ValueError("File name is null or empty.")
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File '{file_path}' does not exist.")
+
+        with open(file_path, "rb") as file:
+            return self.upload_bytes_to_blob(file.read(), file_name)
+
+    def upload_bytes_to_blob(self, data, file_name, content_type=None) -> str:
+        if not file_name:
+            raise ValueError("File name is null or empty.")
+
+        self.network.transfer(len(data))
+        self.put_blob(file_name, data)
+        return f"Uploaded file '{file_name}' to blob container '{self.container_name}'."
+
+    def upload_files(self, files, max_concurrency=16) -> dict:
+        results = {}
+        for file_path, file_name in files:
+            try:
+                results[file_name] = self.upload_file_to_blob(file_path, file_name)
+            except Exception as ex:
+                results[file_name] = ex
+        return results
+
+
+class InMemoryTableStorageManager:
+    """
+    Drop-in replacement for AzureTableStorageManager backed by a dict of (PartitionKey, RowKey) -> entity.
+    """
+
+    def __init__(self, table_name: str, network: SimulatedNetwork = None):
+        self.table_name = table_name
+        self.network = network or SimulatedNetwork()
+        self._entities = {}
+        self._lock = threading.Lock()
+
+    def get_entity(self, partition_key, row_key):
+        self.network.transfer()
+        with self._lock:
+            entity = self._entities.get((partition_key, row_key))
+        return dict(entity) if entity is not None else None
+
+    def upsert_entity(self, entity: dict):
+        self.network.transfer()
+        with self._lock:
+            self._entities[(entity['PartitionKey'], entity['RowKey'])] = dict(entity)
+
+    def delete_partition(self, partition_key) -> int:
+        self.network.transfer()
+        with self._lock:
+            keys = [key for key in self._entities if key[0] == partition_key]
+            for key in keys:
+                del self._entities[key]
+        return len(keys)
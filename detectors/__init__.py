@@ -1 +1,5 @@
-from .yolov_detector import run_yolov_detector
\ No newline at end of file
+from .yolov_detector import run_yolov_detector, run_yolov_engine_detector
+from .yolov_engine import YoloV5Engine, YoloV5Detections
+from .yolov_batcher import YoloV5MicroBatcher, MicroBatchMetrics, get_yolov_batcher
+from .yolov_model_registry import YoloV5ModelRegistry, ModelSpec, get_model_registry, get_yolov_engine
+from .yolov_video import read_video_info, iter_video_frames, run_yolov_video_chunk
\ No newline at end of file
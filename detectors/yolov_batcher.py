@@ -0,0 +1,206 @@
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from detectors.yolov_engine import YoloV5Detections, YoloV5Engine
+from utils.stage_profiler import get_stage_profiler
+
+
+@dataclass
+class _BatchRequest:
+    im0: np.ndarray
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatchMetrics:
+    """
+    Thread-safe counters for tuning the micro-batcher: how full the batches are and how long requests wait for them.
+    """
+
+    def __init__(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def record(self, batch_size: int, queue_delays: list):
+        with self._lock:
+            self.batches += 1
+            self.images += batch_size
+            self.queue_delay_total += sum(queue_delays)
+            self.queue_delay_max = max(self.queue_delay_max, *queue_delays)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "images": self.images,
+                "avgBatchSize": self.images / self.batches if self.batches else 0,
+                "batchFillRatio": self.images / (self.batches * self.max_batch_size) if self.batches else 0,
+                "avgQueueDelayMs": self.queue_delay_total / self.images * 1e3 if self.images else 0,
+                "maxQueueDelayMs": self.queue_delay_max * 1e3
+            }
+
+
+class YoloV5MicroBatcher:
+    """
+    Coalesces concurrent detection requests into one forward pass. A single scheduler thread waits for up to
+    max_batch_size images or max_wait_ms after the first queued image, whichever comes first, runs the batch through
+    the engine and hands each caller its own detections.
+    """
+
+    def __init__(self, engine: YoloV5Engine, max_batch_size: int = 8, max_wait_ms: float = 10):
+        # Weak, since batchers are kept in a WeakKeyDictionary keyed by their engine and would otherwise keep it alive
+        self._engine = weakref.ref(engine)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1e3
+        self.metrics = MicroBatchMetrics(max_batch_size)
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="yolov5-micro-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def engine(self) -> YoloV5Engine:
+        engine = self._engine()
+        if engine is None:
+            raise RuntimeError("The engine of this micro-batcher has been released.")
+        return engine
+
+    def submit(self, im0: np.ndarray) -> Future:
+        """
+        Queues a BGR image for detection and returns a future resolving to its YoloV5Detections.
+        """
+        request = _BatchRequest(im0)
+        with self._close_lock:
+            if not self._closed:
+                self._queue.put(request)
+                return request.future
+
+        # The batcher was retired (e.g. its model was swapped out) after the caller got hold of it
+        request.future.set_result(self.engine.detect_batch([im0])[0])
+        return request.future
+
+    def detect(self, im0: np.ndarray, annotate: bool = True) -> YoloV5Detections:
+        result = self.submit(im0).result()
+        if annotate:
+            # Annotation runs on the calling thread so it does not hold up the next batch
+            result.annotated_img = self.engine.annotate(im0, result.detections)
+        return result
+
+    def detect_file(self, source_path: str, annotate: bool = True) -> YoloV5Detections:
+        im0 = self.engine.read_image(source_path)
+        return self.detect(im0, annotate=annotate)
+
+    def close(self, wait: bool = True):
+        """
+        Stops accepting requests; everything already queued is still processed.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        if wait:
+            self._thread.join()
+
+    def _collect(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                # Once the deadline has passed only drain what is already queued
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            dispatched_at = time.perf_counter()
+            queue_delays = [dispatched_at - r.enqueued_at for r in batch]
+            self.metrics.record(len(batch), queue_delays)
+            self._publish(len(batch), queue_delays)
+            try:
+                results = self.engine.detect_batch([r.im0 for r in batch])
+            except Exception as ex:
+                logging.error(f"YoloV5MicroBatcher batch of {len(batch)} failed: {ex}")
+                for request in batch:
+                    request.future.set_exception(ex)
+                continue
+
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+            logging.debug(f"YoloV5MicroBatcher batch of {len(batch)}: {self.metrics.snapshot()}")
+
+    def _publish(self, batch_size: int, queue_delays: list):
+        """
+        Exposes the batch fill and the time each image waited for its batch (the queue stage) on the /metrics endpoint.
+        """
+        engine = self._engine()
+        if engine is None:
+            return
+        stage_profiler, labels = get_stage_profiler(), engine.stage_labels
+        stage_profiler.observe_batch(batch_size, self.max_batch_size, **labels)
+        for queue_delay in queue_delays:
+            stage_profiler.observe("queue", queue_delay, **labels)
+
+
+_batchers = weakref.WeakKeyDictionary()
+_batchers_lock = threading.Lock()
+
+
+def get_yolov_batcher(engine: YoloV5Engine) -> YoloV5MicroBatcher:
+    """
+    Returns the micro-batcher of an engine, or None when batching is disabled (YoloV5MaxBatchSize <= 1).
+    Each resident model gets its own batcher, since a batch can only go through one model.
+    """
+    max_batch_size = int(os.environ.get("YoloV5MaxBatchSize", 1))
+    if max_batch_size <= 1:
+        return None
+
+    with _batchers_lock:
+        batcher = _batchers.get(engine)
+        if batcher is None:
+            batcher = _batchers[engine] = YoloV5MicroBatcher(
+                engine,
+                max_batch_size=max_batch_size,
+                max_wait_ms=float(os.environ.get("YoloV5MaxBatchWaitMs", 10)))
+            # Stops the scheduler thread once the engine is released without having been retired
+            weakref.finalize(engine, batcher.close, False)
+    return batcher
+
+
+def retire_yolov_batcher(engine: YoloV5Engine):
+    """
+    Closes the batcher of an engine that is no longer served, after its queued requests complete.
+    """
+    with _batchers_lock:
+        batcher = _batchers.pop(engine, None)
+    if batcher is not None:
+        batcher.close(wait=False)
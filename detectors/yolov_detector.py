@@ -1,11 +1,17 @@
+import csv
+import io
 import subprocess
 import os
 import shutil
+import sys
 import time
 
-from models import ImagePredictionResult
+from detectors.yolov_batcher import get_yolov_batcher
+from detectors.yolov_model_registry import get_yolov_engine
+from models import DetectionSet, ImagePredictionResult
 from models.enums import DetectorType
-from utils.storage_helpers import img_rename_to_detection_result
+from utils.image_helpers import IMAGE_CONTENT_TYPES, encode_image
+from utils.storage_helpers import build_detection_result_name, img_rename_to_detection_result
 
 def run_yolov_detector(
         file_name,
@@ -13,41 +19,36 @@ def run_yolov_detector(
         script_dir,
         csv_path,
         result_dir_name,
-        prediction_result_dir
+        prediction_result_dir,
+        results_dir
         ) -> ImagePredictionResult:
-    
-    if os.path.exists(prediction_result_dir):
-        # Remove the directory and its contents
-        shutil.rmtree(prediction_result_dir)
-
-    # Save the current working directory
-    original_dir = os.getcwd()
+    """
+    Runs detect.py in a subprocess. Each invocation gets its own prediction_result_dir and the subprocess gets its own
+    working directory, so concurrent invocations in one worker never share output files or process-global state.
+    The annotated image is moved into results_dir under a unique name and the scratch directory is removed.
+    """
     detector_type = DetectorType.YoloV5
     # Define the command to run
     try:
-        # Change the working directory to script_dir
-        os.chdir(script_dir)
-
         # Define the command to run
         command = [
-            "python", "detect.py",
+            sys.executable, "detect.py",
             "--source", source_path,
             "--weights", "runs/train/yolov-202405-last.pt",
             "--conf", "0.25",
-            "--project", "runs/detect",
+            "--project", os.path.dirname(prediction_result_dir),
             "--name", result_dir_name,
+            "--exist-ok",
             "--save-csv"
         ]
 
-        # Run the command and capture output and errors
+        # Run the command from script_dir and capture output and errors
         start_time = time.time()
-        process = subprocess.run(' '.join(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+        process = subprocess.run(command, cwd=script_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
         end_time = time.time()
         time_taken = end_time - start_time
 
-        errors = process.stderr.decode()
-
         # Log the output and errors
         output = process.stdout.decode()
         errors = process.stderr.decode()
@@ -62,17 +63,15 @@ def run_yolov_detector(
         except FileNotFoundError:
             predictions_csv_content = "Predictions CSV file not found"
 
-        # Print the output and errors after the result
-        if output:
-            print("Output:", output)
-        if errors:
-            print("Errors:", errors)
-
         # Serialize the output to JSON
-        result_img_name, result_img_path = img_rename_to_detection_result(os.path.join(prediction_result_dir, file_name), detector_type)
-        first_row = predictions_csv_content.split('\n')[0]
-        # Splitting the first row into components 
-        image_name, classification, prediction = first_row.split(',')
+        os.makedirs(results_dir, exist_ok=True)
+        result_img_name, result_img_path = img_rename_to_detection_result(os.path.join(prediction_result_dir, file_name), detector_type, results_dir)
+        # The first row is the header written by detect.py
+        rows = list(csv.DictReader(io.StringIO(predictions_csv_content)))
+        if not rows:
+            raise ValueError(f"No predictions in '{csv_path}'.")
+        first_row = rows[0]
+        image_name, classification, prediction = first_row["Image Name"], first_row["Prediction"], first_row["Confidence"]
 
         return ImagePredictionResult(
             image_name=image_name,
@@ -86,12 +85,63 @@ def run_yolov_detector(
     except Exception as ex:
 
         return ImagePredictionResult(
-            file_name = file_name,
+            image_name = file_name,
             detector_type= detector_type,
             errors= str(ex),
             has_errors=True)
     
 
     finally:
-        # Change the working directory back to the original directory
-        os.chdir(original_dir)
+        # Remove this invocation's scratch directory, the result image has been moved out of it
+        shutil.rmtree(prediction_result_dir, ignore_errors=True)
+
+
+def run_yolov_engine_detector(
+        file_name,
+        im0,
+        model_name=None,
+        model_version=None,
+        image_format=None,
+        quality=95,
+        max_dimension=None,
+        scale=1
+        ) -> tuple:
+    """
+    Detects objects in an in-memory image and encodes the annotated result in memory, nothing is written to disk.
+    image_format is 'jpg', 'png' or 'webp' (defaults to the source format), or 'none' for boxes-only results that
+    skip annotation and encoding altogether. scale is the factor im0 was reduced by when decoded (see
+    decode_image); the boxes are scaled back to source image pixels, the annotated image keeps the decoded size.
+
+    Returns:
+    - tuple: The ImagePredictionResult and the encoded result image as (bytes, content type), None for boxes only.
+    """
+    detector_type = DetectorType.YoloV5
+    start_time = time.time()
+    boxes_only = (image_format or "").lower() == "none"
+
+    # Concurrent activities share one forward pass when micro-batching is enabled
+    engine = get_yolov_engine(model_name, model_version)
+    result = (get_yolov_batcher(engine) or engine).detect(im0, annotate=not boxes_only)
+
+    result_img_name, encoded_img = None, None
+    if not boxes_only:
+        img_ext = os.path.splitext(file_name)[1].lower()
+        if image_format:
+            img_ext = "." + image_format.lower().lstrip(".")
+        elif img_ext not in IMAGE_CONTENT_TYPES:
+            img_ext = ".jpg"  # e.g. GIF sources, which OpenCV cannot encode
+        with engine.stage("encode"):
+            encoded_img = encode_image(result.annotated_img, img_ext, quality, max_dimension)
+        result_img_name = build_detection_result_name(file_name, detector_type, img_ext)
+
+    detections = result.detections
+    if scale != 1:
+        detections = detections.copy()
+        detections[:, :4] *= scale
+
+    return ImagePredictionResult.from_detections(
+        image_name=file_name,
+        detector_type=detector_type,
+        detections=DetectionSet(detections, result.names),
+        result_img_name=result_img_name,
+        time_taken=time.time() - start_time), encoded_img
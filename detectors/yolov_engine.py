@@ -0,0 +1,302 @@
+import hashlib
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.utils.plotting import Annotator, colors
+
+from utils.stage_profiler import get_stage_profiler
+
+YOLOV5_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'yolov5')
+DEFAULT_WEIGHTS = os.path.join(YOLOV5_ROOT, 'runs/train/yolov-202405-last.pt')
+
+# The function app has its own top-level 'models' and 'utils' packages, which shadow the yolov5 ones.
+_SHADOWED_PACKAGES = ('models', 'utils')
+
+# The yolov5 modules the engine runs, including those only imported lazily inside yolov5 functions
+# (DetectMultiBackend, attempt_load) or by unpickling weights (models.yolo, models.common).
+_YOLOV5_MODULES = ('export', 'models.common', 'models.experimental', 'models.yolo', 'utils.augmentations',
+                   'utils.downloads', 'utils.general', 'utils.plots', 'utils.torch_utils', 'utils.triton')
+
+
+def _is_shadowed(module_name: str) -> bool:
+    return any(module_name == pkg or module_name.startswith(pkg + '.') for pkg in _SHADOWED_PACKAGES)
+
+
+def _import_yolov5() -> dict:
+    """
+    Imports the yolov5 modules once, while this module loads during function indexing and before any request or
+    model registry thread runs, with the app 'models'/'utils' packages swapped out for the duration.
+
+    Only the package modules themselves collide, so the app packages then go back into sys.modules while the yolov5
+    submodules stay registered under their own names. Lazy imports inside yolov5 and unpickling weights resolve them
+    from there, so sys.modules is never swapped again while other threads import.
+    """
+    app_modules = {name: sys.modules.pop(name) for name in list(sys.modules) if _is_shadowed(name)}
+    sys.path.insert(0, YOLOV5_ROOT)
+    try:
+        return {name: importlib.import_module(name) for name in _YOLOV5_MODULES}
+    finally:
+        sys.path.remove(YOLOV5_ROOT)
+        for name in [name for name in sys.modules if name in _SHADOWED_PACKAGES or name in app_modules]:
+            del sys.modules[name]
+        sys.modules.update(app_modules)
+
+
+_yolov5 = _import_yolov5()
+
+
+def weights_hash(weights: str) -> str:
+    """
+    Returns the SHA-256 of a weights file, or of every file in an exported model directory (e.g. *_openvino_model).
+    """
+    sha256 = hashlib.sha256()
+    paths = [weights] if os.path.isfile(weights) else sorted(
+        os.path.join(root, name) for root, _, names in os.walk(weights) for name in names)
+    for path in paths:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+@dataclass
+class YoloV5Detections:
+    image_shape: tuple
+    detections: np.ndarray  # (n, 6) xyxy, conf, cls in source image pixels, sorted by confidence
+    names: dict
+    annotated_img: np.ndarray = None
+    timings: dict = field(default_factory=dict)
+
+
+class YoloV5Engine:
+    """
+    Resident YOLOv5 inference engine. The model is loaded and warmed up once per worker process and then shared by
+    all activity invocations, replacing the per-request detect.py subprocess.
+    """
+
+    def __init__(self,
+                 weights: str = DEFAULT_WEIGHTS,
+                 device: str = '',
+                 imgsz: int = 640,
+                 conf_thres: float = 0.25,
+                 iou_thres: float = 0.45,
+                 max_det: int = 1000,
+                 nms_topk: int = None,
+                 half: bool = False,
+                 dnn: bool = False,
+                 line_thickness: int = 3):
+
+        general = _yolov5['utils.general']
+
+        start_time = time.time()
+        self.device = _yolov5['utils.torch_utils'].select_device(device)
+        # The backend (PyTorch, TorchScript, ONNX Runtime, OpenVINO, TFLite, ...) follows from the weights format
+        self.model = _yolov5['models.common'].DetectMultiBackend(weights, device=self.device, dnn=dnn, fp16=half)
+
+        self._annotator, self._colors = Annotator, colors
+        self._preprocessor = _yolov5['utils.augmentations'].LetterboxPreprocessor
+        self._nms, self._scale_boxes = general.non_max_suppression, general.scale_boxes
+
+        self.weights = weights
+        self.model_name = self.model_version = None  # set by the model registry
+        self.weights_hash = weights_hash(weights) if os.path.exists(weights) else hashlib.sha256(weights.encode()).hexdigest()
+        self.stride, self.names, self.pt = self.model.stride, self.model.names, self.model.pt
+        self.imgsz = general.check_img_size([imgsz, imgsz] if isinstance(imgsz, int) else imgsz, s=self.stride)
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.max_det = max_det
+        self.nms_topk = nms_topk
+        self.line_thickness = line_thickness
+
+        # Cumulative NMS candidate counts per filter stage, see non_max_suppression(stats=...)
+        self.nms_stats = {}
+        self._nms_stats_lock = threading.Lock()
+
+        # Serializes forward passes; pre- and post-processing of concurrent invocations still run in parallel
+        self._forward_lock = threading.Lock()
+        self._local = threading.local()  # per-thread preprocessors, each owns its preallocated input tensors
+        self._profiling = True  # off while warming up, so the one-off warmup costs stay out of the stage histograms
+
+        self.warmup()
+        logging.info(f"YoloV5Engine loaded '{weights}' ({self.backend}) on {self.device} in {time.time() - start_time:.2f}s.")
+
+    @property
+    def backend(self) -> str:
+        backends = ('pt', 'jit', 'dnn', 'onnx', 'xml', 'engine', 'coreml', 'saved_model', 'pb', 'edgetpu', 'tflite',
+                    'paddle', 'triton')
+        return next((backend for backend in backends if getattr(self.model, backend, False)), 'unknown')
+
+    @property
+    def stage_labels(self) -> dict:
+        """
+        The model and backend labels of this engine's stage profiler series.
+        """
+        return {"model": f"{self.model_name}-{self.model_version}", "backend": self.backend}
+
+    def stage(self, name: str):
+        if not self._profiling:
+            return nullcontext()
+        return get_stage_profiler().stage(name, **self.stage_labels)
+
+    @property
+    def cache_signature(self) -> str:
+        """
+        Identifies everything besides the image that determines the detections: the weights and inference params.
+        """
+        signature = f"{self.weights_hash}|conf={self.conf_thres}|iou={self.iou_thres}|imgsz={self.imgsz}|max_det={self.max_det}"
+        return f"{signature}|topk={self.nms_topk}" if self.nms_topk else signature
+
+    def warmup(self):
+        """
+        Runs the backend warmup and one full dummy detection, so the first real request does not pay for lazy
+        initialization (cudnn autotuning, allocator growth, NMS kernels).
+        """
+        self._profiling = False
+        try:
+            self.model.warmup(imgsz=(1, 3, *self.imgsz))
+            self.detect(np.zeros((*self.imgsz, 3), dtype=np.uint8), annotate=False)
+        finally:
+            self._profiling = True
+
+    def preprocess(self, im0, auto: bool = None) -> torch.Tensor:
+        """
+        Letterboxes one BGR image, or a list of them, into a normalized (bs, 3, h, w) input tensor in a single fused
+        pass. The tensor is reused by the calling thread's next preprocess() call.
+        """
+        auto = self.pt if auto is None else auto  # minimum rectangle, only for single images on PyTorch
+        preprocessors = getattr(self._local, 'preprocessors', None)
+        if preprocessors is None:
+            preprocessors = self._local.preprocessors = {}
+        if auto not in preprocessors:
+            # Inputs come from the model's per-thread buffer pool, so backends read them in place
+            preprocessors[auto] = self._preprocessor(
+                self.imgsz, self.stride, auto=auto, device=self.model.device, half=self.model.fp16, pin_memory=True,
+                pool=self.model.io_pool, stages=self.stage)
+        return preprocessors[auto](im0)
+
+    @torch.inference_mode()
+    def forward(self, im: torch.Tensor):
+        # CUDA runs asynchronously, so on GPU the forward stage is mostly launch time and NMS waits for the rest
+        with self._forward_lock, self.stage('forward'):
+            if self.model.xml and im.shape[0] > 1:  # OpenVINO models are exported with a static batch size of 1
+                return torch.cat([self.model(x) for x in torch.chunk(im, im.shape[0], 0)])
+            return self.model(im)
+
+    @torch.inference_mode()
+    def postprocess(self, pred, im_shape, im0_shapes) -> list:
+        # One batched NMS call for the whole batch, without the per-image loop and its time limit
+        stats = {}
+        with self.stage('nms'):
+            pred = self._nms(pred, self.conf_thres, self.iou_thres, max_det=self.max_det, batched=True,
+                             topk=self.nms_topk, stats=stats)
+        with self._nms_stats_lock:
+            for k, n in stats.items():
+                self.nms_stats[k] = self.nms_stats.get(k, 0) + n
+        with self.stage('scale'):
+            for det, im0_shape in zip(pred, im0_shapes):
+                det[:, :4] = self._scale_boxes(im_shape, det[:, :4], im0_shape).round()
+            return [det.cpu().numpy() for det in pred]
+
+    def annotate(self, im0: np.ndarray, detections: np.ndarray) -> np.ndarray:
+        with self.stage('annotate'):
+            annotator = self._annotator(im0.copy(), line_width=self.line_thickness, example=str(self.names))
+            for *xyxy, conf, cls in reversed(detections):
+                c = int(cls)
+                annotator.box_label(xyxy, f"{self.names[c]} {conf:.2f}", color=self._colors(c, True))
+            return annotator.result()
+
+    @torch.inference_mode()
+    def detect(self, im0: np.ndarray, annotate: bool = True) -> YoloV5Detections:
+        """
+        Runs letterbox -> forward -> NMS -> scale_boxes on a single BGR image.
+
+        Parameters:
+        - im0 (np.ndarray): The source image in HWC BGR layout, as returned by cv2.imread.
+        - annotate (bool): Whether to render the detections onto a copy of the source image.
+
+        Returns:
+        - YoloV5Detections: The detections in source image coordinates.
+        """
+        timings = {}
+        start_time = time.time()
+        im = self.preprocess(im0)
+        timings['preprocess'] = time.time() - start_time
+
+        start_time = time.time()
+        pred = self.forward(im)
+        timings['inference'] = time.time() - start_time
+
+        start_time = time.time()
+        detections = self.postprocess(pred, im.shape[2:], [im0.shape])[0]
+        timings['nms'] = time.time() - start_time
+
+        result = YoloV5Detections(image_shape=im0.shape, detections=detections, names=self.names, timings=timings)
+        if annotate:
+            result.annotated_img = self.annotate(im0, detections)
+        return result
+
+    @torch.inference_mode()
+    def detect_batch(self, ims: list, annotate: bool = False) -> list:
+        """
+        Runs one forward pass and one NMS call for several BGR images, letterboxed to the common inference size.
+
+        Parameters:
+        - ims (list): The source images in HWC BGR layout.
+        - annotate (bool): Whether to render the detections onto copies of the source images.
+
+        Returns:
+        - list: One YoloV5Detections per image, in input order.
+        """
+        timings = {}
+        start_time = time.time()
+        im = self.preprocess(ims, auto=False)
+        timings['preprocess'] = time.time() - start_time
+
+        start_time = time.time()
+        pred = self.forward(im)
+        timings['inference'] = time.time() - start_time
+
+        start_time = time.time()
+        batch_detections = self.postprocess(pred, im.shape[2:], [im0.shape for im0 in ims])
+        timings['nms'] = time.time() - start_time
+
+        results = []
+        for im0, detections in zip(ims, batch_detections):
+            result = YoloV5Detections(im0.shape, detections, self.names, timings=dict(timings))
+            if annotate:
+                result.annotated_img = self.annotate(im0, detections)
+            results.append(result)
+        return results
+
+    @staticmethod
+    def read_image(source_path: str) -> np.ndarray:
+        im0 = cv2.imread(source_path)  # BGR
+        if im0 is None:
+            raise FileNotFoundError(f"Image '{source_path}' could not be read.")
+        return im0
+
+    def detect_file(self, source_path: str, annotate: bool = True) -> YoloV5Detections:
+        return self.detect(self.read_image(source_path), annotate=annotate)
+
+
+def engine_settings_from_env() -> dict:
+    """
+    Returns the inference settings shared by every model, read from the app settings.
+    """
+    return {
+        "device": os.environ.get("YoloV5Device", ''),
+        "imgsz": int(os.environ.get("YoloV5ImgSize", 640)),
+        "conf_thres": float(os.environ.get("YoloV5ConfThres", 0.25)),
+        "iou_thres": float(os.environ.get("YoloV5IouThres", 0.45)),
+        "max_det": int(os.environ.get("YoloV5MaxDet", 1000)),
+        "nms_topk": int(os.environ["YoloV5NmsTopK"]) if os.environ.get("YoloV5NmsTopK") else None
+    }
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from detectors.yolov_batcher import retire_yolov_batcher
+from detectors.yolov_engine import DEFAULT_WEIGHTS, YOLOV5_ROOT, YoloV5Engine, engine_settings_from_env
+
+DEFAULT_MODEL_NAME = "default"
+DEFAULT_MODEL_VERSION = "1"
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    version: str
+    weights: str
+    options: dict = field(default_factory=dict)  # YoloV5Engine overrides, e.g. device, dnn, half, imgsz
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.name, self.version
+
+    def weights_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.weights)
+        except OSError:
+            return None
+
+
+def _version_sort_key(version: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', version)]
+
+
+def load_model_specs_from_env() -> list:
+    """
+    Reads the served models from the YoloV5Models app setting, a JSON object of name -> version -> weights, where
+    weights is a path (relative to the yolov5 directory) or an object with 'weights' plus YoloV5Engine options:
+
+        {"road-signs": {"1": "runs/train/yolov-202405-last.pt",
+                        "2": {"weights": "runs/train/yolov-202405-last.onnx", "device": "cpu"}}}
+
+    Without the setting a single 'default' model is served from YoloV5Weights.
+    """
+    models_json = os.environ.get("YoloV5Models")
+    if not models_json:
+        return [ModelSpec(DEFAULT_MODEL_NAME, DEFAULT_MODEL_VERSION, os.environ.get("YoloV5Weights", DEFAULT_WEIGHTS))]
+
+    specs = []
+    for name, versions in json.loads(models_json).items():
+        for version, config in versions.items():
+            options = dict(config) if isinstance(config, dict) else {"weights": config}
+            weights = options.pop("weights")
+            specs.append(ModelSpec(name, str(version), os.path.join(YOLOV5_ROOT, weights), options))
+    return specs
+
+
+class YoloV5ModelRegistry:
+    """
+    Keeps several YOLOv5 models resident, addressed by name and version, each loaded with the backend its weights
+    format selects (e.g. ONNX Runtime or OpenVINO on CPU-only hosts).
+
+    Swapping is done by reference: a new engine is fully loaded and warmed up before it replaces the old one, and
+    requests already holding the old engine finish on it. Weights replaced on disk are picked up by refresh().
+    """
+
+    def __init__(self, specs: list, default_name: str = None, refresh_interval: float = 30):
+        self._specs: Dict[Tuple[str, str], ModelSpec] = {spec.key: spec for spec in specs}
+        self._engines: Dict[Tuple[str, str], YoloV5Engine] = {}
+        self._loaded_mtimes: Dict[Tuple[str, str], Optional[float]] = {}
+        self._default_versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._reloading = set()
+        self.default_name = default_name or specs[0].name
+        self.refresh_interval = refresh_interval
+        self._last_refresh = time.time()
+
+    def resolve(self, name: str = None, version: str = None) -> Tuple[str, str]:
+        name = name or self.default_name
+        with self._lock:
+            versions = [v for n, v in self._specs if n == name]
+            if not versions:
+                raise KeyError(f"Model '{name}' is not registered.")
+            if version is None:
+                version = self._default_versions.get(name) or max(versions, key=_version_sort_key)
+            elif str(version) not in versions:
+                raise KeyError(f"Model '{name}' has no version '{version}'.")
+        return name, str(version)
+
+    def get(self, name: str = None, version: str = None) -> YoloV5Engine:
+        """
+        Returns the resident engine for a model version (the default version when none is given), loading it on first
+        use.
+        """
+        self._maybe_refresh()
+        key = self.resolve(name, version)
+
+        engine = self._engines.get(key)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            engine = self._engines.get(key)
+            if engine is None:
+                engine = self._load(self._specs[key])
+        return engine
+
+    def register(self, spec: ModelSpec, make_default: bool = False) -> YoloV5Engine:
+        """
+        Loads a model version and swaps it in. If the version was already resident, its previous engine keeps serving
+        in-flight requests until they complete.
+        """
+        with self._lock:
+            self._specs[spec.key] = spec
+        engine = self._load(spec)
+        if make_default:
+            self.promote(spec.name, spec.version)
+        return engine
+
+    def promote(self, name: str, version: str):
+        """
+        Makes a version the one served to requests that do not ask for a specific version.
+        """
+        name, version = self.resolve(name, version)
+        with self._lock:
+            self._default_versions[name] = version
+        logging.info(f"YoloV5ModelRegistry now serves '{name}' version '{version}' by default.")
+
+    def unload(self, name: str, version: str):
+        with self._lock:
+            engine = self._engines.pop((name, str(version)), None)
+            self._loaded_mtimes.pop((name, str(version)), None)
+        if engine is not None:
+            retire_yolov_batcher(engine)
+
+    def models(self) -> list:
+        with self._lock:
+            return [{
+                "modelName": name,
+                "modelVersion": version,
+                "weights": spec.weights,
+                "loaded": (name, version) in self._engines,
+                "backend": self._engines[(name, version)].backend if (name, version) in self._engines else None,
+                "isDefault": self._default_versions.get(name) == version
+            } for (name, version), spec in self._specs.items()]
+
+    def refresh(self):
+        """
+        Reloads, in the background, every resident model whose weights file changed on disk since it was loaded.
+        """
+        with self._lock:
+            stale = [self._specs[key] for key, mtime in self._loaded_mtimes.items()
+                     if key not in self._reloading and self._specs[key].weights_mtime() != mtime]
+            self._reloading.update(spec.key for spec in stale)
+
+        for spec in stale:
+            threading.Thread(target=self._reload, args=(spec,), name=f"yolov5-reload-{spec.name}", daemon=True).start()
+
+    def _maybe_refresh(self):
+        if self.refresh_interval and time.time() - self._last_refresh > self.refresh_interval:
+            self._last_refresh = time.time()
+            self.refresh()
+
+    def _reload(self, spec: ModelSpec):
+        try:
+            logging.info(f"YoloV5ModelRegistry reloading '{spec.name}' version '{spec.version}' from '{spec.weights}'.")
+            self._load(spec)
+        except Exception as ex:
+            logging.error(f"YoloV5ModelRegistry failed to reload '{spec.name}' version '{spec.version}': {ex}")
+        finally:
+            with self._lock:
+                self._reloading.discard(spec.key)
+
+    def _load(self, spec: ModelSpec) -> YoloV5Engine:
+        mtime = spec.weights_mtime()
+        engine = YoloV5Engine(weights=spec.weights, **{**engine_settings_from_env(), **spec.options})
+        engine.model_name, engine.model_version = spec.name, spec.version
+        with self._lock:
+            previous = self._engines.get(spec.key)
+            self._engines[spec.key] = engine  # atomic swap, the previous engine is released by its last user
+            self._loaded_mtimes[spec.key] = mtime
+        if previous is not None:
+            retire_yolov_batcher(previous)
+        return engine
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> YoloV5ModelRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = YoloV5ModelRegistry(
+                    load_model_specs_from_env(),
+                    default_name=os.environ.get("YoloV5DefaultModel"),
+                    refresh_interval=float(os.environ.get("YoloV5ModelRefreshSeconds", 30)))
+    return _registry
+
+
+def get_yolov_engine(model_name: str = None, model_version: str = None) -> YoloV5Engine:
+    """
+    Returns the worker-wide engine for a model version, loading it on first use.
+    """
+    return get_model_registry().get(model_name, model_version)
@@ -0,0 +1,123 @@
+import math
+import os
+import time
+
+import cv2
+
+from detectors.yolov_model_registry import get_yolov_engine
+from models import DetectionSet
+
+
+def read_video_info(video_path: str) -> dict:
+    """
+    Reads the stream properties of a video from its container header, without decoding frames. The frame count is the
+    container's estimate.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"The video '{os.path.basename(video_path)}' could not be opened.")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return {
+            "fps": fps if fps and math.isfinite(fps) else 30.0,  # 30 FPS fallback, as in LoadStreams
+            "frameCount": max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        }
+    finally:
+        cap.release()
+
+
+def iter_video_frames(video_path: str, start_frame: int = 0, end_frame: int = None, vid_stride: int = 1):
+    """
+    Seeks to start_frame and yields (frame index, BGR frame) for every vid_stride-th frame before end_frame, or up to
+    the end of the video when end_frame is None. Skipped frames are only grabbed, not decoded.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            raise ValueError(f"The video '{os.path.basename(video_path)}' could not be opened.")
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        frame_index = start_frame
+        while end_frame is None or frame_index < end_frame:
+            if (frame_index - start_frame) % vid_stride:
+                if not cap.grab():
+                    break
+            else:
+                success, frame = cap.read()
+                if not success:
+                    break
+                yield frame_index, frame
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+def run_yolov_video_chunk(
+        video_path,
+        start_frame=0,
+        end_frame=None,
+        vid_stride=1,
+        model_name=None,
+        model_version=None,
+        render_path=None,
+        batch_size=8
+        ) -> dict:
+    """
+    Detects objects in one frame range of a video, batch_size frames per forward pass. Frames with detections are
+    returned time-indexed; when render_path is given the annotated frames are also written there as an mp4 segment
+    at the sampled frame rate.
+
+    Returns:
+    - dict: The chunk result (startFrame, endFrame, framesProcessed, frames, timeTaken, errors, hasErrors).
+    """
+    start_time = time.time()
+    engine = get_yolov_engine(model_name, model_version)
+    video_info = read_video_info(video_path)
+    fps = video_info["fps"]
+
+    writer = None
+    if render_path:
+        writer = cv2.VideoWriter(render_path, cv2.VideoWriter_fourcc(*"mp4v"), fps / vid_stride,
+                                 (video_info["width"], video_info["height"]))
+
+    frames, frames_processed, last_frame = [], 0, start_frame - 1
+
+    def process(batch):
+        results = engine.detect_batch([im0 for _, im0 in batch], annotate=writer is not None)
+        for (frame_index, _), result in zip(batch, results):
+            if len(result.detections):
+                frames.append({
+                    "frame": frame_index,
+                    "time": round(frame_index / fps, 3),
+                    "detections": DetectionSet(result.detections, result.names).to_json_dict()
+                })
+            if writer is not None:
+                writer.write(result.annotated_img)
+
+    try:
+        batch = []
+        for frame_index, im0 in iter_video_frames(video_path, start_frame, end_frame, vid_stride):
+            batch.append((frame_index, im0))
+            frames_processed += 1
+            last_frame = frame_index
+            if len(batch) == batch_size:
+                process(batch)
+                batch = []
+        if batch:
+            process(batch)
+    finally:
+        if writer is not None:
+            writer.release()
+
+    return {
+        "startFrame": start_frame,
+        "endFrame": last_frame + 1,
+        "framesProcessed": frames_processed,
+        "frames": frames,
+        "timeTaken": time.time() - start_time,
+        "errors": None,
+        "hasErrors": False
+    }
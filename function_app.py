@@ -1,19 +1,26 @@
 ## conda activate torch-conda
 #  func start --port 7071
 
+import hashlib
 import json
 import logging
 import os
+import shutil
+import tempfile
+import threading
+import time
 
 import azure.durable_functions as df
 import azure.functions as func
 
-from managers import AzureBlobManager, AzureTableStorageManager
-from models import BlobToProcessQueueMessage, VisioDetectorHttpRequest, ImagePredictionResult
+from managers import AzureBlobManager, AzureTableStorageManager, DetectionResultCache, content_key_from_bytes
+from models import BlobToProcessQueueMessage, VisioDetectorHttpRequest, ImagePredictionResult, VisioDetectorBatchHttpRequest, BatchPredictionResult
+from models import VisioDetectorVideoHttpRequest, VideoPredictionResult
 from models.enums import BlobProcessStatus, DetectorType
-from detectors import run_yolov_detector
+from detectors import run_yolov_detector, get_yolov_engine, read_video_info, run_yolov_video_chunk
 from visio_detector import VisioDetector
-from utils import get_child_directory_path, configure_logging
+from utils import get_child_directory_path, configure_logging, decode_image, is_video_file, build_detection_result_name
+from utils import get_stage_profiler
 
 configure_logging('sys-logs')
 
@@ -28,6 +35,31 @@ table_storage_name = os.environ.get("TableStorageName")
 table_connection_string = os.environ.get("TableConnectionString")
 azure_table_storage_manager = AzureTableStorageManager(table_connection_string, table_storage_name)
 
+blob_download_concurrency = int(os.environ.get("BlobDownloadConcurrency", 4))
+max_image_bytes = int(os.environ.get("MaxImageBytes", 64 * 1024 * 1024))
+max_image_pixels = int(os.environ.get("MaxImagePixels", 50_000_000))
+
+# Batch chunk activities are retried on failure (e.g. a recycled worker) before their images are reported as failed
+chunk_retry_options = df.RetryOptions(int(os.environ.get("ChunkRetryIntervalMs", 5000)), int(os.environ.get("ChunkRetryAttempts", 3)))
+
+# Result images are encoded in memory: jpg, png or webp (empty keeps the source format), or none for boxes only
+result_image_format = os.environ.get("ResultImageFormat") or None
+result_image_quality = int(os.environ.get("ResultImageQuality", 95))
+result_image_max_dimension = int(os.environ.get("ResultImageMaxDimension", 0))
+# Cached results point at images encoded with these settings, non-default settings get their own cache entries
+result_image_signature = ("" if (result_image_format, result_image_quality, result_image_max_dimension) == (None, 95, 0)
+                          else f"|img={result_image_format},{result_image_quality},{result_image_max_dimension}")
+
+# Video chunks run batched through the engine; downloaded videos are shared by the chunk activities on a worker
+video_batch_size = int(os.environ.get("VideoBatchSize", 8))
+video_cache_dir = os.environ.get("VideoCacheDir") or os.path.join(tempfile.gettempdir(), "visio-videos")
+video_cache_seconds = int(os.environ.get("VideoCacheSeconds", 3600))
+video_download_locks = {}
+video_download_locks_lock = threading.Lock()
+
+result_cache_enabled = os.environ.get("ResultCacheEnabled", "true").lower() == "true"
+result_cache = DetectionResultCache(azure_table_storage_manager, int(os.environ.get("ResultCacheSize", 1024)))
+
 def delete_file_if_exists(file_path):
     if os.path.exists(file_path):
         os.remove(file_path)
@@ -35,6 +67,43 @@ def delete_file_if_exists(file_path):
     else:
         print(f"File '{file_path}' does not exist.")
 
+def get_local_video(file_name) -> str:
+    """
+    Downloads a video blob into the worker's video cache, once per content version, and returns its local path.
+    OpenCV can only seek in files, and the chunk activities of one video landing on the same worker share the copy.
+    """
+    content_key = azure_blob_manager.get_blob_content_key(file_name)
+    video_dir = os.path.join(video_cache_dir, hashlib.sha256(content_key.encode()).hexdigest()[:32])
+    video_path = os.path.join(video_dir, os.path.basename(file_name))
+
+    with video_download_locks_lock:
+        download_lock = video_download_locks.setdefault(video_dir, threading.Lock())
+    with download_lock:
+        if os.path.exists(video_path):
+            os.utime(video_dir)  # keep it cached while in use
+            return video_path
+
+        evict_cached_videos()
+        os.makedirs(video_dir, exist_ok=True)
+        download_fd, download_path = tempfile.mkstemp(dir=video_dir, suffix=".part")
+        try:
+            with os.fdopen(download_fd, "wb") as download_file:
+                for chunk in azure_blob_manager.iter_blob_chunks(file_name):
+                    download_file.write(chunk)
+            os.replace(download_path, video_path)  # never expose a partial download
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+    logging.info(f"Downloaded the video '{file_name}' to '{video_path}'.")
+    return video_path
+
+def evict_cached_videos():
+    if not os.path.isdir(video_cache_dir):
+        return
+    for entry in os.scandir(video_cache_dir):
+        if entry.is_dir() and time.time() - entry.stat().st_mtime > video_cache_seconds:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
 # We can provide a key, and use function level: https://learn.microsoft.com/en-us/azure/azure-functions/functions-bindings-http-webhook-trigger?tabs=python-v2%2Cisolated-process%2Cnodejs-v4%2Cfunctionsv2&pivots=programming-language-python
 app = df.DFApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
@@ -83,6 +152,25 @@ async def http_start(req: func.HttpRequest, client: df.DurableOrchestrationClien
             status_code=500
         )
 
+@app.function_name(name="MetricsHttpTrigger")
+@app.route(route="metrics", methods=("GET",))
+def http_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Exposes the stage latency histograms and micro-batch fill of this worker process in the Prometheus text format,
+    or as JSON summaries with ?format=json. Every worker process keeps its own metrics, so scrape each instance.
+    """
+    stage_profiler = get_stage_profiler()
+    if req.params.get("format") == "json":
+        return func.HttpResponse(
+            json.dumps({"stages": stage_profiler.snapshot(), "batches": stage_profiler.batch_snapshot()}),
+            status_code=200,
+            mimetype="application/json")
+    return func.HttpResponse(
+        body=stage_profiler.to_prometheus(),
+        status_code=200,
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
 @app.orchestration_trigger(context_name="context")
 def image_detection_orchestrator(context: df.DurableOrchestrationContext):
     visio_detector_req_str = context.get_input()
@@ -93,7 +181,14 @@ def image_detection_orchestrator(context: df.DurableOrchestrationContext):
         visio_detector_req = VisioDetectorHttpRequest.from_json(visio_detector_json)
         logging.info(f"image_detection_orchestrator.detector_type: {visio_detector_req.detector_type}")
 
-        if visio_detector_req.detector_type == DetectorType.YoloV5:
+        if visio_detector_req.detector_type == DetectorType.YoloV5 and is_video_file(visio_detector_req.file_name):
+            video_req = VisioDetectorVideoHttpRequest(
+                detector_type=visio_detector_req.detector_type,
+                file_name=visio_detector_req.file_name,
+                model_name=visio_detector_req.model_name,
+                model_version=visio_detector_req.model_version)
+            result = yield context.call_sub_orchestrator("video_detection_orchestrator", video_req.to_json_string())
+        elif visio_detector_req.detector_type == DetectorType.YoloV5:
             result = yield context.call_activity("run_yolov_detection_activity", visio_detector_req_str)
         else:
             result = ImagePredictionResult(
@@ -118,23 +213,68 @@ def image_detection_orchestrator(context: df.DurableOrchestrationContext):
 @app.activity_trigger(input_name="visioDetectorReqStr")
 def run_yolov_detection_activity(visioDetectorReqStr: str) -> str:
     visioDetectorModel = VisioDetectorHttpRequest.from_json(json.loads(visioDetectorReqStr))
+    return run_yolov_detection(visioDetectorModel).to_json()
+
 
+def run_yolov_detection(visioDetectorModel: VisioDetectorHttpRequest, blob_content=None) -> ImagePredictionResult:
     logging.info(f"Running YOLOv5 detection for: {visioDetectorModel.file_name}")
 
     try:
         logging.info(f"Detector Type: {visioDetectorModel.detector_type}")
 
-        file_download_dir = get_child_directory_path('image_set/yolov5')
-        downloaded_file_path = azure_blob_manager.download_and_upload_file(visioDetectorModel.file_name, file_download_dir)
+        if isinstance(blob_content, Exception):  # prefetch failed
+            raise blob_content
 
-        yolov5_precition_result = VisioDetector.run_yolov_detector_wrapper(visioDetectorModel.file_name, downloaded_file_path)
+        # Identical content already detected with the same weights and params is served from the cache
+        content_keys = []
+        blob_properties = None
+        engine = get_yolov_engine(visioDetectorModel.model_name, visioDetectorModel.model_version)
+        if result_cache_enabled:
+            cache_signature = engine.cache_signature + result_image_signature
+            result_cache.bind_weights(engine.weights_hash, f"{engine.model_name}-{engine.model_version}")
+            if blob_content is None:
+                # Fetched once: the download below reuses these properties, pinned to their ETag
+                blob_properties = azure_blob_manager.get_blob_properties(visioDetectorModel.file_name)
+                content_keys.append(azure_blob_manager.get_blob_content_key(visioDetectorModel.file_name, blob_properties))
+            else:
+                content_keys.append(content_key_from_bytes(blob_content))
+            cached_result = result_cache.get(content_keys[0], cache_signature)
+            if cached_result is not None:
+                logging.info(f"run_yolov_detection_activity cache hit for: {visioDetectorModel.file_name}")
+                cached_result["imageName"] = visioDetectorModel.file_name
+                return ImagePredictionResult.from_json_dict(cached_result)
 
-        predictions_azure_blob_manager.upload_file_to_blob(yolov5_precition_result.result_img_path, yolov5_precition_result.result_img_name)
+        # Blob bytes are decoded in memory and handed to the detector, nothing is written to disk
+        if blob_content is None:
+            with engine.stage("download"):
+                blob_content = azure_blob_manager.download_blob_to_buffer(visioDetectorModel.file_name, blob_download_concurrency, max_image_bytes, blob_properties)
+            if result_cache_enabled and not content_keys[0].startswith("md5:"):
+                # The ETag only matches retries of the same blob, the content hash also matches duplicate uploads
+                content_keys.append(content_key_from_bytes(blob_content))
+                cached_result = result_cache.get(content_keys[-1], cache_signature)
+                if cached_result is not None:
+                    result_cache.put(content_keys[0], cache_signature, cached_result)
+                    cached_result["imageName"] = visioDetectorModel.file_name
+                    return ImagePredictionResult.from_json_dict(cached_result)
+        with engine.stage("decode"):
+            im0, scale = decode_image(blob_content, max_image_pixels)
+        del blob_content
+
+        # Boxes come back in the source image's pixels, also when it was decoded at reduced size
+        yolov5_precition_result, encoded_img = VisioDetector.run_yolov_engine_wrapper(
+            visioDetectorModel.file_name, im0, visioDetectorModel.model_name, visioDetectorModel.model_version,
+            result_image_format, result_image_quality, result_image_max_dimension, scale)
+
+        if encoded_img is not None:
+            img_bytes, content_type = encoded_img
+            with engine.stage("upload"):
+                predictions_azure_blob_manager.upload_bytes_to_blob(img_bytes, yolov5_precition_result.result_img_name, content_type)
 
         logging.info(f"run_yolov_detection_activity.Result: {yolov5_precition_result}")
 
-        # delete_file_if_exists(downloaded_file_path)
-        return yolov5_precition_result.to_json()
+        for content_key in content_keys:
+            result_cache.put(content_key, cache_signature, yolov5_precition_result.to_json_dict())
+        return yolov5_precition_result
 
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
@@ -143,4 +283,233 @@ def run_yolov_detection_activity(visioDetectorReqStr: str) -> str:
             detector_type=visioDetectorModel.detector_type,
             errors= str(e),
             has_errors=True
-            ).to_json()
\ No newline at end of file
+            )
+
+
+@app.function_name(name="BatchObjectDetectionHttpTrigger")
+@app.route(route="yolov/detect/batch", methods=("POST",))
+@app.durable_client_input(client_name="client")
+async def http_start_batch(req: func.HttpRequest, client: df.DurableOrchestrationClient):
+    try:
+        req_body = req.get_body().decode('utf-8')
+        logging.info(f"Started BatchObjectDetectionHttpTrigger, received: {req_body}")
+
+        # Validate the request before starting the orchestration
+        VisioDetectorBatchHttpRequest.from_json(json.loads(req_body))
+
+        instance_id = await client.start_new("batch_image_detection_orchestrator", client_input=req_body)
+        logging.info(f"Started batch orchestration with ID = '{instance_id}'.")
+
+        # Backfills can take hours, so return the status endpoints instead of blocking on completion
+        return client.create_check_status_response(req, instance_id)
+    except (KeyError, ValueError) as e:
+        logging.error(f"Invalid request in http_start_batch: {str(e)}")
+        return func.HttpResponse(
+            f"Invalid request: {str(e)}",
+            status_code=400
+        )
+    except Exception as e:
+        logging.error(f"Error in http_start_batch: {str(e)}")
+        return func.HttpResponse(
+            f"An error occurred: {str(e)}",
+            status_code=500
+        )
+
+@app.orchestration_trigger(context_name="context")
+def batch_image_detection_orchestrator(context: df.DurableOrchestrationContext):
+    batch_req_json = json.loads(context.get_input())
+    batch_req = VisioDetectorBatchHttpRequest.from_json(batch_req_json)
+    batch_result = BatchPredictionResult(detector_type=batch_req.detector_type)
+
+    try:
+        if batch_req.detector_type != DetectorType.YoloV5:
+            raise ValueError("The detector type is incorrect")
+
+        if batch_req.prefix:
+            blob_names = yield context.call_activity("list_blob_names_activity", batch_req.prefix)
+            batch_req.file_names = list(dict.fromkeys(batch_req.file_names + json.loads(blob_names)))
+
+        chunks = batch_req.chunks()
+        logging.info(f"batch_image_detection_orchestrator: {len(batch_req.file_names)} images in {len(chunks)} chunks.")
+
+        # Sliding window: the next chunk starts as soon as any running one finishes, so at most max_concurrency chunk
+        # activities run at once and one slow chunk does not hold back the others
+        max_concurrency = max(1, batch_req.max_concurrency)
+        chunk_results = [None] * len(chunks)
+        running = {}
+        next_chunk = 0
+        while next_chunk < len(chunks) or running:
+            while next_chunk < len(chunks) and len(running) < max_concurrency:
+                task = context.call_activity_with_retry(
+                    "run_yolov_batch_detection_activity",
+                    chunk_retry_options,
+                    VisioDetectorBatchHttpRequest(
+                        detector_type=batch_req.detector_type,
+                        file_names=chunks[next_chunk],
+                        model_name=batch_req.model_name,
+                        model_version=batch_req.model_version).to_json_string())
+                running[task] = next_chunk
+                next_chunk += 1
+
+            finished = yield context.task_any(list(running))
+            i = running.pop(finished)
+            if isinstance(finished.result, Exception):
+                # Out of retries: every image of the chunk gets an error result and the other chunks carry on
+                logging.error(f"batch_image_detection_orchestrator: chunk {i} failed: {finished.result}")
+                chunk_results[i] = [ImagePredictionResult(
+                    image_name=file_name,
+                    detector_type=batch_req.detector_type,
+                    errors=str(finished.result),
+                    has_errors=True
+                    ).to_json_dict() for file_name in chunks[i]]
+            else:
+                chunk_results[i] = json.loads(finished.result)
+
+        for results in chunk_results:  # in chunk order, whichever order the chunks finished in
+            batch_result.results.extend(results)
+
+        logging.info(f"batch_image_detection_orchestrator.result: {batch_result}")
+    except Exception as ex:
+        logging.error(f"An unexpected error occurred: {ex}")
+        batch_result.errors = str(ex)
+        batch_result.has_errors = True
+
+    return batch_result.to_json()
+
+
+@app.activity_trigger(input_name="prefix")
+def list_blob_names_activity(prefix: str) -> str:
+    return json.dumps(azure_blob_manager.list_blob_names(prefix))
+
+
+@app.activity_trigger(input_name="batchReqStr")
+def run_yolov_batch_detection_activity(batchReqStr: str) -> str:
+    batch_req = VisioDetectorBatchHttpRequest.from_json(json.loads(batchReqStr))
+
+    # Download the whole chunk concurrently over the pooled connections, then detect image by image
+    blob_contents = azure_blob_manager.download_blobs(batch_req.file_names, blob_download_concurrency * 4, max_image_bytes)
+
+    # Every image gets its own result, so one bad blob never fails the whole chunk
+    results = [
+        run_yolov_detection(
+            VisioDetectorHttpRequest(
+                file_name=file_name,
+                source_blob_uri=None,
+                detector_type=batch_req.detector_type,
+                model_name=batch_req.model_name,
+                model_version=batch_req.model_version),
+            blob_contents.get(file_name))
+        for file_name in batch_req.file_names]
+    return json.dumps([result.to_json_dict() for result in results])
+
+
+@app.function_name(name="VideoObjectDetectionHttpTrigger")
+@app.route(route="yolov/detect/video", methods=("POST",))
+@app.durable_client_input(client_name="client")
+async def http_start_video(req: func.HttpRequest, client: df.DurableOrchestrationClient):
+    try:
+        req_body = req.get_body().decode('utf-8')
+        logging.info(f"Started VideoObjectDetectionHttpTrigger, received: {req_body}")
+
+        # Validate the request before starting the orchestration
+        VisioDetectorVideoHttpRequest.from_json(json.loads(req_body))
+
+        instance_id = await client.start_new("video_detection_orchestrator", client_input=req_body)
+        logging.info(f"Started video orchestration with ID = '{instance_id}'.")
+
+        # Long videos take a while even split into chunks, so return the status endpoints
+        return client.create_check_status_response(req, instance_id)
+    except (KeyError, ValueError) as e:
+        logging.error(f"Invalid request in http_start_video: {str(e)}")
+        return func.HttpResponse(
+            f"Invalid request: {str(e)}",
+            status_code=400
+        )
+    except Exception as e:
+        logging.error(f"Error in http_start_video: {str(e)}")
+        return func.HttpResponse(
+            f"An error occurred: {str(e)}",
+            status_code=500
+        )
+
+@app.orchestration_trigger(context_name="context")
+def video_detection_orchestrator(context: df.DurableOrchestrationContext):
+    video_req = VisioDetectorVideoHttpRequest.from_json(json.loads(context.get_input()))
+    video_result = VideoPredictionResult(
+        video_name=video_req.file_name,
+        detector_type=video_req.detector_type,
+        vid_stride=video_req.vid_stride)
+
+    try:
+        if video_req.detector_type != DetectorType.YoloV5:
+            raise ValueError("The detector type is incorrect")
+
+        video_info = yield context.call_activity("probe_video_activity", video_req.to_json_string())
+        video_result.set_video_info(json.loads(video_info))
+
+        chunks = video_req.chunks(video_result.frame_count)
+        logging.info(f"video_detection_orchestrator: {video_result.frame_count} frames in {len(chunks)} chunks.")
+
+        # Chunks seek to their own frame range, so a long video takes about as long as its slowest chunk
+        max_concurrency = max(1, video_req.max_concurrency)
+        for i in range(0, len(chunks), max_concurrency):
+            tasks = [
+                context.call_activity("run_yolov_video_chunk_activity", video_req.chunk(start_frame, end_frame).to_json_string())
+                for start_frame, end_frame in chunks[i:i + max_concurrency]]
+            chunk_results = yield context.task_all(tasks)
+            for chunk_result in chunk_results:
+                video_result.add_chunk(json.loads(chunk_result))
+
+        logging.info(f"video_detection_orchestrator.result: {video_result}")
+    except Exception as ex:
+        logging.error(f"An unexpected error occurred: {ex}")
+        video_result.errors = str(ex)
+        video_result.has_errors = True
+
+    return video_result.to_json()
+
+
+@app.activity_trigger(input_name="videoReqStr")
+def probe_video_activity(videoReqStr: str) -> str:
+    video_req = VisioDetectorVideoHttpRequest.from_json(json.loads(videoReqStr))
+    return json.dumps(read_video_info(get_local_video(video_req.file_name)))
+
+
+@app.activity_trigger(input_name="videoChunkReqStr")
+def run_yolov_video_chunk_activity(videoChunkReqStr: str) -> str:
+    video_req = VisioDetectorVideoHttpRequest.from_json(json.loads(videoChunkReqStr))
+    logging.info(f"Running YOLOv5 video detection for: {video_req.file_name} frames {video_req.start_frame}-{video_req.end_frame}")
+
+    render_path = None
+    try:
+        video_path = get_local_video(video_req.file_name)
+        if video_req.render_video:
+            render_fd, render_path = tempfile.mkstemp(suffix=".mp4")
+            os.close(render_fd)
+
+        chunk_result = run_yolov_video_chunk(
+            video_path, video_req.start_frame, video_req.end_frame, video_req.vid_stride,
+            video_req.model_name, video_req.model_version, render_path, video_batch_size)
+
+        if render_path:
+            # Each chunk renders its own segment, listed in frame order in the video result
+            stem = os.path.splitext(video_req.file_name)[0]
+            result_video_name = build_detection_result_name(f"{stem}_{video_req.start_frame:08d}.mp4", DetectorType.YoloV5)
+            with open(render_path, "rb") as render_file:
+                predictions_azure_blob_manager.upload_bytes_to_blob(render_file.read(), result_video_name, "video/mp4")
+            chunk_result["resultVideoName"] = result_video_name
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+        chunk_result = {
+            "startFrame": video_req.start_frame,
+            "endFrame": video_req.end_frame,
+            "framesProcessed": 0,
+            "frames": [],
+            "errors": str(e),
+            "hasErrors": True
+        }
+    finally:
+        if render_path:
+            delete_file_if_exists(render_path)
+
+    return json.dumps(chunk_result)
\ No newline at end of file
@@ -1,2 +1,6 @@
 from .azure_blob_manager import AzureBlobManager
-from .azure_table_storage_manager import ProcessedBlobModel, AzureTableStorageManager
\ No newline at end of file
+from .azure_table_storage_manager import ProcessedBlobModel, AzureTableStorageManager
+from .azure_blob_manager_async import AsyncAzureBlobManager
+from .azure_table_storage_manager_async import AsyncAzureTableStorageManager
+from .azure_async_helpers import run_sync, get_pooled_transport
+from .detection_result_cache import DetectionResultCache, content_key_from_bytes
\ No newline at end of file
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+
+import aiohttp
+from azure.core.pipeline.transport import AioHttpTransport
+
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("StorageMaxConnections", 64))
+
+_loop = None
+_loop_lock = threading.Lock()
+_sessions = {}
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the worker-wide event loop that runs storage I/O for synchronous callers, starting it on first use.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="azure-storage-io", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro):
+    """
+    Runs a coroutine on the background storage loop and blocks until it completes. Lets synchronous code (activities,
+    the sync managers) share the async clients and their connection pool.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result()
+
+
+def get_pooled_transport(max_connections: int = DEFAULT_MAX_CONNECTIONS) -> AioHttpTransport:
+    """
+    Returns an azure-core transport backed by the aiohttp session shared by every storage client on the running
+    loop, so blob and table clients reuse the same keep-alive connections. Must be called from within the loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=max_connections)
+        session = _sessions[loop] = aiohttp.ClientSession(connector=connector)
+    return AioHttpTransport(session=session, session_owner=False)
+
+
+async def gather_limited(coros, max_concurrency: int) -> list:
+    """
+    Awaits the coroutines with at most max_concurrency in flight. Exceptions are returned in place of results, so one
+    failed blob does not cancel the rest.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(coro) for coro in coros), return_exceptions=True)
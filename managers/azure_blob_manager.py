@@ -2,15 +2,20 @@
 
 import logging
 import os
-from azure.storage.blob import BlobServiceClient
+from azure.storage.blob import BlobServiceClient, ContentSettings
 from azure.core.exceptions import ResourceNotFoundError, AzureError
 
+from .azure_async_helpers import DEFAULT_MAX_CONNECTIONS, run_sync
+from .azure_blob_manager_async import AsyncAzureBlobManager
+
 class AzureBlobManager:
-    def __init__(self, connection_string, container_name):
+    def __init__(self, connection_string, container_name, max_connections=DEFAULT_MAX_CONNECTIONS):
         self.connection_string = connection_string
         self.container_name = container_name
         self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
         self.container_client = self.blob_service_client.get_container_client(container_name)
+        # Data transfers run on the shared async clients, so they scale with I/O concurrency rather than threads
+        self.async_manager = AsyncAzureBlobManager(connection_string, container_name, max_connections)
 
     def upload_file(self, file_path):
         blob_name = os.path.basename(file_path)
@@ -29,41 +34,68 @@ class AzureBlobManager:
         for blob in blob_list:
             print(blob.name)
 
+    def list_blob_names(self, prefix=None) -> list:
+        return [blob.name for blob in self.container_client.list_blobs(name_starts_with=prefix)]
+
+    def get_blob_properties(self, file_name):
+        return self.blob_service_client.get_blob_client(container=self.container_name, blob=file_name).get_blob_properties()
+
+    def get_blob_content_key(self, file_name, properties=None) -> str:
+        """
+        Returns a key identifying the blob content: its Content-MD5 when the service has one (identical uploads under
+        different names share it), otherwise the container/name@ETag (stable until the blob is overwritten).
+        Already fetched blob properties can be passed in to save the request.
+        """
+        if properties is None:
+            properties = self.get_blob_properties(file_name)
+        content_md5 = properties.content_settings.content_md5
+        if content_md5:
+            return f"md5:{bytes(content_md5).hex()}"
+        return f"etag:{self.container_name}/{file_name}@{properties.etag.strip(chr(34))}"
+
     def delete_all_blobs(self):
         blob_list = self.container_client.list_blobs()
         for blob in blob_list:
             self.container_client.delete_blob(blob)
 
     def download_and_upload_file(self, file_name, upload_dir) -> str:
+        return run_sync(self.async_manager.download_and_upload_file(file_name, upload_dir))
+
+    def download_blob_to_buffer(self, file_name, max_concurrency=4, max_size=None, properties=None) -> bytearray:
+        """
+        Downloads a blob into a single preallocated in-memory buffer, without touching the disk.
+
+        Blobs larger than the client's single-get size are fetched as parallel range requests, written straight
+        into their slice of the buffer, so peak memory stays at one copy of the blob.
+
+        Parameters:
+        - file_name (str): The name of the blob to download.
+        - max_concurrency (int): The number of parallel range downloads used for large blobs.
+        - max_size (int): Optional upper bound in bytes; larger blobs are rejected before downloading.
+        - properties (BlobProperties): Optional properties already fetched for the blob. The download is pinned to
+          their ETag, so it fails rather than returning content that changed since.
+
+        Returns:
+        - bytearray: The blob content.
+        """
+        return run_sync(self.async_manager.download_blob_to_buffer(file_name, max_concurrency, max_size, properties))
+
+    def download_blobs(self, file_names, max_concurrency=16, max_size=None) -> dict:
+        return run_sync(self.async_manager.download_blobs(file_names, max_concurrency, max_size))
+
+    def upload_files(self, files, max_concurrency=16) -> dict:
+        return run_sync(self.async_manager.upload_files(files, max_concurrency))
+
+    def iter_blob_chunks(self, file_name):
+        """
+        Streams a blob chunk by chunk, for consumers that can process it incrementally.
+        """
         blob_client = self.blob_service_client.get_blob_client(container=self.container_name, blob=file_name)
-        download_file_path = os.path.join(upload_dir, file_name)
-        
-        # Ensure the upload directory exists
-        os.makedirs(upload_dir, exist_ok=True)
-        with open(download_file_path, "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-            logging.info(f"Successfully downloaded and uploaded the file '{file_name}'.")
-
-        return os.path.join(upload_dir, file_name)
-    
+        yield from blob_client.download_blob().chunks()
+
     def upload_file_to_blob(self, file_path, file_name) -> str:
         try:
-            # Check if file path and file name are valid
-            if not file_path:
-                raise ValueError("File path is null or empty.")
-            if not file_name:
-                raise ValueError("File name is null or empty.")
-
-            # Check if the file exists locally
-            if not os.path.exists(file_path):
-                raise FileNotFoundError(f"File '{file_path}' does not exist.")
-
-            # Upload the file to blob container
-            blob_client = self.blob_service_client.get_blob_client(container=self.container_name, blob=file_name)
-            with open(file_path, "rb") as file:
-                blob_client.upload_blob(file)
-                logging.info(f"File '{file_name}' uploaded to blob container '{self.container_name}' successfully.")
-            return f"Uploaded file '{file_name}' to blob container '{self.container_name}'."
+            return run_sync(self.async_manager.upload_file_to_blob(file_path, file_name))
         except ValueError as ve:
             logging.error(f"ValueError: {ve}")
             raise  # Re-raise the exception
@@ -73,4 +105,17 @@ class AzureBlobManager:
         except Exception as e:
             logging.error(f"Error uploading file to blob container: {e}")
             raise  # Re-raise the exception
-    
+
+    def upload_bytes_to_blob(self, data, file_name, content_type=None) -> str:
+        """
+        Uploads in-memory content, e.g. an encoded result image, without going through a file.
+        """
+        try:
+            content_settings = ContentSettings(content_type=content_type) if content_type else None
+            return run_sync(self.async_manager.upload_bytes_to_blob(data, file_name, content_settings))
+        except ValueError as ve:
+            logging.error(f"ValueError: {ve}")
+            raise  # Re-raise the exception
+        except Exception as e:
+            logging.error(f"Error uploading content to blob container: {e}")
+            raise  # Re-raise the exception
@@ -0,0 +1,151 @@
+import asyncio
+import io
+import logging
+import os
+from azure.core import MatchConditions
+from azure.storage.blob.aio import BlobServiceClient
+
+from .azure_async_helpers import DEFAULT_MAX_CONNECTIONS, gather_limited, get_pooled_transport
+
+
+class BufferWriter(io.RawIOBase):
+    """
+    Seekable writable stream over a preallocated buffer. StorageStreamDownloader.readinto() writes each range at its
+    own offset, so parallel range downloads land directly in the buffer without an intermediate copy.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = base + offset
+        return self._position
+
+    def write(self, data):
+        end = self._position + len(data)
+        if end > len(self._view):
+            raise ValueError(f"Write past the end of the {len(self._view)} bytes buffer.")
+        self._view[self._position:end] = data
+        self._position = end
+        return len(data)
+
+
+class AsyncAzureBlobManager:
+    def __init__(self, connection_string, container_name, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.connection_string = connection_string
+        self.container_name = container_name
+        self.max_connections = max_connections
+        self._blob_service_clients = {}
+
+    def _get_blob_service_client(self) -> BlobServiceClient:
+        # Clients are created lazily per event loop, on top of that loop's pooled aiohttp session
+        loop = asyncio.get_running_loop()
+        client = self._blob_service_clients.get(loop)
+        if client is None:
+            client = BlobServiceClient.from_connection_string(
+                self.connection_string,
+                transport=get_pooled_transport(self.max_connections))
+            self._blob_service_clients[loop] = client
+        return client
+
+    def _get_blob_client(self, file_name):
+        return self._get_blob_service_client().get_blob_client(container=self.container_name, blob=file_name)
+
+    async def list_blob_names(self, prefix=None) -> list:
+        container_client = self._get_blob_service_client().get_container_client(self.container_name)
+        return [blob.name async for blob in container_client.list_blobs(name_starts_with=prefix)]
+
+    async def download_blob_to_buffer(self, file_name, max_concurrency=4, max_size=None, properties=None) -> bytearray:
+        blob_client = self._get_blob_client(file_name)
+
+        # The size comes from the properties, so oversized blobs are rejected before any content is fetched
+        if properties is None:
+            properties = await blob_client.get_blob_properties()
+        if max_size is not None and properties.size > max_size:
+            raise ValueError(f"Blob '{file_name}' is {properties.size} bytes, larger than the {max_size} bytes limit.")
+
+        # Pinned to the ETag, so the blob cannot change size between the properties and the download
+        downloader = await blob_client.download_blob(
+            max_concurrency=max_concurrency, etag=properties.etag, match_condition=MatchConditions.IfNotModified)
+        buffer = bytearray(properties.size)
+        await downloader.readinto(BufferWriter(buffer))
+        logging.info(f"Successfully downloaded the file '{file_name}' ({properties.size} bytes) into memory.")
+        return buffer
+
+    async def download_and_upload_file(self, file_name, upload_dir) -> str:
+        download_file_path = os.path.join(upload_dir, file_name)
+
+        # Ensure the upload directory exists
+        os.makedirs(upload_dir, exist_ok=True)
+        content = await self.download_blob_to_buffer(file_name)
+        with open(download_file_path, "wb") as download_file:
+            download_file.write(content)
+            logging.info(f"Successfully downloaded and uploaded the file '{file_name}'.")
+
+        return download_file_path
+
+    async def upload_file_to_blob(self, file_path, file_name) -> str:
+        if not file_path:
+            raise ValueError("File path is null or empty.")
+        if not file_name:
+            raise ValueError("File name is null or empty.")
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File '{file_path}' does not exist.")
+
+        with open(file_path, "rb") as file:
+            await self._get_blob_client(file_name).upload_blob(file)
+        logging.info(f"File '{file_name}' uploaded to blob container '{self.container_name}' successfully.")
+        return f"Uploaded file '{file_name}' to blob container '{self.container_name}'."
+
+    async def upload_bytes_to_blob(self, data, file_name, content_settings=None) -> str:
+        if not file_name:
+            raise ValueError("File name is null or empty.")
+
+        await self._get_blob_client(file_name).upload_blob(data, content_settings=content_settings)
+        logging.info(f"File '{file_name}' uploaded to blob container '{self.container_name}' successfully.")
+        return f"Uploaded file '{file_name}' to blob container '{self.container_name}'."
+
+    async def download_blobs(self, file_names, max_concurrency=16, max_size=None) -> dict:
+        """
+        Downloads several blobs concurrently over the shared connection pool.
+
+        Returns:
+        - dict: The blob content per file name, or the exception raised for that blob.
+        """
+        results = await gather_limited(
+            (self.download_blob_to_buffer(file_name, max_size=max_size) for file_name in file_names), max_concurrency)
+        return dict(zip(file_names, results))
+
+    async def upload_files(self, files, max_concurrency=16) -> dict:
+        """
+        Uploads several (file_path, file_name) pairs concurrently over the shared connection pool.
+
+        Returns:
+        - dict: The upload message per blob name, or the exception raised for that blob.
+        """
+        files = list(files)
+        results = await gather_limited(
+            (self.upload_file_to_blob(file_path, file_name) for file_path, file_name in files), max_concurrency)
+        return dict(zip([file_name for _, file_name in files], results))
+
+    async def close(self):
+        for client in self._blob_service_clients.values():
+            await client.close()
+        self._blob_service_clients.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -5,6 +5,8 @@ from enum import Enum
 from typing import Optional
 from models.blob_to_process_queue_message import BlobProcessStatus
 
+TABLE_TRANSACTION_MAX_OPERATIONS = 100
+
 class ProcessedBlobModel:
     def __init__(self,
                  source_uri: str,
@@ -54,4 +56,32 @@ class AzureTableStorageManager:
         
         except ResourceNotFoundError:
             print(f"The entity with PartitionKey: {partition_key} and RowKey: {row_key} does not exist.")
-            return None
\ No newline at end of file
+            return None
+
+    def get_entity(self, partition_key, row_key) -> Optional[dict]:
+        try:
+            return self.table_client.get_entity(partition_key=partition_key, row_key=row_key)
+        except ResourceNotFoundError:
+            return None
+
+    def upsert_entity(self, entity: dict):
+        self.table_client.upsert_entity(entity=entity)
+
+    def delete_partition(self, partition_key) -> int:
+        entities = self.table_client.query_entities(
+            query_filter="PartitionKey eq @partition_key",
+            parameters={"partition_key": partition_key},
+            select=["PartitionKey", "RowKey"])
+        # All rows share the partition, so they are deleted in transactions of up to 100 operations (the service limit)
+        deleted = 0
+        operations = []
+        for entity in entities:
+            operations.append(("delete", entity))
+            if len(operations) == TABLE_TRANSACTION_MAX_OPERATIONS:
+                self.table_client.submit_transaction(operations)
+                deleted += len(operations)
+                operations = []
+        if operations:
+            self.table_client.submit_transaction(operations)
+            deleted += len(operations)
+        return deleted
\ No newline at end of file
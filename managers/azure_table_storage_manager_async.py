@@ -0,0 +1,46 @@
+import asyncio
+from azure.data.tables.aio import TableServiceClient
+from azure.core.exceptions import ResourceNotFoundError
+
+from .azure_async_helpers import DEFAULT_MAX_CONNECTIONS, get_pooled_transport
+from .azure_table_storage_manager import TableBlobModel
+
+class AsyncAzureTableStorageManager:
+    def __init__(self, connection_string, table_name, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.connection_string = connection_string
+        self.table_name = table_name
+        self.max_connections = max_connections
+        self._table_clients = {}
+
+    def _get_table_client(self):
+        # Clients are created lazily per event loop, on top of that loop's pooled aiohttp session
+        loop = asyncio.get_running_loop()
+        table_client = self._table_clients.get(loop)
+        if table_client is None:
+            table_service_client = TableServiceClient.from_connection_string(
+                conn_str=self.connection_string,
+                transport=get_pooled_transport(self.max_connections))
+            table_client = self._table_clients[loop] = table_service_client.get_table_client(table_name=self.table_name)
+        return table_client
+
+    async def get_blob_data(self, partition_key, row_key):
+        try:
+            entity = await self._get_table_client().get_entity(partition_key=partition_key, row_key=row_key)
+            return TableBlobModel(partition_key=entity['PartitionKey'],
+                                  row_key=entity['RowKey'],
+                                  blob_data_json=entity['BlobDataJson'])
+
+        except ResourceNotFoundError:
+            print(f"The entity with PartitionKey: {partition_key} and RowKey: {row_key} does not exist.")
+            return None
+
+    async def close(self):
+        for table_client in self._table_clients.values():
+            await table_client.close()
+        self._table_clients.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from .azure_table_storage_manager import AzureTableStorageManager
+
+CACHE_PARTITION_PREFIX = "detection-cache-"
+CACHE_STATE_PARTITION = "detection-cache"
+CACHE_STATE_ROW = "weights"
+
+
+def content_key_from_bytes(content) -> str:
+    """
+    Builds the same md5 content key as AzureBlobManager.get_blob_content_key, from already downloaded bytes.
+    """
+    return f"md5:{hashlib.md5(content).hexdigest()}"
+
+
+class DetectionResultCache:
+    """
+    Two-tier cache of detection results keyed by image content, model weights and inference params.
+
+    The first tier is an in-process LRU; the second persists entries in the existing table storage, partitioned by
+    weights hash so a whole model generation can be dropped at once. A hit returns the stored result JSON, whose
+    resultImgName still points at the annotated image uploaded by the original run.
+    """
+
+    def __init__(self, table_storage_manager: Optional[AzureTableStorageManager], max_entries: int = 1024):
+        self.table_storage_manager = table_storage_manager
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bound_weights_hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _partition_key(cache_signature: str) -> str:
+        return CACHE_PARTITION_PREFIX + cache_signature.split('|', 1)[0][:32]
+
+    @staticmethod
+    def _row_key(content_key: str, cache_signature: str) -> str:
+        return hashlib.sha256(f"{content_key}|{cache_signature}".encode()).hexdigest()
+
+    def get(self, content_key: str, cache_signature: str) -> Optional[dict]:
+        row_key = self._row_key(content_key, cache_signature)
+        with self._lock:
+            entry = self._entries.get(row_key)
+            if entry is not None:
+                self._entries.move_to_end(row_key)
+                self.hits += 1
+                return dict(entry[1])
+
+        result = None
+        if self.table_storage_manager is not None:
+            try:
+                entity = self.table_storage_manager.get_entity(self._partition_key(cache_signature), row_key)
+                result = json.loads(entity['ResultJson']) if entity else None
+            except Exception as ex:
+                logging.warning(f"DetectionResultCache lookup failed: {ex}")
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(row_key, cache_signature, result)
+        return dict(result)
+
+    def put(self, content_key: str, cache_signature: str, result: dict):
+        if result.get("hasErrors"):
+            return  # never cache failures
+
+        row_key = self._row_key(content_key, cache_signature)
+        with self._lock:
+            self._remember(row_key, cache_signature, result)
+
+        if self.table_storage_manager is not None:
+            try:
+                self.table_storage_manager.upsert_entity({
+                    'PartitionKey': self._partition_key(cache_signature),
+                    'RowKey': row_key,
+                    'ContentKey': content_key,
+                    'CacheSignature': cache_signature,
+                    'ResultJson': json.dumps(result),
+                    'ResultImgName': result.get("resultImgName"),
+                    'CreatedAt': datetime.now(timezone.utc).isoformat()
+                })
+            except Exception as ex:
+                logging.warning(f"DetectionResultCache store failed: {ex}")
+
+    def _remember(self, row_key: str, cache_signature: str, result: dict):
+        # The partition is kept with the result, so invalidating one weights hash only evicts its own entries
+        self._entries[row_key] = (self._partition_key(cache_signature), result)
+        self._entries.move_to_end(row_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, weights_hash: str = None):
+        """
+        Drops every entry produced by the given weights, in memory and persisted. Without a weights hash, only the
+        in-memory tier is cleared.
+        """
+        with self._lock:
+            if weights_hash:
+                partition_key = self._partition_key(weights_hash)
+                for row_key in [key for key, (partition, _) in self._entries.items() if partition == partition_key]:
+                    del self._entries[row_key]
+            else:
+                self._entries.clear()
+        if weights_hash and self.table_storage_manager is not None:
+            deleted = self.table_storage_manager.delete_partition(self._partition_key(weights_hash))
+            logging.info(f"DetectionResultCache invalidated {deleted} entries for weights {weights_hash[:12]}.")
+
+    def bind_weights(self, weights_hash: str, model_key: str = None):
+        """
+        Records the weights currently served for a model. If they differ from the ones recorded last time for the same
+        model, the results of the previous weights are invalidated. Each resident model is tracked on its own row, so
+        serving several models side by side does not invalidate each other's results.
+
+        Called on every request, but only the first call for new weights does any work, and the table round trips and
+        the partition delete run on a background thread rather than in the request.
+        """
+        with self._lock:
+            if self._bound_weights_hashes.get(model_key) == weights_hash:
+                return
+            self._bound_weights_hashes[model_key] = weights_hash
+        if self.table_storage_manager is None:
+            return
+
+        threading.Thread(target=self._store_weights_binding, args=(weights_hash, model_key),
+                         name="detection-cache-bind", daemon=True).start()
+
+    def _store_weights_binding(self, weights_hash: str, model_key: str = None):
+        state_row = f"{CACHE_STATE_ROW}-{model_key}" if model_key else CACHE_STATE_ROW
+        try:
+            state = self.table_storage_manager.get_entity(CACHE_STATE_PARTITION, state_row)
+            previous_weights_hash = state.get('WeightsHash') if state else None
+            if previous_weights_hash and previous_weights_hash != weights_hash:
+                self.invalidate(previous_weights_hash)
+            self.table_storage_manager.upsert_entity({
+                'PartitionKey': CACHE_STATE_PARTITION,
+                'RowKey': state_row,
+                'WeightsHash': weights_hash
+            })
+        except Exception as ex:
+            logging.warning(f"DetectionResultCache weights binding failed: {ex}")
+            with self._lock:  # retried by the next call
+                if self._bound_weights_hashes.get(model_key) == weights_hash:
+                    del self._bound_weights_hashes[model_key]
@@ -1,3 +1,8 @@
 from .blob_to_process_queue_message import BlobProcessStatus, BlobToProcessQueueMessage
 from .image_prediction_result import ImagePredictionResult
-from .visio_detector_http_request import VisioDetectorHttpRequest
\ No newline at end of file
+from .visio_detector_http_request import VisioDetectorHttpRequest
+from .batch_prediction_result import BatchPredictionResult
+from .visio_detector_batch_http_request import VisioDetectorBatchHttpRequest
+from .detection_set import DetectionSet
+from .visio_detector_video_http_request import VisioDetectorVideoHttpRequest
+from .video_prediction_result import VideoPredictionResult
\ No newline at end of file
@@ -0,0 +1,35 @@
+import json
+from dataclasses import dataclass, field
+from typing import List
+from .enums import DetectorType
+
+@dataclass
+class BatchPredictionResult:
+    detector_type: DetectorType
+    results: List[dict] = field(default_factory=list)
+    errors: str = None
+    has_errors: bool = False
+
+    @property
+    def failed_results(self) -> List[dict]:
+        return [result for result in self.results if result.get("hasErrors")]
+
+    def __str__(self):
+        return f"Detector Type: {self.detector_type}, Total Images: {len(self.results)}, Failed Images: {len(self.failed_results)}, Errors: {self.errors}, Has Errors: {self.has_errors}"
+
+    def to_json_dict(self) -> dict:
+        failed_results = self.failed_results
+        return {
+            "detectorType": self.detector_type.value,
+            "totalImages": len(self.results),
+            "succeededImages": len(self.results) - len(failed_results),
+            "failedImages": len(failed_results),
+            "failures": [{"imageName": result.get("imageName"), "errors": result.get("errors")} for result in failed_results],
+            "timeTaken": sum(result.get("timeTaken") or 0 for result in self.results),
+            "results": self.results,
+            "errors": self.errors,
+            "hasErrors": self.has_errors
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_json_dict())
@@ -0,0 +1,64 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+class DetectionSet:
+    """
+    Array-backed detections of one image: an (n, 6) float32 array of [x1, y1, x2, y2, conf, class_id] rows in source
+    image pixels, sorted by confidence, as produced by NMS. Serialized column-wise to keep the JSON small for images
+    with hundreds of boxes.
+    """
+
+    def __init__(self, data=None, names: Optional[Dict[int, str]] = None):
+        self.data = np.zeros((0, 6), dtype=np.float32) if data is None else np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        self.names = {int(k): v for k, v in (names or {}).items()}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return f"{len(self)} detections"
+
+    @property
+    def xyxy(self) -> np.ndarray:
+        return self.data[:, :4]
+
+    @property
+    def conf(self) -> np.ndarray:
+        return self.data[:, 4]
+
+    @property
+    def class_ids(self) -> np.ndarray:
+        return self.data[:, 5].astype(np.int32)
+
+    def top(self) -> Tuple[Optional[int], Optional[str], float]:
+        """
+        Returns the highest confidence detection as (class id, class name, confidence), or (None, None, 0).
+        """
+        if not len(self):
+            return None, None, 0.0
+        i = int(self.conf.argmax())
+        class_id = int(self.class_ids[i])
+        return class_id, self.names.get(class_id), float(self.conf[i])
+
+    def to_json_dict(self) -> dict:
+        class_ids = self.class_ids
+        return {
+            "count": len(self),
+            "xyxy": np.rint(self.xyxy).astype(np.int32).ravel().tolist(),
+            "conf": np.round(self.conf, 4).tolist(),
+            "classId": class_ids.tolist(),
+            "names": {str(c): self.names.get(c) for c in sorted(set(class_ids.tolist()))}
+        }
+
+    @classmethod
+    def from_json_dict(cls, json_dict: dict):
+        if not json_dict:
+            return cls()
+
+        count = json_dict.get("count", len(json_dict.get("conf", [])))
+        data = np.zeros((count, 6), dtype=np.float32)
+        if count:
+            data[:, :4] = np.asarray(json_dict["xyxy"], dtype=np.float32).reshape(count, 4)
+            data[:, 4] = json_dict["conf"]
+            data[:, 5] = json_dict["classId"]
+        return cls(data, json_dict.get("names"))
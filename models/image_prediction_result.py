@@ -2,8 +2,9 @@ import json
 from dataclasses import dataclass
 from typing import Optional
 from .visio_detector_http_request import DetectorType
-from utils import string_to_enum
+from utils import from_json_with_enum, string_to_enum
 from .enums import PredictionClass
+from .detection_set import DetectionSet
 
 @dataclass
 class ImagePredictionResult:
@@ -16,9 +17,18 @@ class ImagePredictionResult:
     errors: str = None
     has_errors: bool = False
     time_taken: float = 0
+    class_id: Optional[int] = None
+    detections: Optional[DetectionSet] = None
     
     def __str__(self):
-        return f"Image Name: {self.image_name}, Detector Type: {self.detector_type}, Prediction: {self.prediction}, Classification: {self.classification}, Result Image Name: {self.result_img_name}, Result Image Path: {self.result_img_path}, Errors: {self.errors}, Has Errors: {self.has_errors}, Time Taken: {self.time_taken}"
+        return f"Image Name: {self.image_name}, Detector Type: {self.detector_type}, Prediction: {self.prediction}, Classification: {self.classification}, Detections: {self.detections}, Result Image Name: {self.result_img_name}, Result Image Path: {self.result_img_path}, Errors: {self.errors}, Has Errors: {self.has_errors}, Time Taken: {self.time_taken}"
+
+    @property
+    def prediction_class(self) -> int:
+        # Class ids come from the model's names; the PredictionClass enum only covers results without detections data
+        if self.class_id is not None:
+            return self.class_id
+        return string_to_enum(PredictionClass, self.classification).value
 
     def to_json_dict(self) -> dict:
         return {
@@ -26,12 +36,51 @@ class ImagePredictionResult:
             "resultImgName": self.result_img_name,
             "resultImgPath": self.result_img_path,
             "detectorType": self.detector_type.value,
-            "predictionClass":  string_to_enum(PredictionClass, self.classification).value,
+            "predictionClass": self.prediction_class,
+            "classification": self.classification,
             "prediction": self.prediction,
+            "detections": self.detections.to_json_dict() if self.detections is not None else None,
             "errors": self.errors,
             "hasErrors": self.has_errors,
             "timeTaken": self.time_taken
         }
     
     def to_json(self) -> str:
-        return json.dumps(self.to_json_dict())
\ No newline at end of file
+        return json.dumps(self.to_json_dict())
+
+    @classmethod
+    def from_detections(cls, image_name: str, detector_type: DetectorType, detections: DetectionSet, **kwargs):
+        """
+        Builds a result whose top-detection summary (class, confidence) is taken from the full detections.
+        """
+        class_id, classification, prediction = detections.top()
+        return cls(
+            image_name=image_name,
+            detector_type=detector_type,
+            prediction=prediction,
+            classification=classification,
+            class_id=class_id,
+            detections=detections,
+            **kwargs
+        )
+
+    @classmethod
+    def from_json_dict(cls, json_dict: dict):
+        classification = json_dict.get("classification")
+        if classification is None:  # results stored before classification names were serialized
+            prediction_class = from_json_with_enum(json_dict.get("predictionClass"), PredictionClass)
+            classification = None if prediction_class == PredictionClass.UNKNOWN else prediction_class.name
+        detections = json_dict.get("detections")
+        return cls(
+            image_name=json_dict["imageName"],
+            detector_type=from_json_with_enum(json_dict["detectorType"], DetectorType),
+            prediction=json_dict.get("prediction", 0),
+            classification=classification,
+            result_img_name=json_dict.get("resultImgName"),
+            result_img_path=json_dict.get("resultImgPath"),
+            errors=json_dict.get("errors"),
+            has_errors=json_dict.get("hasErrors", False),
+            time_taken=json_dict.get("timeTaken", 0),
+            class_id=json_dict.get("predictionClass") if detections is not None else None,
+            detections=DetectionSet.from_json_dict(detections) if detections is not None else None
+        )
\ No newline at end of file
@@ -0,0 +1,67 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+from .enums import DetectorType
+
+@dataclass
+class VideoPredictionResult:
+    video_name: str
+    detector_type: DetectorType
+    vid_stride: int = 1
+    fps: float = 0
+    frame_count: int = 0
+    width: int = 0
+    height: int = 0
+    frames: List[dict] = field(default_factory=list)
+    frames_processed: int = 0
+    result_video_names: List[str] = field(default_factory=list)
+    chunk_errors: List[dict] = field(default_factory=list)
+    errors: Optional[str] = None
+    has_errors: bool = False
+    time_taken: float = 0
+
+    def __str__(self):
+        return f"Video Name: {self.video_name}, Detector Type: {self.detector_type}, Frames Processed: {self.frames_processed}, Frames With Detections: {len(self.frames)}, Failed Chunks: {len(self.chunk_errors)}, Errors: {self.errors}, Has Errors: {self.has_errors}"
+
+    def set_video_info(self, video_info: dict):
+        self.fps = video_info.get("fps", 0)
+        self.frame_count = video_info.get("frameCount", 0)
+        self.width = video_info.get("width", 0)
+        self.height = video_info.get("height", 0)
+
+    def add_chunk(self, chunk_result: dict):
+        """
+        Merges the result of one frame-range activity; chunks may arrive in any order.
+        """
+        self.frames.extend(chunk_result.get("frames") or [])
+        self.frames_processed += chunk_result.get("framesProcessed", 0)
+        self.time_taken += chunk_result.get("timeTaken") or 0
+        if chunk_result.get("resultVideoName"):
+            self.result_video_names.append(chunk_result["resultVideoName"])
+        if chunk_result.get("hasErrors"):
+            self.chunk_errors.append({
+                "startFrame": chunk_result.get("startFrame"),
+                "endFrame": chunk_result.get("endFrame"),
+                "errors": chunk_result.get("errors")
+            })
+
+    def to_json_dict(self) -> dict:
+        return {
+            "videoName": self.video_name,
+            "detectorType": self.detector_type.value,
+            "vidStride": self.vid_stride,
+            "fps": self.fps,
+            "frameCount": self.frame_count,
+            "width": self.width,
+            "height": self.height,
+            "framesProcessed": self.frames_processed,
+            "frames": sorted(self.frames, key=lambda frame: frame["frame"]),  # time-indexed, frames with detections
+            "resultVideoNames": self.result_video_names,  # rendered segments in frame order
+            "chunkErrors": self.chunk_errors,
+            "errors": self.errors,
+            "hasErrors": self.has_errors or bool(self.chunk_errors),
+            "timeTaken": self.time_taken
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_json_dict())
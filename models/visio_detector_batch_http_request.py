@@ -0,0 +1,51 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+from utils import from_json_with_enum
+from .enums import DetectorType
+
+@dataclass
+class VisioDetectorBatchHttpRequest:
+    detector_type: DetectorType
+    prefix: Optional[str] = None
+    file_names: List[str] = field(default_factory=list)
+    chunk_size: int = 16
+    max_concurrency: int = 8
+    model_name: Optional[str] = None
+    model_version: Optional[str] = None
+
+    def to_json_dict(self) -> dict:
+        return {
+            "prefix": self.prefix,
+            "fileNames": self.file_names,
+            "detectorType": self.detector_type.value,
+            "chunkSize": self.chunk_size,
+            "maxConcurrency": self.max_concurrency,
+            "modelName": self.model_name,
+            "modelVersion": self.model_version
+        }
+
+    def to_json_string(self) -> str:
+        return json.dumps(self.to_json_dict())
+
+    def chunks(self) -> List[List[str]]:
+        """
+        Splits the file names into activity-sized batches.
+        """
+        chunk_size = max(1, self.chunk_size)
+        return [self.file_names[i:i + chunk_size] for i in range(0, len(self.file_names), chunk_size)]
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if not json_dict.get('prefix') and not json_dict.get('fileNames'):
+            raise ValueError("Either 'prefix' or 'fileNames' must be provided.")
+
+        return cls(
+            detector_type=from_json_with_enum(json_dict['detectorType'], DetectorType),
+            prefix=json_dict.get('prefix'),
+            file_names=list(json_dict.get('fileNames') or []),
+            chunk_size=int(json_dict.get('chunkSize', 16)),
+            max_concurrency=int(json_dict.get('maxConcurrency', 8)),
+            model_name=json_dict.get('modelName'),
+            model_version=json_dict.get('modelVersion')
+        )
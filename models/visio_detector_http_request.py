@@ -1,6 +1,7 @@
 import json
 from utils import from_json_with_enum
 from dataclasses import dataclass
+from typing import Optional
 from .enums import DetectorType
 
 @dataclass
@@ -8,12 +9,16 @@ class VisioDetectorHttpRequest:
     file_name: str
     source_blob_uri: str
     detector_type: DetectorType
+    model_name: Optional[str] = None
+    model_version: Optional[str] = None
 
     def to_json_dict(self) -> dict:
         return {
-            "fileName": self.name,
-            "sourceBlobUri": self.age,
-            "detectorType": self.detector_type.value
+            "fileName": self.file_name,
+            "sourceBlobUri": self.source_blob_uri,
+            "detectorType": self.detector_type.value,
+            "modelName": self.model_name,
+            "modelVersion": self.model_version
         }
 
     def to_json_string(self) -> str:
@@ -26,7 +31,9 @@ class VisioDetectorHttpRequest:
         return cls(
             file_name=json_dict['fileName'],
             source_blob_uri=json_dict['sourceBlobUri'],
-            detector_type=from_json_with_enum(json_dict['detectorType'], DetectorType)
+            detector_type=from_json_with_enum(json_dict['detectorType'], DetectorType),
+            model_name=json_dict.get('modelName'),
+            model_version=json_dict.get('modelVersion')
         )
     
 # class VisioDetectorHttpRequest:
@@ -0,0 +1,73 @@
+import json
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
+from utils import from_json_with_enum
+from .enums import DetectorType
+
+@dataclass
+class VisioDetectorVideoHttpRequest:
+    detector_type: DetectorType
+    file_name: str
+    vid_stride: int = 1
+    chunk_frames: int = 300
+    max_concurrency: int = 8
+    render_video: bool = False
+    start_frame: int = 0
+    end_frame: Optional[int] = None
+    model_name: Optional[str] = None
+    model_version: Optional[str] = None
+
+    def to_json_dict(self) -> dict:
+        return {
+            "fileName": self.file_name,
+            "detectorType": self.detector_type.value,
+            "vidStride": self.vid_stride,
+            "chunkFrames": self.chunk_frames,
+            "maxConcurrency": self.max_concurrency,
+            "renderVideo": self.render_video,
+            "startFrame": self.start_frame,
+            "endFrame": self.end_frame,
+            "modelName": self.model_name,
+            "modelVersion": self.model_version
+        }
+
+    def to_json_string(self) -> str:
+        return json.dumps(self.to_json_dict())
+
+    def chunks(self, frame_count: int) -> List[Tuple[int, Optional[int]]]:
+        """
+        Splits the requested frames into (start, end) ranges of about chunk_frames frames for parallel activities.
+        Every range starts on a vid_stride step, so together they sample exactly the frames a sequential pass would.
+        The last range is open-ended (end None) unless an end frame was requested, since container frame counts are
+        only estimates.
+        """
+        vid_stride = max(1, self.vid_stride)
+        chunk_frames = -(-max(1, self.chunk_frames) // vid_stride) * vid_stride  # rounded up to whole strides
+        end_frame = self.end_frame if self.end_frame is not None else frame_count
+        starts = list(range(self.start_frame, end_frame, chunk_frames)) or [self.start_frame]
+        return [(start, start + chunk_frames) for start in starts[:-1]] + [(starts[-1], self.end_frame)]
+
+    def chunk(self, start_frame: int, end_frame: Optional[int]):
+        """
+        Returns the request of one chunk activity.
+        """
+        return replace(self, start_frame=start_frame, end_frame=end_frame)
+
+    @classmethod
+    def from_json(cls, json_dict):
+        if not json_dict.get('fileName'):
+            raise ValueError("'fileName' must be provided.")
+
+        end_frame = json_dict.get('endFrame')
+        return cls(
+            detector_type=from_json_with_enum(json_dict['detectorType'], DetectorType),
+            file_name=json_dict['fileName'],
+            vid_stride=max(1, int(json_dict.get('vidStride', 1))),
+            chunk_frames=int(json_dict.get('chunkFrames', 300)),
+            max_concurrency=int(json_dict.get('maxConcurrency', 8)),
+            render_video=bool(json_dict.get('renderVideo', False)),
+            start_frame=int(json_dict.get('startFrame', 0)),
+            end_frame=int(end_frame) if end_frame is not None else None,
+            model_name=json_dict.get('modelName'),
+            model_version=json_dict.get('modelVersion')
+        )
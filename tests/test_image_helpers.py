@@ -0,0 +1,51 @@
+"""Tests for the in-memory image decoding helpers."""
+
+import io
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # repository root
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from utils.image_helpers import decode_image
+
+
+def _encode(ext, height, width):
+    im = np.zeros((height, width, 3), dtype=np.uint8)
+    im[: height // 2] = (0, 128, 255)
+    return cv2.imencode(ext, im)[1].tobytes()
+
+
+def test_decode_large_jpeg_reduced(monkeypatch):
+    """A JPEG over PIL's decompression bomb limit is still sized from its header and decoded at a reduced scale."""
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 100_000)  # 2x this raises DecompressionBombError in Image.open
+    data = _encode(".jpg", 3000, 4000)
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(io.BytesIO(data))
+
+    im, factor = decode_image(memoryview(data), max_pixels=1_000_000)
+    assert factor == 4
+    assert im.shape == (750, 1000, 3)
+
+
+def test_decode_within_budget_full_size():
+    im, factor = decode_image(bytearray(_encode(".jpg", 300, 400)), max_pixels=1_000_000)
+    assert factor == 1
+    assert im.shape == (300, 400, 3)
+
+
+def test_decode_large_png_rejected():
+    with pytest.raises(ValueError, match="PNG"):
+        decode_image(_encode(".png", 1200, 1000), max_pixels=1_000_000)
+
+
+def test_decode_invalid_content():
+    with pytest.raises(ValueError):
+        decode_image(b"not an image", max_pixels=1_000_000)
@@ -1,3 +1,5 @@
 from .json_helpers import from_json_with_enum, string_to_enum
-from .storage_helpers import img_rename_to_detection_result, save_detection_result, save_img_to_directory, get_child_directory_path
-from .logging_helpers import configure_logging
\ No newline at end of file
+from .storage_helpers import img_rename_to_detection_result, build_detection_result_name, is_video_file, save_detection_result, save_img_to_directory, get_child_directory_path
+from .logging_helpers import configure_logging
+from .image_helpers import decode_image, encode_image, IMAGE_CONTENT_TYPES
+from .stage_profiler import StageProfiler, get_stage_profiler
\ No newline at end of file
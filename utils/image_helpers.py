@@ -0,0 +1,150 @@
+import io
+import struct
+
+import cv2
+import numpy as np
+from PIL import Image
+
+REDUCED_DECODE_FLAGS = ((1, cv2.IMREAD_COLOR),
+                        (2, cv2.IMREAD_REDUCED_COLOR_2),
+                        (4, cv2.IMREAD_REDUCED_COLOR_4),
+                        (8, cv2.IMREAD_REDUCED_COLOR_8))
+
+IMAGE_CONTENT_TYPES = {'.jpg': 'image/jpeg',
+                       '.jpeg': 'image/jpeg',
+                       '.png': 'image/png',
+                       '.webp': 'image/webp',
+                       '.bmp': 'image/bmp',
+                       '.tiff': 'image/tiff'}
+
+
+class _MemoryViewReader(io.RawIOBase):
+    """A read-only, seekable file object over a buffer, so PIL can parse the header without the content being copied."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def _read_image_header(buffer) -> tuple:
+    """
+    Reads the size and format of an encoded image from its header, without decoding the pixels or copying the content.
+
+    Unlike Image.open, this skips PIL's decompression bomb check (DecompressionBombError above ~179 MP): the caller
+    applies its own pixel budget, and a large JPEG can still be decoded at a reduced scale.
+
+    Parameters:
+    - buffer (bytes | bytearray | memoryview | np.ndarray): The encoded image content.
+
+    Returns:
+    - tuple: The width, height and PIL format name (e.g. 'JPEG') of the image.
+    """
+    fp = _MemoryViewReader(buffer)
+    prefix = fp.read(16)
+    Image.init()
+    for image_format in Image.ID:
+        factory, accept = Image.OPEN[image_format]
+        result = not accept or accept(prefix)
+        if not result or isinstance(result, str):
+            continue
+        try:
+            fp.seek(0)
+            img = factory(fp, None)
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+        try:
+            return img.width, img.height, img.format
+        finally:
+            img.close()
+    raise ValueError("The image content could not be decoded.")
+
+
+def decode_image(buffer, max_pixels: int = None) -> tuple:
+    """
+    Decodes an encoded image (JPG, PNG, ...) held in memory into a BGR numpy array, without a temp file.
+
+    Parameters:
+    - buffer (bytes | bytearray | memoryview): The encoded image content.
+    - max_pixels (int): Optional pixel budget. Larger JPEGs are decoded at 1/2, 1/4 or 1/8 scale by the decoder
+      itself, so the full-resolution bitmap is never allocated. Other formats are always decoded at full size, so
+      larger ones are rejected, as are JPEGs still over the budget at 1/8 scale.
+
+    Returns:
+    - tuple: The decoded image in HWC BGR layout, and the factor (1, 2, 4 or 8) it was reduced by. Multiply
+      coordinates in the decoded image by the factor to map them back to the source image.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)  # no copy
+
+    flag, factor = cv2.IMREAD_COLOR, 1
+    if max_pixels:
+        width, height, image_format = _read_image_header(data)
+        pixels = width * height
+        if pixels > max_pixels:
+            if image_format != 'JPEG':  # OpenCV's reduced modes decode other formats at full size, then resize
+                raise ValueError(
+                    f"The {width}x{height} {image_format} image is larger than the {max_pixels} pixels limit.")
+            for factor, flag in REDUCED_DECODE_FLAGS:
+                if pixels / factor ** 2 <= max_pixels:
+                    break
+            else:
+                raise ValueError(f"The {width}x{height} image is larger than the {max_pixels} pixels limit, "
+                                 f"even at 1/{factor} scale.")
+
+    im = cv2.imdecode(data, flag)
+    if im is None:
+        raise ValueError("The image content could not be decoded.")
+    return im, factor
+
+
+def encode_image(im: np.ndarray, img_ext: str = '.jpg', quality: int = 95, max_dimension: int = None) -> tuple:
+    """
+    Encodes a BGR numpy array in memory, without a temp file.
+
+    Parameters:
+    - im (np.ndarray): The image in HWC BGR layout.
+    - img_ext (str): The output format by extension, one of IMAGE_CONTENT_TYPES.
+    - quality (int): JPEG/WebP quality, 1-100. PNG is lossless and always uses the default compression.
+    - max_dimension (int): Optional limit on the longer side; larger images are downscaled before encoding.
+
+    Returns:
+    - tuple: The encoded bytes and their content type.
+    """
+    img_ext = img_ext.lower()
+    if img_ext not in IMAGE_CONTENT_TYPES:
+        raise ValueError(f"Unsupported image format '{img_ext}', use one of {', '.join(IMAGE_CONTENT_TYPES)}.")
+
+    height, width = im.shape[:2]
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        im = cv2.resize(im, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+    params = []
+    if img_ext in ('.jpg', '.jpeg'):
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif img_ext == '.webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+
+    success, buffer = cv2.imencode(img_ext, im, params)
+    if not success:
+        raise ValueError(f"The image could not be encoded as '{img_ext}'.")
+    return buffer.tobytes(), IMAGE_CONTENT_TYPES[img_ext]
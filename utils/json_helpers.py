@@ -18,5 +18,5 @@ def string_to_enum(enum_class: Type[T], string_value: str) -> T:
             if member.name.lower() == string_value_lower:
                 return member
         raise ValueError  # If no match is found, raise ValueError
-    except ValueError:
+    except (ValueError, AttributeError):  # AttributeError when there is no value, e.g. nothing was detected
         return enum_class.UNKNOWN 
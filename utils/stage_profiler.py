@@ -0,0 +1,207 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond stages (scale, h2d) up to slow blob transfers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class StageTimer:
+    """
+    Handed out by StageProfiler.stage(); holds the stage duration in seconds once the stage has finished.
+    """
+
+    def __init__(self):
+        self.dt = 0.0
+
+
+class StageHistogram:
+    """
+    Latency histogram of one stage/model/backend series, with cumulative-ready bucket counts, sum and count.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1  # buckets are upper-inclusive (le)
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in, the last finite bound for +Inf.
+        """
+        rank, total = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class BatchCounters:
+    """
+    Micro-batch totals of one model/backend series: batches run, images in them and the images they could have held.
+    """
+
+    def __init__(self):
+        self.batches = 0
+        self.images = 0
+        self.slots = 0
+
+    def observe(self, batch_size: int, max_batch_size: int):
+        self.batches += 1
+        self.images += batch_size
+        self.slots += max_batch_size
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.images / self.slots if self.slots else 0
+
+
+class StageProfiler:
+    """
+    Hot-path instrumentation with named stages (queue, download, decode, letterbox, h2d, forward, nms, scale, annotate,
+    encode, upload), kept as histograms per stage, model and backend, plus micro-batch fill counters per model and
+    backend. Recording is two perf_counter reads and a bucket increment under a lock, cheap enough to leave on in
+    production.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, model: str = "", backend: str = ""):
+        if not self.enabled:
+            return
+        key = (stage, model or "", backend or "")
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = StageHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_batch(self, batch_size: int, max_batch_size: int, model: str = "", backend: str = ""):
+        """
+        Records one micro-batch of batch_size images out of max_batch_size.
+        """
+        if not self.enabled:
+            return
+        key = (model or "", backend or "")
+        with self._lock:
+            counters = self._batches.get(key)
+            if counters is None:
+                counters = self._batches[key] = BatchCounters()
+            counters.observe(batch_size, max_batch_size)
+
+    @contextmanager
+    def stage(self, name: str, model: str = "", backend: str = ""):
+        """
+        Times the enclosed block as one observation of a stage, including blocks that raise.
+
+        Returns:
+        - StageTimer: Holds the duration in seconds after the block.
+        """
+        timer = StageTimer()
+        start_time = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            timer.dt = time.perf_counter() - start_time
+            self.observe(name, timer.dt, model, backend)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._batches.clear()
+
+    def snapshot(self) -> list:
+        """
+        Returns one summary per series: count, total and average time, and the bucket estimates of p50/p95/p99.
+        """
+        with self._lock:
+            series = sorted(self._histograms.items())
+            return [{
+                "stage": stage,
+                "model": model,
+                "backend": backend,
+                "count": histogram.count,
+                "totalSeconds": histogram.sum,
+                "avgMs": histogram.sum / histogram.count * 1e3 if histogram.count else 0,
+                "p50Ms": histogram.quantile(0.5) * 1e3,
+                "p95Ms": histogram.quantile(0.95) * 1e3,
+                "p99Ms": histogram.quantile(0.99) * 1e3
+            } for (stage, model, backend), histogram in series]
+
+    def batch_snapshot(self) -> list:
+        """
+        Returns one summary per model/backend series of micro-batches: batches, images, average size and fill ratio.
+        The time images waited for their batch is the queue stage of snapshot().
+        """
+        with self._lock:
+            return [{
+                "model": model,
+                "backend": backend,
+                "batches": counters.batches,
+                "images": counters.images,
+                "avgBatchSize": counters.images / counters.batches if counters.batches else 0,
+                "batchFillRatio": counters.fill_ratio
+            } for (model, backend), counters in sorted(self._batches.items())]
+
+    def to_prometheus(self, name: str = "visio_detector_stage_seconds") -> str:
+        """
+        Renders every series as one Prometheus histogram in the text exposition format (version 0.0.4), followed by
+        the micro-batch counters and fill ratio gauge.
+        """
+        lines = [f"# HELP {name} Time spent in each detection stage, per model and backend.",
+                 f"# TYPE {name} histogram"]
+        with self._lock:
+            for (stage, model, backend), histogram in sorted(self._histograms.items()):
+                labels = f'stage="{_escape(stage)}",model="{_escape(model)}",backend="{_escape(backend)}"'
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+            batches = sorted(self._batches.items())
+            if batches:
+                for metric, kind, description, value in (
+                        ("visio_detector_batches_total", "counter", "Micro-batches run, per model and backend.",
+                         lambda counters: counters.batches),
+                        ("visio_detector_batch_images_total", "counter", "Images run in micro-batches.",
+                         lambda counters: counters.images),
+                        ("visio_detector_batch_slots_total", "counter", "Images the micro-batches could have held.",
+                         lambda counters: counters.slots),
+                        ("visio_detector_batch_fill_ratio", "gauge", "Batched images over batch slots since start.",
+                         lambda counters: counters.fill_ratio)):
+                    lines.append(f"# HELP {metric} {description}")
+                    lines.append(f"# TYPE {metric} {kind}")
+                    for (model, backend), counters in batches:
+                        labels = f'model="{_escape(model)}",backend="{_escape(backend)}"'
+                        lines.append(f"{metric}{{{labels}}} {value(counters)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_stage_profiler = StageProfiler(enabled=os.environ.get("StageProfilingEnabled", "true").lower() == "true")
+
+
+def get_stage_profiler() -> StageProfiler:
+    """
+    Returns the profiler shared by the worker process, disabled with StageProfilingEnabled=false.
+    """
+    return _stage_profiler
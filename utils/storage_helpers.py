@@ -5,13 +5,14 @@ from PIL import Image
 from pathlib import Path
 from models.enums import DetectorType
 
-def img_rename_to_detection_result(file_path, detector_type: DetectorType) -> tuple:
+def img_rename_to_detection_result(file_path, detector_type: DetectorType, target_dir: str = None) -> tuple:
     """
     Renames a file with a prefix and returns the new filename and path.
 
     Parameters:
     - file_path (str): The path to the file.
-    - prefix (str): The prefix to be added to the filename.
+    - detector_type (DetectorType): The type of detector, used for the filename prefix.
+    - target_dir (str): Optional directory to move the file into (same filesystem), defaults to its own directory.
 
     Returns:
     - tuple: The new filename and path if successful, otherwise None.
@@ -28,20 +29,13 @@ def img_rename_to_detection_result(file_path, detector_type: DetectorType) -> tu
             if img_ext not in valid_extensions:
                 raise ValueError("Invalid image format. Only JPG, JPEG, PNG, GIF, BMP, and TIFF formats are supported.")
 
-            prefix = build_img_prefix_for_detector(detector_type)
-            # Remove the previous extension from the source image name
-            source_img_name_without_ext = os.path.splitext(filename)[0]
-
-            # Generate a unique identifier (GUID)
-            unique_id = uuid.uuid4()
-
             # Construct the new filename
-            new_filename = f"{prefix}{source_img_name_without_ext}_{unique_id}{img_ext}"
+            new_filename = build_detection_result_name(filename, detector_type)
 
             # Construct the new file path
-            new_file_path = os.path.join(directory, new_filename)
-            # Rename the file
-            os.rename(file_path, new_file_path)
+            new_file_path = os.path.join(target_dir or directory, new_filename)
+            # Rename the file, atomically replacing so concurrent readers never see a partial file
+            os.replace(file_path, new_file_path)
             print(f"File '{file_path}' renamed to '{new_file_path}'.")
 
             return new_filename, new_file_path
@@ -52,6 +46,31 @@ def img_rename_to_detection_result(file_path, detector_type: DetectorType) -> tu
         print(f"Error renaming file: {e}")
         return None
     
+VIDEO_EXTENSIONS = {'.asf', '.avi', '.m4v', '.mkv', '.mov', '.mp4', '.mpeg', '.mpg', '.ts', '.wmv'}
+
+def is_video_file(file_name: str) -> bool:
+    """
+    Returns whether a blob name has one of the video extensions YOLOv5 reads (GIFs are handled as images).
+    """
+    return os.path.splitext(file_name)[1].lower() in VIDEO_EXTENSIONS
+
+def build_detection_result_name(source_img_name: str, detector_type: DetectorType, img_ext: str = None) -> str:
+    """
+    Builds the unique name a detection result image is stored under.
+
+    Parameters:
+    - source_img_name (str): The name of the source file.
+    - detector_type (DetectorType): The type of detector, used for the filename prefix.
+    - img_ext (str): Optional extension of the result image, defaults to the source image extension.
+
+    Returns:
+    - str: The prefixed name with a unique identifier (GUID) before the extension.
+    """
+    source_img_name_without_ext, source_img_ext = os.path.splitext(source_img_name)
+    prefix = build_img_prefix_for_detector(detector_type)
+    unique_id = uuid.uuid4()
+    return f"{prefix}{source_img_name_without_ext}_{unique_id}{img_ext or source_img_ext.lower()}"
+
 def save_detection_result(image: Image.Image, directory: str, source_img_name: str, detector_type: DetectorType) -> str:
     """
     Saves a PIL image to a specified directory with the given filename.
@@ -1,6 +1,7 @@
 import os
+import tempfile
 
-from detectors.yolov_detector import run_yolov_detector
+from detectors.yolov_detector import run_yolov_detector, run_yolov_engine_detector
 from models import ImagePredictionResult
 
 
@@ -8,8 +9,19 @@ class VisioDetector:
     @staticmethod
     def run_yolov_detector_wrapper(file_name, source_path) -> ImagePredictionResult:
         script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yolov5')
-        prediction_result_dir = os.path.join(script_dir, "runs/detect", "yolo_road_det")
+        project_dir = os.path.join(script_dir, "runs/detect")
+        results_dir = os.path.join(project_dir, "yolo_road_det")
+
+        # A unique scratch directory per invocation, so concurrent activities never clobber each other's outputs
+        os.makedirs(project_dir, exist_ok=True)
+        prediction_result_dir = tempfile.mkdtemp(prefix="yolo_road_det_", dir=project_dir)
         csv_path = os.path.join(prediction_result_dir, "predictions.csv")
-        result_dir_name = "yolo_road_det"
+        result_dir_name = os.path.basename(prediction_result_dir)
+
+        return run_yolov_detector(file_name, source_path, script_dir, csv_path, result_dir_name, prediction_result_dir, results_dir)
 
-        return run_yolov_detector(file_name, source_path, script_dir, csv_path, result_dir_name, prediction_result_dir)
+    @staticmethod
+    def run_yolov_engine_wrapper(file_name, im0, model_name=None, model_version=None, image_format=None, quality=95,
+                                 max_dimension=None, scale=1) -> tuple:
+        return run_yolov_engine_detector(file_name, im0, model_name, model_version, image_format, quality, max_dimension,
+                                         scale)
\ No newline at end of file
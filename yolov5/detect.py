@@ -29,12 +29,12 @@ Usage - formats:
 """
 
 import argparse
-import csv
 import os
 import platform
 import sys
 from pathlib import Path
 
+import numpy as np
 import torch
 
 FILE = Path(__file__).resolve()
@@ -46,7 +46,8 @@ ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 from ultralytics.utils.plotting import Annotator, colors, save_one_box
 
 from models.common import DetectMultiBackend
-from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
+from utils.augmentations import LetterboxPreprocessor
+from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadImagesPrefetch, LoadScreenshots, LoadStreams
 from utils.general import (
     LOGGER,
     Profile,
@@ -63,6 +64,7 @@ from utils.general import (
     strip_optimizer,
     xyxy2xywh,
 )
+from utils.sinks import AsyncWriter, LabelSink, OrderedRows, ResultSinks
 from utils.torch_utils import select_device, smart_inference_mode
 
 
@@ -79,6 +81,8 @@ def run(
     view_img=False,  # show results
     save_txt=False,  # save results to *.txt
     save_csv=False,  # save results in CSV format
+    save_jsonl=False,  # save results in JSON Lines format
+    save_parquet=False,  # save results in Parquet format
     save_conf=False,  # save confidences in --save-txt labels
     save_crop=False,  # save cropped prediction boxes
     nosave=False,  # do not save images/videos
@@ -96,6 +100,9 @@ def run(
     half=False,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
     vid_stride=1,  # video frame-rate stride
+    prefetch=8,  # images/frames read ahead by loader threads, 0 to load inline
+    batch_size=1,  # batch size for file/directory sources, images grouped by aspect ratio
+    writers=2,  # annotate/save threads, 0 to save on the inference thread
 ):
     source = str(source)
     save_img = not nosave and not source.endswith(".txt")  # save inference images
@@ -118,141 +125,186 @@ def run(
 
     # Dataloader
     bs = 1  # batch_size
+    preprocess = LetterboxPreprocessor(
+        imgsz, stride, auto=pt, device=model.device, half=model.fp16, pin_memory=True, pool=model.io_pool
+    )
     if webcam:
         view_img = check_imshow(warn=True)
         dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
         bs = len(dataset)
     elif screenshot:
-        dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+        dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt, transforms=preprocess)
+    elif prefetch or batch_size > 1:
+        dataset = LoadImagesPrefetch(
+            source,
+            img_size=imgsz,
+            stride=stride,
+            auto=pt,
+            vid_stride=vid_stride,
+            batch_size=batch_size,
+            prefetch=prefetch,
+            preprocessor=preprocess,
+        )
+        bs = dataset.batch_size
     else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+        dataset = LoadImages(
+            source, img_size=imgsz, stride=stride, auto=pt, transforms=preprocess, vid_stride=vid_stride
+        )
     vid_path, vid_writer = [None] * bs, [None] * bs
 
     # Run inference
     model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(device=device), Profile(device=device), Profile(device=device))
-    for path, im, im0s, vid_cap, s in dataset:
-        with dt[0]:
-            im = torch.from_numpy(im).to(model.device)
-            im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            if len(im.shape) == 3:
-                im = im[None]  # expand for batch dim
-            if model.xml and im.shape[0] > 1:
-                ims = torch.chunk(im, im.shape[0], 0)
-
-        # Inference
-        with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            if model.xml and im.shape[0] > 1:
-                pred = None
-                for image in ims:
-                    if pred is None:
-                        pred = model(image, augment=augment, visualize=visualize).unsqueeze(0)
-                    else:
-                        pred = torch.cat((pred, model(image, augment=augment, visualize=visualize).unsqueeze(0)), dim=0)
-                pred = [pred, None]
-            else:
-                pred = model(im, augment=augment, visualize=visualize)
-        # NMS
-        with dt[2]:
-            pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
-
-        # Second-stage classifier (optional)
-        # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
-
-        # Define the path for the CSV file
-        csv_path = save_dir / "predictions.csv"
-
-        # Create or append to the CSV file
-        def write_to_csv(image_name, prediction, confidence):
-            """Writes prediction data for an image to a CSV file, appending if the file exists."""
-            data = {"Image Name": image_name, "Prediction": prediction, "Confidence": confidence}
-            with open(csv_path, mode="a", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=data.keys())
-                if not csv_path.is_file():
-                    writer.writeheader()
-                writer.writerow(data)
-
-        # Process predictions
-        for i, det in enumerate(pred):  # per image
-            seen += 1
-            if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
-                s += f"{i}: "
-            else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
-
-            p = Path(p)  # to Path
-            save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / "labels" / p.stem) + ("" if dataset.mode == "image" else f"_{frame}")  # im.txt
-            s += "%gx%g " % im.shape[2:]  # print string
-            gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            imc = im0.copy() if save_crop else im0  # for save_crop
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
-            if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
-
-                # Print results
-                for c in det[:, 5].unique():
-                    n = (det[:, 5] == c).sum()  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    c = int(cls)  # integer class
-                    label = names[c] if hide_conf else f"{names[c]}"
-                    confidence = float(conf)
-                    confidence_str = f"{confidence:.2f}"
-
-                    if save_csv:
-                        write_to_csv(p.name, label, confidence_str)
-
-                    if save_txt:  # Write to file
-                        xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                        line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
-                        with open(f"{txt_path}.txt", "a") as f:
-                            f.write(("%g " * len(line)).rstrip() % line + "\n")
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
+    sinks = ResultSinks.open(save_dir, csv=save_csv, jsonl=save_jsonl, parquet=save_parquet)  # open for the whole run
+    rows = OrderedRows(sinks)  # rows in source order, also when --batch-size groups images by aspect ratio
+    order = getattr(dataset, "order", {})
+    labels = LabelSink()
+    writer = AsyncWriter(0 if view_img else writers)  # imshow() must run on this thread
+
+    def save_results(i, p, im0, det, image_path, video):
+        """Annotates, crops and saves one image, or appends it to video i, starting a new video file if given."""
+        imc = im0.copy() if save_crop else im0  # for save_crop
+        annotator = Annotator(im0, line_width=line_thickness, example=str(names))
+        for *xyxy, conf, cls in reversed(det):
+            c = int(cls)  # integer class
+            label = None if hide_labels else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
+            annotator.box_label(xyxy, label, color=colors(c, True))
+            if save_crop:
+                save_one_box(xyxy, imc, file=save_dir / "crops" / names[c] / f"{p.stem}.jpg", BGR=True)
+
+        # Stream results
+        im0 = annotator.result()
+        if view_img:
+            if platform.system() == "Linux" and p not in windows:
+                windows.append(p)
+                cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
+                cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
+            cv2.imshow(str(p), im0)
+            cv2.waitKey(1)  # 1 millisecond
+
+        # Save results (image with detections)
+        if save_img:
+            if image_path:
+                cv2.imwrite(image_path, im0)
+            else:  # 'video' or 'stream'
+                if video:  # new video
+                    if isinstance(vid_writer[i], cv2.VideoWriter):
+                        vid_writer[i].release()  # release previous video writer
+                    save_path, fps, size = video
+                    vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+                vid_writer[i].write(im0)
+
+    try:
+        for path, im, im0s, vid_cap, s in dataset:
+            with dt[0]:
+                if isinstance(im, np.ndarray):  # letterboxed uint8 from the stream loader threads
+                    im = preprocess.normalize(torch.from_numpy(im))  # uint8 to fp16/32, 0 - 255 to 0.0 - 1.0
+                if len(im.shape) == 3:
+                    im = im[None]  # expand for batch dim
+                if model.xml and im.shape[0] > 1:
+                    ims = torch.chunk(im, im.shape[0], 0)
+
+            # Inference
+            with dt[1]:
+                stem = Path(path[0] if isinstance(path, list) else path).stem
+                visualize = increment_path(save_dir / stem, mkdir=True) if visualize else False
+                if model.xml and im.shape[0] > 1:
+                    pred = None
+                    for image in ims:
+                        if pred is None:
+                            pred = model(image, augment=augment, visualize=visualize).unsqueeze(0)
+                        else:
+                            pred_i = model(image, augment=augment, visualize=visualize).unsqueeze(0)
+                            pred = torch.cat((pred, pred_i), dim=0)
+                    pred = [pred, None]
+                else:
+                    pred = model(im, augment=augment, visualize=visualize)
+            # NMS
+            with dt[2]:
+                pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+
+            # Second-stage classifier (optional)
+            # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
+
+            # Process predictions
+            for i, det in enumerate(pred):  # per image
+                seen += 1
+                if webcam:  # batch_size >= 1
+                    p, im0, frame = path[i], im0s[i].copy(), dataset.count
+                    s += f"{i}: "
+                elif isinstance(path, list):  # prefetched batch
+                    p, im0, frame = path[i], im0s[i].copy(), getattr(dataset, "frame", 0)
+                    s += f"{i}: " if len(path) > 1 else ""
+                else:
+                    p, im0, frame = path, im0s.copy(), getattr(dataset, "frame", 0)
+
+                p = Path(p)  # to Path
+                save_path = str(save_dir / p.name)  # im.jpg
+                txt_suffix = "" if dataset.mode == "image" else f"_{frame}"
+                txt_path = str(save_dir / "labels" / p.stem) + txt_suffix  # im.txt
+                s += "%gx%g " % im.shape[2:]  # print string
+                gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+                image_rows = []
+                if len(det):
+                    # Rescale boxes from img_size to im0 size
+                    det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+
+                    # Print results
+                    for c in det[:, 5].unique():
+                        n = (det[:, 5] == c).sum()  # detections per class
+                        s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+
+                    # Write results
+                    for *xyxy, conf, cls in reversed(det):
                         c = int(cls)  # integer class
-                        label = None if hide_labels else (names[c] if hide_conf else f"{names[c]} {conf:.2f}")
-                        annotator.box_label(xyxy, label, color=colors(c, True))
-                    if save_crop:
-                        save_one_box(xyxy, imc, file=save_dir / "crops" / names[c] / f"{p.stem}.jpg", BGR=True)
-
-            # Stream results
-            im0 = annotator.result()
-            if view_img:
-                if platform.system() == "Linux" and p not in windows:
-                    windows.append(p)
-                    cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
-                    cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
-                cv2.imshow(str(p), im0)
-                cv2.waitKey(1)  # 1 millisecond
-
-            # Save results (image with detections)
-            if save_img:
-                if dataset.mode == "image":
-                    cv2.imwrite(save_path, im0)
-                else:  # 'video' or 'stream'
-                    if vid_path[i] != save_path:  # new video
+                        label = names[c] if hide_conf else f"{names[c]}"
+                        confidence = float(conf)
+
+                        if sinks:  # CSV, JSON Lines, Parquet
+                            image_rows.append({"Image Name": p.name, "Prediction": label, "Confidence": confidence})
+
+                        if save_txt:  # Write to file
+                            xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
+                            line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
+                            labels.write(f"{txt_path}.txt", ("%g " * len(line)).rstrip() % line + "\n")
+                if sinks:
+                    rows.write(order.get(path[i] if isinstance(path, list) else path), image_rows)
+
+                # Annotate, crop and save on the writer threads while inference moves on
+                if save_img or save_crop or view_img:
+                    video = None
+                    if save_img and dataset.mode != "image" and vid_path[i] != save_path:  # new video
                         vid_path[i] = save_path
-                        if isinstance(vid_writer[i], cv2.VideoWriter):
-                            vid_writer[i].release()  # release previous video writer
                         if vid_cap:  # video
                             fps = vid_cap.get(cv2.CAP_PROP_FPS)
                             w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
                             h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
                         else:  # stream
                             fps, w, h = 30, im0.shape[1], im0.shape[0]
-                        save_path = str(Path(save_path).with_suffix(".mp4"))  # force *.mp4 suffix on results videos
-                        vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
-                    vid_writer[i].write(im0)
-
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+                        video_path = str(Path(save_path).with_suffix(".mp4"))  # force *.mp4 suffix on results videos
+                        video = video_path, fps, (w, h)
+                    image_path = save_path if dataset.mode == "image" else None
+                    key = None if dataset.mode == "image" else i  # frames of one video stay in order
+                    writer.submit(save_results, i, p, im0, det.cpu(), image_path, video, key=key)
+
+            # Write buffered results once per batch
+            sinks.flush()
+            labels.flush()
+
+            # Print time (inference-only)
+            LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+    finally:
+        # Flush everything queued so far, also when inference failed
+        rows.close()
+        sinks.close()
+        labels.close()
+        try:
+            writer.close()
+        finally:
+            for vw in vid_writer:
+                if isinstance(vw, cv2.VideoWriter):
+                    vw.release()
+    LOGGER.info(f"Writer: {writer.stats()}")
 
     # Print results
     t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
@@ -278,6 +330,8 @@ def parse_opt():
     parser.add_argument("--view-img", action="store_true", help="show results")
     parser.add_argument("--save-txt", action="store_true", help="save results to *.txt")
     parser.add_argument("--save-csv", action="store_true", help="save results in CSV format")
+    parser.add_argument("--save-jsonl", action="store_true", help="save results in JSON Lines format")
+    parser.add_argument("--save-parquet", action="store_true", help="save results in Parquet format")
     parser.add_argument("--save-conf", action="store_true", help="save confidences in --save-txt labels")
     parser.add_argument("--save-crop", action="store_true", help="save cropped prediction boxes")
     parser.add_argument("--nosave", action="store_true", help="do not save images/videos")
@@ -295,6 +349,9 @@ def parse_opt():
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
     parser.add_argument("--vid-stride", type=int, default=1, help="video frame-rate stride")
+    parser.add_argument("--prefetch", type=int, default=8, help="images/frames to read ahead, 0 to disable")
+    parser.add_argument("--batch-size", type=int, default=1, help="batch size for file/directory sources")
+    parser.add_argument("--writers", type=int, default=2, help="annotate/save threads, 0 to save inline")
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
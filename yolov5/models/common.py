@@ -6,6 +6,7 @@ import contextlib
 import json
 import math
 import platform
+import threading
 import warnings
 import zipfile
 from collections import OrderedDict, namedtuple
@@ -36,7 +37,8 @@ except (ImportError, AssertionError):
 from ultralytics.utils.plotting import Annotator, colors, save_one_box
 
 from utils import TryExcept
-from utils.dataloaders import exif_transpose, letterbox
+from utils.augmentations import LetterboxPreprocessor
+from utils.dataloaders import exif_transpose
 from utils.general import (
     LOGGER,
     ROOT,
@@ -54,7 +56,7 @@ from utils.general import (
     xyxy2xywh,
     yaml_load,
 )
-from utils.torch_utils import copy_attr, smart_inference_mode
+from utils.torch_utils import BufferPool, copy_attr, smart_inference_mode
 
 
 def autopad(k, p=None, d=1):
@@ -636,29 +638,29 @@ class DetectMultiBackend(nn.Module):
         if names[0] == "n01440764" and len(names) == 1000:  # ImageNet
             names = yaml_load(ROOT / "data/ImageNet.yaml")["names"]  # human-readable names
 
+        io_pool = BufferPool()  # reused input, staging and output tensors, see input_buffer()
         self.__dict__.update(locals())  # assign all variables to self
 
     def forward(self, im, augment=False, visualize=False):
         """Performs YOLOv5 inference on input images with options for augmentation and visualization."""
         b, ch, h, w = im.shape  # batch, channel, height, width
         if self.fp16 and im.dtype != torch.float16:
-            im = im.half()  # to FP16
-        if self.nhwc:
-            im = im.permute(0, 2, 3, 1)  # torch BCHW to numpy BHWC shape(1,320,192,3)
+            im = self.io_pool.get(im.shape, torch.float16, im.device, tag="fp16").copy_(im)  # to FP16
+        if self.nhwc:  # torch BCHW to numpy BHWC shape(1,320,192,3)
+            im = self.io_pool.get((b, h, w, ch), im.dtype, im.device, tag="nhwc").copy_(im.permute(0, 2, 3, 1))
 
         if self.pt:  # PyTorch
             y = self.model(im, augment=augment, visualize=visualize) if augment or visualize else self.model(im)
         elif self.jit:  # TorchScript
             y = self.model(im)
         elif self.dnn:  # ONNX OpenCV DNN
-            im = im.cpu().numpy()  # torch to numpy
+            im = self.to_numpy(im)  # torch to numpy
             self.net.setInput(im)
             y = self.net.forward()
         elif self.onnx:  # ONNX Runtime
-            im = im.cpu().numpy()  # torch to numpy
-            y = self.session.run(self.output_names, {self.session.get_inputs()[0].name: im})
+            y = self.onnx_forward(im)
         elif self.xml:  # OpenVINO
-            im = im.cpu().numpy()  # FP32
+            im = self.to_numpy(im)  # FP32
             y = list(self.ov_compiled_model(im).values())
         elif self.engine:  # TensorRT
             if self.dynamic and im.shape != self.bindings["images"].shape:
@@ -674,7 +676,7 @@ class DetectMultiBackend(nn.Module):
             self.context.execute_v2(list(self.binding_addrs.values()))
             y = [self.bindings[x].data for x in sorted(self.output_names)]
         elif self.coreml:  # CoreML
-            im = im.cpu().numpy()
+            im = self.to_numpy(im)
             im = Image.fromarray((im[0] * 255).astype("uint8"))
             # im = im.resize((192, 320), Image.BILINEAR)
             y = self.model.predict({"image": im})  # coordinates are xywh normalized
@@ -685,14 +687,14 @@ class DetectMultiBackend(nn.Module):
             else:
                 y = list(reversed(y.values()))  # reversed for segmentation models (pred, proto)
         elif self.paddle:  # PaddlePaddle
-            im = im.cpu().numpy().astype(np.float32)
+            im = self.to_numpy(im if im.dtype == torch.float32 else im.float())
             self.input_handle.copy_from_cpu(im)
             self.predictor.run()
             y = [self.predictor.get_output_handle(x).copy_to_cpu() for x in self.output_names]
         elif self.triton:  # NVIDIA Triton Inference Server
             y = self.model(im)
         else:  # TensorFlow (SavedModel, GraphDef, Lite, Edge TPU)
-            im = im.cpu().numpy()
+            im = self.to_numpy(im)
             if self.saved_model:  # SavedModel
                 y = self.model(im, training=False) if self.keras else self.model(im)
             elif self.pb:  # GraphDef
@@ -724,6 +726,45 @@ class DetectMultiBackend(nn.Module):
         """Converts a NumPy array to a torch tensor, maintaining device compatibility."""
         return torch.from_numpy(x).to(self.device) if isinstance(x, np.ndarray) else x
 
+    def to_numpy(self, im):
+        """Returns a NumPy view sharing im's memory, staged through a pooled contiguous CPU tensor only if needed."""
+        if im.device.type != "cpu" or not im.is_contiguous():
+            im = self.io_pool.get(im.shape, im.dtype, "cpu", pin_memory=True, tag="host").copy_(im)
+        return im.numpy()
+
+    def input_buffer(self, shape, device=None):
+        """Returns the pooled (b, 3, h, w) input tensor for preprocessing to write into and forward() to read."""
+        dtype = torch.float16 if self.fp16 else torch.float32
+        return self.io_pool.get(shape, dtype, device or self.device, pin_memory=True, tag="input")
+
+    def onnx_forward(self, im):
+        """Runs ONNX Runtime with I/O binding, reading the input in place and writing outputs into pooled tensors."""
+        cuda = im.device.type == "cuda" and "CUDAExecutionProvider" in self.session.get_providers()
+        if not cuda and (im.device.type != "cpu" or not im.is_contiguous()):
+            im = self.io_pool.get(im.shape, im.dtype, "cpu", pin_memory=True, tag="host").copy_(im)
+        im = im.contiguous()
+        device_type, device_id = ("cuda", im.device.index or 0) if cuda else ("cpu", 0)
+        dtypes = {"tensor(float)": (np.float32, torch.float32), "tensor(float16)": (np.float16, torch.float16)}
+
+        binding = self.session.io_binding()
+        input = self.session.get_inputs()[0]
+        binding.bind_input(input.name, device_type, device_id, dtypes[input.type][0], tuple(im.shape), im.data_ptr())
+        y = []
+        for output in self.session.get_outputs():
+            if output.type in dtypes and all(isinstance(d, int) for d in output.shape[1:]):  # static, except batch
+                np_dtype, dtype = dtypes[output.type]
+                x = self.io_pool.get((im.shape[0], *output.shape[1:]), dtype, im.device, tag=output.name)
+                binding.bind_output(output.name, device_type, device_id, np_dtype, tuple(x.shape), x.data_ptr())
+                y.append(x)
+            else:  # dynamic output shape, allocated by ONNX Runtime
+                binding.bind_output(output.name, device_type, device_id)
+                y.append(None)
+        self.session.run_with_iobinding(binding)
+        if None in y:
+            outputs = binding.copy_outputs_to_cpu()
+            y = [outputs[i] if x is None else x for i, x in enumerate(y)]
+        return y
+
     def warmup(self, imgsz=(1, 3, 640, 640)):
         """Performs a single inference warmup to initialize model weights, accepting an `imgsz` tuple for image size."""
         warmup_types = self.pt, self.jit, self.onnx, self.engine, self.saved_model, self.pb, self.triton
@@ -780,6 +821,7 @@ class AutoShape(nn.Module):
         self.dmb = isinstance(model, DetectMultiBackend)  # DetectMultiBackend() instance
         self.pt = not self.dmb or model.pt  # PyTorch model
         self.model = model.eval()
+        self._local = threading.local()  # per-thread LetterboxPreprocessor, each owns its reused input tensor
         if self.pt:
             m = self.model.model.model[-1] if self.dmb else self.model.model[-1]  # Detect()
             m.inplace = False  # Detect.inplace=False for safe multithread inference
@@ -846,9 +888,12 @@ class AutoShape(nn.Module):
                 shape1.append([int(y * g) for y in s])
                 ims[i] = im if im.data.contiguous else np.ascontiguousarray(im)  # update
             shape1 = [make_divisible(x, self.stride) for x in np.array(shape1).max(0)]  # inf shape
-            x = [letterbox(im, shape1, auto=False)[0] for im in ims]  # pad
-            x = np.ascontiguousarray(np.array(x).transpose((0, 3, 1, 2)))  # stack and BHWC to BCHW
-            x = torch.from_numpy(x).to(p.device).type_as(p) / 255  # uint8 to fp16/32
+            preprocess = getattr(self._local, "preprocess", None)  # per thread, for safe multithread inference
+            if preprocess is None or (preprocess.device, preprocess.dtype) != (p.device, p.dtype):
+                preprocess = self._local.preprocess = LetterboxPreprocessor(
+                    stride=self.stride, auto=False, bgr2rgb=False, device=p.device, half=p.dtype == torch.float16
+                )
+            x = preprocess(ims, shape1)  # pad, stack, BHWC to BCHW, uint8 to fp16/32, 0 - 255 to 0.0 - 1.0
 
         with amp.autocast(autocast):
             # Inference
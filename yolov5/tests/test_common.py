@@ -0,0 +1,32 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Tests for the AutoShape inference wrapper."""
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from models.common import AutoShape
+from models.yolo import Model
+
+
+def test_autoshape_threads_match_sequential():
+    """Concurrent forward() calls preprocess into their own input tensors, so they match one-at-a-time calls."""
+    torch.manual_seed(0)
+    model = AutoShape(Model(ROOT / "models" / "yolov5n.yaml", nc=3).eval())
+    model.conf = 0.001
+    rng = np.random.default_rng(0)
+    ims = [rng.integers(0, 255, (240, 320, 3), dtype=np.uint8) for _ in range(12)]  # one shape, Detect caches grids
+
+    expected = [model(im, size=320).xyxy[0] for im in ims]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda im: model(im, size=320).xyxy[0], ims))
+    for a, b in zip(results, expected):
+        torch.testing.assert_close(a, b)
@@ -0,0 +1,122 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Tests for detect.py runs on image directories."""
+
+import os
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+import detect
+from models.yolo import Model
+
+IMAGES = ROOT / "data" / "images"
+
+
+@pytest.fixture(scope="module")
+def weights(tmp_path_factory):
+    """Saves a randomly initialized, seeded YOLOv5n checkpoint and returns its path."""
+    os.environ.setdefault("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")  # torch>=2.6 loads weights_only by default
+    torch.manual_seed(0)
+    f = tmp_path_factory.mktemp("weights") / "yolov5n-random.pt"
+    torch.save({"model": Model(ROOT / "models" / "yolov5n.yaml", nc=3).half()}, f)
+    return f
+
+
+def run_detect(weights, project, source=IMAGES, **kwargs):
+    """Runs detect.run on CPU, by default on data/images, and returns the run directory."""
+    detect.run(weights=weights, source=source, project=project, name="exp", device="cpu", nosave=True, **kwargs)
+    return Path(project) / "exp"
+
+
+def test_detect_images_prefetch(weights, tmp_path):
+    """Image-only sources through the prefetching loader write one label file per image."""
+    save_dir = run_detect(weights, tmp_path, conf_thres=0.001, prefetch=8, save_txt=True)
+    assert sorted(f.stem for f in (save_dir / "labels").glob("*.txt")) == sorted(f.stem for f in IMAGES.glob("*.jpg"))
+
+
+def read_labels(save_dir):
+    """Returns {image stem: label lines} of a --save-txt run."""
+    return {f.stem: f.read_text().splitlines() for f in (save_dir / "labels").glob("*.txt")}
+
+
+def test_detect_prefetch_matches_inline(weights, tmp_path):
+    """The prefetching loader feeds the same fused preprocessor as inline loading, so the labels are identical."""
+    kwargs = dict(conf_thres=0.001, save_txt=True, save_conf=True)
+    inline = read_labels(run_detect(weights, tmp_path / "inline", prefetch=0, **kwargs))
+    prefetch = read_labels(run_detect(weights, tmp_path / "prefetch", prefetch=8, **kwargs))
+    assert inline and prefetch == inline
+
+
+class RedBoxDetector(torch.nn.Module):
+    """Deterministic stand-in detector returning the box around pure-red pixels, so boxes depend on geometry only."""
+
+    def __init__(self):
+        """Initializes a one-class model with the attributes DetectMultiBackend reads from a checkpoint."""
+        super().__init__()
+        self.register_buffer("stride", torch.tensor([8.0, 16.0, 32.0]))
+        self.names = {0: "red"}
+
+    def forward(self, im, augment=False, visualize=False):
+        """Returns (bs, 1, 6) xywh, objectness, class confidence predictions in input pixels."""
+        r, g, b = im.float().unbind(1)
+        mask = (r > 0.8) & (g < 0.2) & (b < 0.2)
+        pred = torch.zeros((im.shape[0], 1, 6), device=im.device)
+        for i, m in enumerate(mask):
+            ys, xs = m.nonzero(as_tuple=True)
+            if len(xs):
+                x1, y1, x2, y2 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+                pred[i, 0] = torch.stack(((x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, *torch.ones(2))).float()
+        return pred
+
+
+@pytest.fixture(scope="module")
+def red_boxes(tmp_path_factory):
+    """Writes images of mixed aspect ratios with one red box each and returns (weights, source, {stem: xyxy})."""
+    os.environ.setdefault("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")
+    root = tmp_path_factory.mktemp("red_boxes")
+    torch.save({"model": RedBoxDetector()}, root / "red.pt")
+    rng = np.random.default_rng(0)
+    boxes = {}
+    for i, (h, w) in enumerate([(600, 800), (800, 600), (400, 1000), (500, 500), (360, 640), (900, 300), (720, 1280)]):
+        im = np.full((h, w, 3), 114, dtype=np.uint8)
+        x1, y1 = rng.integers(0, w // 2), rng.integers(0, h // 2)
+        x2, y2 = x1 + rng.integers(w // 8, w // 2), y1 + rng.integers(h // 8, h // 2)
+        im[y1:y2, x1:x2] = (0, 0, 255)  # BGR red
+        cv2.imwrite(str(root / f"im{i}.jpg"), im, [cv2.IMWRITE_JPEG_QUALITY, 100])
+        boxes[f"im{i}"] = (x1, y1, x2, y2)
+    return root / "red.pt", root, boxes
+
+
+def read_boxes(save_dir, source):
+    """Returns {image stem: xyxy pixel box} from a --save-txt run."""
+    boxes = {}
+    for f in (save_dir / "labels").glob("*.txt"):
+        h, w = cv2.imread(str(source / f"{f.stem}.jpg")).shape[:2]
+        _, x, y, bw, bh = np.loadtxt(f, ndmin=2)[0][:5]
+        boxes[f.stem] = np.array([(x - bw / 2) * w, (y - bh / 2) * h, (x + bw / 2) * w, (y + bh / 2) * h])
+    return boxes
+
+
+@pytest.mark.parametrize("batch_size", [2, 3, 7])
+def test_detect_batch_size_matches_unbatched(red_boxes, tmp_path, batch_size):
+    """Aspect-ratio batches give the unbatched boxes within a pixel, with CSV rows in source order."""
+    weights, source, expected = red_boxes
+    kwargs = dict(source=source, conf_thres=0.5, save_txt=True, save_csv=True)
+    single = run_detect(weights, tmp_path / "single", batch_size=1, **kwargs)
+    batched = run_detect(weights, tmp_path / "batched", batch_size=batch_size, **kwargs)
+
+    single_boxes, batched_boxes = read_boxes(single, source), read_boxes(batched, source)
+    assert sorted(single_boxes) == sorted(batched_boxes) == sorted(expected)
+    for stem, box in single_boxes.items():
+        np.testing.assert_allclose(batched_boxes[stem], box, atol=1.5)
+        np.testing.assert_allclose(box, expected[stem], atol=3)  # letterbox resampling blurs the edges
+    assert (batched / "predictions.csv").read_text() == (single / "predictions.csv").read_text()
@@ -0,0 +1,252 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Tests for the vectorized val.process_batch and ConfusionMatrix.process_batch against the loops they replaced."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from utils.metrics import ConfusionMatrix, box_iou
+from val import process_batch
+
+IOUV = torch.linspace(0.5, 0.95, 10)
+
+NC = 4
+
+
+def process_batch_loop(matrix, nc, detections, labels, conf=0.25, iou_thres=0.45):
+    """Reference ConfusionMatrix.process_batch as it was before vectorization, updating `matrix` in place; the IoU
+    sorts are pinned to a stable sort, as the default quicksort resolved exact IoU ties in arbitrary order.
+    """
+    if detections is None:
+        gt_classes = labels.int()
+        for gc in gt_classes:
+            matrix[nc, gc] += 1  # background FN
+        return
+
+    detections = detections[detections[:, 4] > conf]
+    gt_classes = labels[:, 0].int()
+    detection_classes = detections[:, 5].int()
+    iou = box_iou(labels[:, 1:], detections[:, :4])
+
+    x = torch.where(iou > iou_thres)
+    if x[0].shape[0]:
+        matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()
+        if x[0].shape[0] > 1:
+            matches = matches[matches[:, 2].argsort(kind="stable")[::-1]]
+            matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+            matches = matches[matches[:, 2].argsort(kind="stable")[::-1]]
+            matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+    else:
+        matches = np.zeros((0, 3))
+
+    n = matches.shape[0] > 0
+    m0, m1, _ = matches.transpose().astype(int)
+    for i, gc in enumerate(gt_classes):
+        j = m0 == i
+        if n and sum(j) == 1:
+            matrix[detection_classes[m1[j]], gc] += 1  # correct
+        else:
+            matrix[nc, gc] += 1  # true background
+
+    if n:
+        for i, dc in enumerate(detection_classes):
+            if not any(m1 == i):
+                matrix[dc, nc] += 1  # predicted background
+
+
+def random_batch(rng, n_labels, n_detections, jitter=20.0):
+    """Returns (detections, labels) with detections jittered around the labels plus unrelated false positives."""
+    xy = rng.uniform(0, 500, (n_labels, 2))
+    labels = np.concatenate((rng.integers(0, NC, (n_labels, 1)), xy, xy + rng.uniform(10, 150, (n_labels, 2))), 1)
+    boxes = rng.uniform(0, 500, (n_detections, 4))
+    boxes[:, 2:] = boxes[:, :2] + rng.uniform(10, 150, (n_detections, 2))
+    if n_labels:
+        near = rng.random(n_detections) < 0.7  # most detections land near some label
+        boxes[near] = labels[rng.integers(0, n_labels, near.sum()), 1:] + rng.normal(0, jitter, (near.sum(), 4))
+    detections = np.concatenate(
+        (boxes, rng.uniform(0, 1, (n_detections, 1)), rng.integers(0, NC, (n_detections, 1))), 1)
+    return torch.tensor(detections, dtype=torch.float32), torch.tensor(labels, dtype=torch.float32)
+
+
+def compare(batches):
+    """Runs both implementations over the same (detections, labels) batches and asserts identical matrices."""
+    expected = np.zeros((NC + 1, NC + 1))
+    cm = ConfusionMatrix(nc=NC)
+    for detections, labels in batches:
+        process_batch_loop(expected, NC, detections, labels)
+        cm.process_batch(detections, labels)
+    np.testing.assert_array_equal(cm.matrix, expected)
+    return expected
+
+
+@pytest.mark.parametrize("grid", [0, 25])
+@pytest.mark.parametrize("seed", range(20))
+def test_confusion_matrix_random(seed, grid):
+    """Random batches, from empty to crowded, accumulate into the same matrix as the loop; snapping the boxes to a
+    coarse grid makes exact IoU ties between labels and detections common.
+    """
+    rng = np.random.default_rng(seed)
+    batches = [random_batch(rng, *rng.integers(0, 30, 2)) for _ in range(10)]
+    if grid:
+        for detections, labels in batches:
+            detections[:, :4] = (detections[:, :4] / grid).round() * grid
+            labels[:, 1:] = (labels[:, 1:] / grid).round() * grid
+    compare(batches)
+
+
+@pytest.mark.parametrize("device", ["cpu", pytest.param("cuda", marks=pytest.mark.skipif(
+    not torch.cuda.is_available(), reason="CUDA unavailable"))])
+def test_confusion_matrix_device_counts(device):
+    """Counts accumulated on device without host syncs fold into the same matrix as the loop."""
+    rng = np.random.default_rng(0)
+    batches = [random_batch(rng, 12, 20) for _ in range(5)]
+    expected = compare(batches)
+    cm = ConfusionMatrix(nc=NC, device=device)
+    for detections, labels in batches:
+        cm.process_batch(detections.to(device), labels.to(device))
+    np.testing.assert_array_equal(cm.matrix, expected)
+
+
+def test_confusion_matrix_no_labels():
+    """Detections without labels count nothing, as unmatched detections only count once something matched."""
+    detections, _ = random_batch(np.random.default_rng(0), 5, 10)
+    matrix = compare([(detections, torch.zeros((0, 5)))])
+    assert not matrix.any()
+
+
+def test_confusion_matrix_no_detections():
+    """Labels without detections, or with all detections below conf, are background FNs in the last row."""
+    rng = np.random.default_rng(1)
+    detections, labels = random_batch(rng, 8, 6)
+    detections[:, 4] = 0.1  # all below conf
+    matrix = compare([
+        (torch.zeros((0, 6)), labels),
+        (detections, labels),
+        (None, labels[:, 0]),  # val.py passes only the classes when a batch image has no predictions
+    ])
+    np.testing.assert_array_equal(matrix[NC, :NC], 3 * np.bincount(labels[:, 0].int(), minlength=NC))
+    assert matrix[:NC].sum() == 0
+
+
+def test_confusion_matrix_empty():
+    """Images with neither labels nor detections leave the matrix untouched."""
+    assert not compare([(torch.zeros((0, 6)), torch.zeros((0, 5))), (None, torch.zeros(0))]).any()
+
+
+def test_confusion_matrix_background():
+    """An unmatched label fills the background row and an unmatched detection the background column."""
+    labels = torch.tensor([[0, 0, 0, 100, 100], [1, 300, 300, 400, 400]], dtype=torch.float32)
+    detections = torch.tensor([
+        [0, 0, 100, 100, 0.9, 0],  # matches label 0
+        [200, 0, 260, 60, 0.8, 2],  # matches nothing
+    ])
+    matrix = compare([(detections, labels)])
+    assert matrix[0, 0] == 1  # correct
+    assert matrix[NC, 1] == 1  # label 1 missed: background row
+    assert matrix[2, NC] == 1  # detection 1 spurious: background column
+    assert matrix.sum() == 3
+
+
+def test_confusion_matrix_class_mismatch():
+    """A matched detection of the wrong class lands off the diagonal, not in background."""
+    labels = torch.tensor([[1, 0, 0, 100, 100]], dtype=torch.float32)
+    detections = torch.tensor([[2, 2, 98, 98, 0.9, 3]])
+    matrix = compare([(detections, labels)])
+    assert matrix[3, 1] == 1 and matrix.sum() == 1
+
+
+def test_confusion_matrix_duplicates():
+    """Two detections on one label: the higher-IoU one matches and the other is a background FP."""
+    labels = torch.tensor([[0, 0, 0, 100, 100]], dtype=torch.float32)
+    detections = torch.tensor([[0, 0, 100, 100, 0.9, 0], [5, 5, 100, 100, 0.95, 1]])
+    matrix = compare([(detections, labels)])
+    assert matrix[0, 0] == 1 and matrix[1, NC] == 1 and matrix.sum() == 2
+
+
+@pytest.mark.parametrize("classes", [(0, 0), (0, 1)])
+def test_confusion_matrix_iou_ties_detections(classes):
+    """Two detections with exactly the same IoU on one label: one matches, the other is a background FP."""
+    labels = torch.tensor([[0, 100, 100, 200, 200]], dtype=torch.float32)
+    detections = torch.tensor([
+        [100, 100, 200, 180, 0.9, classes[0]],  # IoU 0.8, trimmed at the bottom
+        [100, 120, 200, 200, 0.8, classes[1]],  # IoU 0.8, trimmed at the top
+    ])
+    matrix = compare([(detections, labels)])
+    assert matrix[:NC, 0].sum() == 1 and matrix[:, NC].sum() == 1
+
+
+@pytest.mark.parametrize("classes", [(0, 0), (0, 1)])
+def test_confusion_matrix_iou_ties_labels(classes):
+    """One detection with exactly the same IoU on two labels matches one of them; the other is a background FN."""
+    labels = torch.tensor([[classes[0], 100, 100, 200, 200], [classes[1], 100, 120, 200, 220]], dtype=torch.float32)
+    detections = torch.tensor([[100, 110, 200, 210, 0.9, 0]])  # IoU 9/11 with both
+    matrix = compare([(detections, labels)])
+    assert matrix[0].sum() == 1 and matrix[NC].sum() == 1
+
+
+def test_confusion_matrix_iou_threshold():
+    """An IoU exactly at the threshold does not match, on either side."""
+    labels = torch.tensor([[0, 0, 0, 100, 100]], dtype=torch.float32)
+    detections = torch.tensor([[0, 0, 100, 45, 0.9, 0]])  # IoU 0.45 == iou_thres
+    matrix = compare([(detections, labels)])
+    assert matrix[NC, 0] == 1 and matrix.sum() == 1
+
+
+def process_batch_thresholds_loop(detections, labels, iouv):
+    """Reference val.process_batch as it was before vectorization, one IoU threshold at a time, with the IoU sort
+    pinned to a stable sort like process_batch_loop.
+    """
+    correct = np.zeros((detections.shape[0], iouv.shape[0])).astype(bool)
+    iou = box_iou(labels[:, 1:], detections[:, :4])
+    correct_class = labels[:, 0:1] == detections[:, 5]
+    for i in range(len(iouv)):
+        x = torch.where((iou >= iouv[i]) & correct_class)  # IoU > threshold and classes match
+        if x[0].shape[0]:
+            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()  # [label, detect, iou]
+            if x[0].shape[0] > 1:
+                matches = matches[matches[:, 2].argsort(kind="stable")[::-1]]
+                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+            correct[matches[:, 1].astype(int), i] = True
+    return torch.tensor(correct, dtype=torch.bool)
+
+
+@pytest.mark.parametrize("grid", [0, 5, 25])
+@pytest.mark.parametrize("seed", range(50))
+def test_val_process_batch_random(seed, grid):
+    """The vectorized matching gives the loop's correct matrix at every IoU threshold, including on the exact IoU ties
+    that snapping boxes to a grid produces.
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(10):
+        detections, labels = random_batch(rng, *rng.integers(0, 30, 2), jitter=5.0)
+        if grid:
+            detections[:, :4] = (detections[:, :4] / grid).round() * grid
+            labels[:, 1:] = (labels[:, 1:] / grid).round() * grid
+        torch.testing.assert_close(process_batch(detections, labels, IOUV),
+                                   process_batch_thresholds_loop(detections, labels, IOUV))
+
+
+def test_val_process_batch_iou_ties():
+    """A detection with exactly the same IoU on two same-class labels counts once, as a match of the later label."""
+    labels = torch.tensor([[0, 100, 100, 200, 200], [0, 100, 120, 200, 220]], dtype=torch.float32)
+    detections = torch.tensor([[100, 110, 200, 210, 0.9, 0], [100, 100, 200, 200, 0.8, 0]])  # IoU 9/11 with both
+    correct = process_batch(detections, labels, IOUV)
+    torch.testing.assert_close(correct, process_batch_thresholds_loop(detections, labels, IOUV))
+    assert correct[1].all()  # the exact match of label 0 stays correct, label 1 went to detection 0
+    assert correct[0].sum() == (IOUV <= 9 / 11).sum()
+
+
+def test_val_process_batch_empty():
+    """No detections or no labels give an all-False (n, 10) matrix."""
+    detections, labels = random_batch(np.random.default_rng(0), 4, 6)
+    assert process_batch(detections[:0], labels, IOUV).shape == (0, 10)
+    assert not process_batch(detections, labels[:0], IOUV).any()
@@ -0,0 +1,137 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Tests for batched_non_max_suppression and the topk/stats options against the per-image non_max_suppression loop."""
+
+import sys
+from pathlib import Path
+
+import pytest
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from utils.general import grouped_topk, non_max_suppression
+
+NC = 5
+
+
+def random_prediction(seed, bs=4, na=400, nc=NC, one_hot=False):
+    """Returns a random (bs, na, 5 + nc) raw prediction of clustered, overlapping boxes in a 160x160 image."""
+    g = torch.Generator().manual_seed(seed)
+    xy = torch.randint(0, 8, (bs, na, 2), generator=g) * 20.0 + torch.rand(bs, na, 2, generator=g) * 8
+    wh = 10 + torch.rand(bs, na, 2, generator=g) * 30
+    obj = torch.rand(bs, na, 1, generator=g)
+    if one_hot:  # conf == obj, so candidates rank the same by objectness and by confidence
+        cls = torch.nn.functional.one_hot(torch.randint(0, nc, (bs, na), generator=g), nc).float()
+    else:
+        cls = torch.rand(bs, na, nc, generator=g)
+    if bs > 1:
+        obj[1] *= 0.2  # a sparse image, mostly below conf_thres
+    return torch.cat((xy, wh, obj, cls), 2)
+
+
+def canonical(x):
+    """Orders detections by confidence, then by box and class: neither NMS defines the order of equal confidences."""
+    for col in (5, 3, 2, 1, 0):
+        x = x[x[:, col].argsort(stable=True)]
+    return x[x[:, 4].argsort(descending=True, stable=True)]
+
+
+def assert_same_detections(a, b):
+    """Asserts two per-image detection lists are equal, including the confidence order of the rows."""
+    assert len(a) == len(b)
+    for xa, xb in zip(a, b):
+        torch.testing.assert_close(canonical(xa), canonical(xb))
+
+
+@pytest.mark.parametrize("agnostic", [False, True])
+@pytest.mark.parametrize("multi_label", [False, True])
+@pytest.mark.parametrize("classes", [None, [1, 3]])
+@pytest.mark.parametrize("max_det", [300, 7])
+def test_batched_matches_loop(agnostic, multi_label, classes, max_det):
+    for seed in range(5):
+        prediction = random_prediction(seed)
+        kwargs = dict(conf_thres=0.25, iou_thres=0.45, classes=classes, agnostic=agnostic, multi_label=multi_label)
+        expected = non_max_suppression(prediction.clone(), max_det=max_det, **kwargs)
+        if max_det == 7:
+            assert max(len(x) for x in expected) == 7  # truncation is exercised
+        output = non_max_suppression(prediction.clone(), max_det=max_det, batched=True, **kwargs)
+        assert_same_detections(output, expected)
+
+
+def test_batched_matches_loop_empty():
+    prediction = random_prediction(0)
+    prediction[..., 4] = 0.1  # no candidates in any image
+    expected = non_max_suppression(prediction.clone())
+    assert_same_detections(non_max_suppression(prediction.clone(), batched=True), expected)
+    assert all(x.shape == (0, 6) for x in expected)
+
+
+def test_grouped_topk():
+    g = torch.tensor([1, 0, 1, 1, 0, 2])
+    scores = torch.tensor([0.5, 0.9, 0.7, 0.6, 0.3, 0.1])
+    assert grouped_topk(g, scores, 2, 4).tolist() == [1, 4, 2, 3, 5]
+    assert grouped_topk(g, scores, 1, 4).tolist() == [1, 2, 5]
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_topk_keeps_final_boxes(batched):
+    """topk changes nothing as long as every final box ranks within the topk candidates of its image."""
+    for seed in range(5):
+        prediction = random_prediction(seed, one_hot=True)
+        expected = non_max_suppression(prediction.clone(), max_det=20, batched=batched)
+
+        k = 1
+        for xi, x in enumerate(expected):  # the lowest objectness rank of a final box, over all images
+            obj = prediction[xi, :, 4].sort(descending=True).values
+            k = max([k] + [int((obj > conf).sum()) + 1 for conf in x[:, 4]])
+        assert k < (prediction[..., 4] > 0.25).sum(1).max()  # topk does drop candidates
+        output = non_max_suppression(prediction.clone(), max_det=20, batched=batched, topk=k)
+        assert_same_detections(output, expected)
+
+
+def expected_stats(prediction, conf_thres, classes=None, topk=None):
+    """Counts the candidates surviving each non_max_suppression() filter with plain per-image tensor ops."""
+    stats = dict(anchors=prediction.shape[0] * prediction.shape[1], obj=0, topk=0, conf=0, classes=0)
+    for x in prediction:
+        x = x[x[:, 4] > conf_thres]
+        stats["obj"] += len(x)
+        if topk:
+            x = x[x[:, 4].argsort(descending=True)[:topk]]
+        stats["topk"] += len(x)
+        conf, j = (x[:, 5:] * x[:, 4:5]).max(1)
+        j = j[conf > conf_thres]
+        stats["conf"] += len(j)
+        if classes is not None:
+            j = j[torch.isin(j, torch.tensor(classes))]
+        if topk:
+            j = torch.minimum(torch.bincount(j, minlength=NC), torch.tensor(topk))
+        stats["classes"] += int(j.sum()) if topk else len(j)
+    return stats
+
+
+@pytest.mark.parametrize("batched", [False, True])
+@pytest.mark.parametrize("classes", [None, [0, 2]])
+@pytest.mark.parametrize("topk", [None, 40])
+def test_nms_stats(batched, classes, topk):
+    prediction = random_prediction(0)
+    stats = {}
+    output = non_max_suppression(prediction.clone(), classes=classes, batched=batched, topk=topk, stats=stats)
+    nms = stats.pop("nms")
+    assert nms == sum(len(x) for x in output)
+    assert stats == expected_stats(prediction, 0.25, classes, topk)
+    assert stats["anchors"] > stats["obj"] >= stats["topk"] >= stats["conf"] >= stats["classes"] >= nms > 0
+
+
+def test_nms_stats_accumulate():
+    """Stats add up over calls, i.e. over the batches of a val run, and batched and loop NMS count alike."""
+    prediction = random_prediction(1)
+    loop, batched = {}, {}
+    for _ in range(2):
+        non_max_suppression(prediction.clone(), topk=40, stats=loop)
+        non_max_suppression(prediction.clone(), topk=40, stats=batched, batched=True)
+    assert loop == batched
+    single = expected_stats(prediction, 0.25, topk=40)
+    assert all(loop[k] == 2 * n for k, n in single.items())
@@ -0,0 +1,157 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Tests for the buffered result sinks, the OrderedRows reordering and the AsyncWriter threads."""
+
+import csv
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[1]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+
+from utils.sinks import AsyncWriter, CSVSink, JSONLSink, OrderedRows, ParquetSink, ResultSink
+
+ROWS = [{"image": "a.jpg", "class": "person", "conf": 0.9134}, {"image": "b.jpg", "class": "dog", "conf": 0.5}]
+
+
+class ListSink:
+    """Collects written rows in memory."""
+
+    def __init__(self):
+        """Initializes an empty row list."""
+        self.rows = []
+
+    def write(self, row):
+        """Appends one row."""
+        self.rows.append(row)
+
+
+def read_csv(path):
+    """Returns the rows of a CSV file as lists of strings."""
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_result_sink_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        ResultSink(tmp_path / "out.txt")
+
+
+def test_csv_sink_new_file(tmp_path):
+    path = tmp_path / "sub" / "predictions.csv"
+    with CSVSink(path, buffer_size=1) as sink:
+        for row in ROWS:
+            sink.write(row)
+    assert read_csv(path) == [["image", "class", "conf"], ["a.jpg", "person", "0.91"], ["b.jpg", "dog", "0.50"]]
+
+
+def test_csv_sink_empty_and_existing_file(tmp_path):
+    """An empty file still gets a header, a file with rows is appended to without a second header."""
+    path = tmp_path / "predictions.csv"
+    path.touch()
+    with CSVSink(path) as sink:
+        sink.write(ROWS[0])
+    with CSVSink(path) as sink:
+        sink.write(ROWS[1])
+    assert read_csv(path) == [["image", "class", "conf"], ["a.jpg", "person", "0.91"], ["b.jpg", "dog", "0.50"]]
+
+
+def test_csv_sink_buffers_until_flush(tmp_path):
+    path = tmp_path / "predictions.csv"
+    sink = CSVSink(path, buffer_size=3)
+    sink.write(ROWS[0])
+    assert not path.exists()
+    sink.flush()
+    assert len(read_csv(path)) == 2
+    sink.close()
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / "predictions.jsonl"
+    with JSONLSink(path, buffer_size=1) as sink:
+        for row in ROWS:
+            sink.write(row)
+    assert [json.loads(line) for line in path.read_text().splitlines()] == ROWS
+
+
+def test_parquet_sink(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "predictions.parquet"
+    with ParquetSink(path, buffer_size=1) as sink:
+        for row in ROWS:
+            sink.write(row)
+    assert pq.read_table(path).to_pylist() == ROWS
+
+
+def test_ordered_rows_reorders():
+    sink = ListSink()
+    ordered = OrderedRows(sink)
+    ordered.write(1, ["b"])
+    ordered.write(2, ["c1", "c2"])
+    assert sink.rows == []
+    ordered.write(0, ["a"])
+    assert sink.rows == ["a", "b", "c1", "c2"]
+    ordered.write(1, ["b2"])  # a past index, i.e. a further video frame, writes through
+    ordered.write(None, ["x"])
+    assert sink.rows == ["a", "b", "c1", "c2", "b2", "x"]
+
+
+def test_ordered_rows_close_writes_held_back_rows():
+    """Rows waiting on an item that never arrives are written in index order on close()."""
+    sink = ListSink()
+    ordered = OrderedRows(sink)
+    ordered.write(3, ["d"])
+    ordered.write(2, ["c"])
+    ordered.write(0, ["a"])
+    assert sink.rows == ["a"]
+    ordered.close()
+    assert sink.rows == ["a", "c", "d"]
+    assert not ordered.pending
+
+
+def test_async_writer_key_order():
+    """Jobs sharing a key run in submission order, also when earlier ones are slower."""
+    done = {"a": [], "b": []}
+    writer = AsyncWriter(workers=4, maxsize=2)
+    for i in range(20):
+        for key in done:
+            writer.submit(lambda k, i: (time.sleep(0.002 * (i % 3)), done[k].append(i)), key, i, key=key)
+    writer.close()
+    assert done == {"a": list(range(20)), "b": list(range(20))}
+    assert writer.jobs == 40
+
+
+def test_async_writer_error_raised_on_submit():
+    """A job error is re-raised by the next submit() on the calling thread."""
+    writer = AsyncWriter(workers=1)
+    ran = threading.Event()
+    writer.submit(lambda: 1 / 0)
+    writer.submit(ran.set)  # one thread, so this runs after the failed job
+    assert ran.wait(5)
+    with pytest.raises(ZeroDivisionError):
+        writer.submit(print)
+    writer.close()  # the error was already raised once
+
+
+def test_async_writer_error_raised_on_close():
+    writer = AsyncWriter(workers=2)
+    writer.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        writer.close()
+
+
+def test_async_writer_inline():
+    """workers=0 runs jobs on the calling thread, so errors surface from submit() itself."""
+    calls = []
+    writer = AsyncWriter(workers=0)
+    writer.submit(calls.append, 1)
+    with pytest.raises(ZeroDivisionError):
+        writer.submit(lambda: 1 / 0)
+    writer.close()
+    assert calls == [1]
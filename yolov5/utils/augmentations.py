@@ -1,12 +1,14 @@
 # YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
 """Image augmentation functions."""
 
+import contextlib
 import math
 import random
 
 import cv2
 import numpy as np
 import torch
+import torch.nn.functional as F
 import torchvision.transforms as T
 import torchvision.transforms.functional as TF
 
@@ -121,6 +123,18 @@ def replicate(im, labels):
 def letterbox(im, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
     """Resizes and pads image to new_shape with stride-multiple constraints, returns resized image, ratio, padding."""
     shape = im.shape[:2]  # current shape [height, width]
+    _, new_unpad, ratio, (dw, dh), (top, bottom, left, right) = letterbox_geometry(
+        shape, new_shape, auto, scaleFill, scaleup, stride
+    )
+
+    if shape[::-1] != new_unpad:  # resize
+        im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
+    im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)  # add border
+    return im, ratio, (dw, dh)
+
+
+def letterbox_geometry(shape, new_shape=(640, 640), auto=True, scaleFill=False, scaleup=True, stride=32):
+    """Computes letterbox() output shape (h, w), resized shape (w, h), ratio, padding (dw, dh) and border sizes."""
     if isinstance(new_shape, int):
         new_shape = (new_shape, new_shape)
 
@@ -143,12 +157,153 @@ def letterbox(im, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleF
     dw /= 2  # divide padding into 2 sides
     dh /= 2
 
-    if shape[::-1] != new_unpad:  # resize
-        im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
     top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
     left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
-    im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)  # add border
-    return im, ratio, (dw, dh)
+    out_shape = new_unpad[1] + top + bottom, new_unpad[0] + left + right
+    return out_shape, new_unpad, ratio, (dw, dh), (top, bottom, left, right)
+
+
+def fill_border(out, border, value):
+    """Fills the letterbox border (top, bottom, left, right) of a CHW array/tensor with per-channel values."""
+    top, bottom, left, right = border
+    h, w = out.shape[1:]
+    rows = out[:, top : h - bottom]
+    for region in (out[:, :top], out[:, h - bottom :], rows[:, :, :left], rows[:, :, w - right :]):
+        region[:] = value
+
+
+def letterbox_into(im, out, geometry, color=(114, 114, 114), bgr2rgb=True):
+    """
+    Fused letterbox, BGR to RGB, HWC to CHW and 0-255 to 0.0-1.0 on CPU, written straight into out (a CHW float array
+    or CPU tensor, optionally pinned, shaped by letterbox_geometry()).
+
+    Only the resize allocates; channel swap, transpose and normalization are done by one ufunc pass into out.
+    """
+    _, new_unpad, _, _, (top, bottom, left, right) = geometry
+    out = out.numpy() if isinstance(out, torch.Tensor) else out
+    if im.shape[1::-1] != new_unpad:  # resize
+        im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
+
+    color = np.array(color[::-1] if bgr2rgb else color, dtype=np.float32).reshape(3, 1, 1) / 255
+    fill_border(out, (top, bottom, left, right), color)
+    im = (im[..., ::-1] if bgr2rgb else im).transpose((2, 0, 1))  # views, no copy
+    np.divide(im, np.float32(255), out=out[:, top : top + new_unpad[1], left : left + new_unpad[0]], dtype=np.float32)
+    return out
+
+
+def letterbox_into_torch(im, out, geometry, color=(114, 114, 114), bgr2rgb=True):
+    """
+    Device version of letterbox_into(): the uint8 HWC image is uploaded once and resized, channel-swapped and
+    normalized on out.device. Bilinear resize matches cv2.INTER_LINEAR up to rounding.
+    """
+    _, new_unpad, _, _, (top, bottom, left, right) = geometry
+    w, h = new_unpad
+    im = torch.from_numpy(np.ascontiguousarray(im)) if isinstance(im, np.ndarray) else im
+    im = im.to(out.device, non_blocking=True).permute(2, 0, 1)  # HWC to CHW
+    im = (im.flip(0) if bgr2rgb else im)[None].to(torch.float32 if out.device.type == "cpu" else out.dtype)
+    if im.shape[2:] != (h, w):  # resize
+        im = F.interpolate(im, size=(h, w), mode="bilinear", align_corners=False)
+
+    color = torch.tensor(color[::-1] if bgr2rgb else color, dtype=out.dtype, device=out.device).view(3, 1, 1) / 255
+    fill_border(out, (top, bottom, left, right), color)
+    out[:, top : top + h, left : left + w] = im[0].div_(255)
+    return out
+
+
+class LetterboxPreprocessor:
+    # YOLOv5 fused preprocessing class, letterboxes images into reusable (optionally pinned) model input tensors
+    def __init__(
+        self,
+        img_size=640,
+        stride=32,
+        auto=True,
+        scaleup=True,
+        color=(114, 114, 114),
+        bgr2rgb=True,
+        device="cpu",
+        half=False,
+        pin_memory=False,
+        on_device=False,
+        pool=None,
+        stages=None,
+    ):
+        """
+        Initializes the preprocessor; on_device=True resizes on the inference device instead of with OpenCV on CPU.
+        With a BufferPool (e.g. DetectMultiBackend.io_pool) the input tensors come from the pool the model reads from.
+        `stages(name)` returns a context manager timing the "letterbox" and "h2d" stages, i.e. for a stage profiler.
+
+        The returned tensors are reused by the next call, consume them (forward pass) before preprocessing again.
+        """
+        self.img_size = img_size
+        self.stride = stride
+        self.auto = auto
+        self.scaleup = scaleup
+        self.color = color
+        self.bgr2rgb = bgr2rgb
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if half else torch.float32
+        self.on_device = on_device and self.device.type != "cpu"
+        self.pin_memory = pin_memory and self.device.type == "cuda"
+        self.pool = pool
+        self.buffers = {}  # device type -> flat tensor, grown to the largest input seen, when there is no pool
+        self.copy_done = None  # CUDA event, host buffers are only rewritten once their upload has completed
+        self.stages = stages or (lambda name: contextlib.nullcontext())
+
+    def buffer(self, shape, device):
+        """Returns a (bs, 3, h, w) view of the preallocated input tensor on a device, growing it when too small."""
+        pin = self.pin_memory and device.type == "cpu"
+        if self.pool is not None:
+            tag = "input" if device == self.device else "staging"  # the input tag is what the model reads in place
+            return self.pool.get((shape[0], 3, *shape[1:]), self.dtype, device, pin_memory=pin, tag=tag)
+
+        n = math.prod(shape) * 3
+        buf = self.buffers.get(device.type)
+        if buf is None or buf.numel() < n:
+            buf = self.buffers[device.type] = torch.empty(n, dtype=self.dtype, device=device, pin_memory=pin)
+        return buf[:n].view(shape[0], 3, *shape[1:])
+
+    def geometry(self, im, new_shape, auto):
+        """Returns the letterbox_geometry() of an HWC image."""
+        return letterbox_geometry(im.shape[:2], new_shape, auto, False, self.scaleup, self.stride)
+
+    def __call__(self, ims, new_shape=None):
+        """Preprocesses an HWC image, or a list of them, into a (bs, 3, h, w) normalized input tensor on device."""
+        ims = ims if isinstance(ims, (list, tuple)) else [ims]
+        new_shape = new_shape or self.img_size
+        geometries = [self.geometry(im, new_shape, self.auto) for im in ims]
+        if len({g[0] for g in geometries}) > 1:  # minimum rectangles differ, letterbox the batch to new_shape instead
+            geometries = [self.geometry(im, new_shape, False) for im in ims]
+        shape = (len(ims), *geometries[0][0])
+
+        if self.on_device:
+            x = self.buffer(shape, self.device)
+            with self.stages("letterbox"):  # includes the per-image uploads
+                for xi, im, g in zip(x, ims, geometries):
+                    letterbox_into_torch(im, xi, g, self.color, self.bgr2rgb)
+            return x
+
+        host = self.buffer(shape, torch.device("cpu"))
+        if self.copy_done is not None:
+            self.copy_done.synchronize()
+        with self.stages("letterbox"):
+            for xi, im, g in zip(host, ims, geometries):
+                letterbox_into(im, xi, g, self.color, self.bgr2rgb)
+        if self.device.type == "cpu":
+            return host
+
+        x = self.buffer(shape, self.device)
+        with self.stages("h2d"):  # only the enqueue when pinned, the copy itself overlaps the next stages
+            x.copy_(host, non_blocking=self.pin_memory)
+            if self.pin_memory:
+                self.copy_done = torch.cuda.Event()
+                self.copy_done.record()
+        return x
+
+    def normalize(self, im):
+        """Fused uint8 to fp16/32 and 0-255 to 0.0-1.0 of an already letterboxed (bs, 3, h, w) uint8 batch."""
+        im = im.to(self.device, non_blocking=True)
+        x = self.buffer(im.shape[:1] + im.shape[2:], self.device)
+        return torch.div(im, 255, out=x)
 
 
 def random_perspective(
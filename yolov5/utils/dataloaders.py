@@ -7,9 +7,13 @@ import hashlib
 import json
 import math
 import os
+import queue
 import random
 import shutil
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from itertools import repeat
 from multiprocessing.pool import Pool, ThreadPool
 from pathlib import Path
@@ -426,6 +430,177 @@ class LoadImages:
         return self.nf  # number of files
 
 
+class LoadImagesPrefetch(LoadImages):
+    # YOLOv5 prefetching image/video dataloader, i.e. `python detect.py --source dir/ --prefetch 8`
+    def __init__(
+        self,
+        path,
+        img_size=640,
+        stride=32,
+        auto=True,
+        transforms=None,
+        vid_stride=1,
+        batch_size=1,
+        prefetch=8,
+        workers=None,
+        preprocessor=None,
+    ):
+        """
+        Initializes the loader; images are read and letterboxed by a thread pool up to prefetch items ahead, while each
+        video is decoded by its own thread into a bounded queue.
+
+        With a fused LetterboxPreprocessor the threads only decode, and each batch is letterboxed and normalized by the
+        preprocessor on the consuming thread, straight into its reused (pinned/pooled) input tensor. It is not
+        thread-safe, which is why it does not run on the loader threads.
+
+        With batch_size > 1 images are grouped by aspect ratio into batches letterboxed to a shared rectangular shape,
+        as in --rect validation, so each image keeps the scale it gets unbatched and only its padding differs.
+
+        Yields (paths, im, im0s, vid_cap, s) like LoadStreams, im being a (bs, 3, h, w) uint8 batch. transforms, if
+        given, runs on the worker threads and must be thread-safe.
+        """
+        super().__init__(path, img_size, stride, auto, transforms, vid_stride)
+        if self.cap:
+            self.cap.release()  # videos are reopened when reached
+        self.batch_size = max(1, batch_size)
+        self.prefetch = max(1, prefetch, self.batch_size)
+        self.workers = workers or NUM_THREADS
+        self.frame = 0  # only set by _new_video() in LoadImages, images report frame 0
+        self.preprocessor = preprocessor
+        self.order = {f: i for i, f in enumerate(self.files)}  # source index of each file, batches may regroup them
+        self.image_batches = self._group_images(self.files[: self.video_flag.count(False)])
+
+    def __iter__(self):
+        """Starts prefetching and returns the batch generator."""
+        self.count = 0
+        return self._batches()
+
+    @staticmethod
+    def _aspect_ratio(f):
+        """Returns the height/width ratio of an image from its header, 1.0 if it cannot be read."""
+        try:
+            w, h = exif_size(Image.open(f))
+            return h / w
+        except Exception:
+            return 1.0
+
+    def _group_images(self, files):
+        """Splits images into (files, shape) batches of similar aspect ratio, shape None meaning per-image letterbox."""
+        if self.batch_size == 1:
+            return [([f], None) for f in files]
+
+        ar = np.array([self._aspect_ratio(f) for f in files])
+        irect = ar.argsort(kind="stable")
+        files, ar = [files[i] for i in irect], ar[irect]
+        h, w = self.img_size if isinstance(self.img_size, (list, tuple)) else (self.img_size, self.img_size)
+        batches = []
+        for i in range(0, len(files), self.batch_size):
+            ari = ar[i : i + self.batch_size]
+            shape = [1, 1]
+            if ari.max() < 1:
+                shape = [ari.max(), 1]
+            elif ari.min() > 1:
+                shape = [1, 1 / ari.min()]
+            shape = np.ceil(np.array(shape) * h / self.stride).astype(int) * self.stride
+            batches.append((files[i : i + self.batch_size], tuple(shape.tolist()) if h == w else (h, w)))
+        return batches
+
+    def _load(self, path, shape=None):
+        """Reads and preprocesses one image, on a worker thread (OpenCV releases the GIL)."""
+        im0 = cv2.imread(path)  # BGR
+        assert im0 is not None, f"Image Not Found {path}"
+        return im0, None if self.preprocessor else self._preprocess(im0, shape)
+
+    def _preprocess(self, im0, shape=None):
+        """Applies transforms, or letterbox to shape (img_size if None), HWC to CHW and BGR to RGB as in LoadImages."""
+        if self.transforms:
+            return self.transforms(im0)
+        auto = self.auto and shape is None
+        im = letterbox(im0, shape or self.img_size, stride=self.stride, auto=auto)[0]  # padded resize
+        return np.ascontiguousarray(im.transpose((2, 0, 1))[::-1])  # HWC to CHW, BGR to RGB, contiguous
+
+    @staticmethod
+    def _put(q, item, stop):
+        """Puts item into the bounded queue q, giving up once stop is set so a consumer that left cannot block us."""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_video(self, cap, q, stop):
+        """Decodes and preprocesses the frames of one video into q, on a dedicated thread, ending with None."""
+        try:
+            while not stop.is_set():
+                for _ in range(self.vid_stride):
+                    cap.grab()
+                ret_val, im0 = cap.retrieve()
+                im = None if self.preprocessor or not ret_val else self._preprocess(im0)
+                if not ret_val or not self._put(q, (im0, im), stop):
+                    break
+        finally:
+            self._put(q, None, stop)
+
+    @staticmethod
+    def _collate(ims):
+        """Stacks preprocessed images into a batch."""
+        return torch.stack(ims) if isinstance(ims[0], torch.Tensor) else np.stack(ims)
+
+    def _batch(self, ims, im0s, shape=None):
+        """Returns the input batch, from the fused preprocessor or by stacking the images preprocessed by the threads."""
+        return self.preprocessor(im0s, shape) if self.preprocessor else self._collate(ims)
+
+    def _batches(self):
+        """Yields the image batches, then the frames of each video one at a time."""
+        jobs = iter([(p, shape) for files, shape in self.image_batches for p in files])
+        batches = iter(self.image_batches)
+        videos = self.files[self.video_flag.count(False) :]
+        self.mode = "image"
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque((job[0], pool.submit(self._load, *job)) for _, job in zip(range(self.prefetch), jobs))
+            files, shape = next(batches, ((), None))
+            batch = []
+            while pending:
+                path, future = pending.popleft()
+                job = next(jobs, None)
+                if job is not None:
+                    pending.append((job[0], pool.submit(self._load, *job)))  # keep prefetch items in flight
+                self.count += 1
+                batch.append((path, *future.result()))
+                if len(batch) == len(files):
+                    paths, im0s, ims = zip(*batch)
+                    if len(batch) == 1:
+                        s = f"image {self.count}/{self.nf} {paths[0]}: "
+                    else:
+                        s = f"image {self.count - len(batch) + 1}-{self.count}/{self.nf}: "
+                    yield list(paths), self._batch(ims, list(im0s), shape), list(im0s), None, s
+                    files, shape = next(batches, ((), None))
+                    batch = []
+
+        for path in videos:
+            self.mode = "video"
+            self._new_video(path)
+            q, stop = queue.Queue(maxsize=self.prefetch), threading.Event()
+            thread = Thread(target=self._decode_video, args=(self.cap, q, stop), daemon=True)
+            thread.start()
+            try:
+                while True:
+                    item = q.get()
+                    if item is None:
+                        break
+                    self.frame += 1
+                    im0, im = item
+                    s = f"video {self.count + 1}/{self.nf} ({self.frame}/{self.frames}) {path}: "
+                    yield [path], self._batch([im], [im0]), [im0], self.cap, s
+            finally:
+                stop.set()
+                thread.join()
+                self.cap.release()
+            self.count += 1
+
+
 class LoadStreams:
     # YOLOv5 streamloader, i.e. `python detect.py --source 'rtsp://example.com/media.mp4'  # RTSP, RTMP, HTTP streams`
     def __init__(self, sources="file.streams", img_size=640, stride=32, auto=True, transforms=None, vid_stride=1):
@@ -1012,6 +1012,9 @@ def non_max_suppression(
     labels=(),
     max_det=300,
     nm=0,  # number of masks
+    batched=False,  # one NMS call for the whole batch, no time limit
+    topk=None,  # keep at most topk candidates per image by objectness, and per image and class by conf
+    stats=None,  # optional dict, accumulates how many candidates survive each filter
 ):
     """
     Non-Maximum Suppression (NMS) on inference results to reject overlapping detections.
@@ -1025,6 +1028,10 @@ def non_max_suppression(
     assert 0 <= iou_thres <= 1, f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
     if isinstance(prediction, (list, tuple)):  # YOLOv5 model in validation model, output = (inference_out, loss_out)
         prediction = prediction[0]  # select only inference output
+    if batched:
+        return batched_non_max_suppression(
+            prediction, conf_thres, iou_thres, classes, agnostic, multi_label, labels, max_det, nm, topk, stats
+        )
 
     device = prediction.device
     mps = "mps" in device.type  # Apple MPS
@@ -1033,6 +1040,9 @@ def non_max_suppression(
     bs = prediction.shape[0]  # batch size
     nc = prediction.shape[2] - nm - 5  # number of classes
     xc = prediction[..., 4] > conf_thres  # candidates
+    count_nms_stats(stats, anchors=xc.numel(), obj=int(xc.sum()) if stats is not None else 0)
+    if not labels and not xc.any():  # fast path, nothing to suppress (sparse scenes)
+        return [torch.zeros((0, 6 + nm), device=device)] * bs
 
     # Settings
     # min_wh = 2  # (pixels) minimum box width and height
@@ -1050,6 +1060,9 @@ def non_max_suppression(
         # Apply constraints
         # x[((x[..., 2:4] < min_wh) | (x[..., 2:4] > max_wh)).any(1), 4] = 0  # width-height
         x = x[xc[xi]]  # confidence
+        if topk and x.shape[0] > topk:  # pre-select by objectness before any box math
+            x = x[x[:, 4].topk(topk).indices]
+        count_nms_stats(stats, topk=x.shape[0])
 
         # Cat apriori labels if autolabelling
         if labels and len(labels[xi]):
@@ -1079,9 +1092,14 @@ def non_max_suppression(
             conf, j = x[:, 5:mi].max(1, keepdim=True)
             x = torch.cat((box, conf, j.float(), mask), 1)[conf.view(-1) > conf_thres]
 
+        count_nms_stats(stats, conf=x.shape[0])
+
         # Filter by class
         if classes is not None:
             x = x[(x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)]
+        if topk and x.shape[0] > topk:  # keep the topk most confident boxes of each class
+            x = x[grouped_topk(x[:, 5].long(), x[:, 4], topk, nc)]
+        count_nms_stats(stats, classes=x.shape[0])
 
         # Apply finite constraint
         # if not torch.isfinite(x).all():
@@ -1107,6 +1125,7 @@ def non_max_suppression(
                 i = i[iou.sum(1) > 1]  # require redundancy
 
         output[xi] = x[i]
+        count_nms_stats(stats, nms=len(i))
         if mps:
             output[xi] = output[xi].to(device)
         if (time.time() - t) > time_limit:
@@ -1116,6 +1135,113 @@ def non_max_suppression(
     return output
 
 
+def batched_non_max_suppression(
+    prediction,
+    conf_thres=0.25,
+    iou_thres=0.45,
+    classes=None,
+    agnostic=False,
+    multi_label=False,
+    labels=(),
+    max_det=300,
+    nm=0,  # number of masks
+    topk=None,  # keep at most topk candidates per image by objectness, and per image and class by conf
+    stats=None,  # optional dict, accumulates how many candidates survive each filter
+):
+    """
+    Vectorized non_max_suppression() for a whole batch: candidates of all images are filtered together and suppressed
+    by a single torchvision batched_nms() call grouped by image index and class, so no image is dropped by a time limit.
+
+    Returns:
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls]
+    """
+    device = prediction.device
+    mps = "mps" in device.type  # Apple MPS
+    if mps:  # MPS not fully supported yet, convert tensors to CPU before NMS
+        prediction = prediction.cpu()
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - nm - 5  # number of classes
+    mi = 5 + nc  # mask start index
+    max_nms = 30000  # maximum number of boxes per image into torchvision.ops.batched_nms()
+    multi_label &= nc > 1  # multiple labels per box
+
+    # Candidates of every image, b is the image index of each row
+    b, a = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    count_nms_stats(stats, anchors=prediction.shape[0] * prediction.shape[1], obj=len(b))
+    if not len(b) and not (labels and any(len(lb) for lb in labels)):  # fast path, nothing to suppress
+        return [torch.zeros((0, 6 + nm), device=device) for _ in range(bs)]
+    if topk:  # pre-select by objectness before any box math
+        i = grouped_topk(b, prediction[b, a, 4], topk, bs)
+        b, a = b[i], a[i]
+    count_nms_stats(stats, topk=len(b))
+    x = prediction[b, a]
+
+    # Cat apriori labels if autolabelling
+    if labels and any(len(lb) for lb in labels):
+        lb = torch.cat([lb for lb in labels if len(lb)]).to(x.device)
+        v = torch.zeros((len(lb), nc + nm + 5), device=x.device)
+        v[:, :4] = lb[:, 1:5]  # box
+        v[:, 4] = 1.0  # conf
+        v[range(len(lb)), lb[:, 0].long() + 5] = 1.0  # cls
+        x = torch.cat((x, v), 0)
+        lb_b = [torch.full((len(lb),), xi, dtype=torch.long, device=x.device) for xi, lb in enumerate(labels)]
+        b = torch.cat((b, *lb_b))
+
+    # Compute conf
+    x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
+
+    # Detections matrix nx6 (xyxy, conf, cls)
+    box = xywh2xyxy(x[:, :4])  # center_x, center_y, width, height) to (x1, y1, x2, y2)
+    mask = x[:, mi:]  # zero columns if no masks
+    if multi_label:
+        i, j = (x[:, 5:mi] > conf_thres).nonzero(as_tuple=False).T
+        x, b = torch.cat((box[i], x[i, 5 + j, None], j[:, None].float(), mask[i]), 1), b[i]
+    else:  # best class only
+        conf, j = x[:, 5:mi].max(1, keepdim=True)
+        i = conf.view(-1) > conf_thres
+        x, b = torch.cat((box, conf, j.float(), mask), 1)[i], b[i]
+    count_nms_stats(stats, conf=len(b))
+
+    # Filter by class
+    if classes is not None:
+        i = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+        x, b = x[i], b[i]
+    if topk:  # keep the topk most confident boxes of each image and class
+        i = grouped_topk(b * nc + x[:, 5].long(), x[:, 4], topk, bs * nc)
+        x, b = x[i], b[i]
+    count_nms_stats(stats, classes=len(b))
+
+    # Sort by image, then by confidence, and remove each image's excess boxes
+    i = grouped_topk(b, x[:, 4], max_nms, bs)
+    x, b = x[i], b[i]
+
+    # Batched NMS, boxes only suppress boxes of the same image (and class)
+    groups = b if agnostic else b * nc + x[:, 5].long()
+    i = torchvision.ops.batched_nms(x[:, :4], x[:, 4], groups, iou_thres)
+    i = i[grouped_topk(b[i], x[i, 4], max_det, bs)]  # limit detections
+    count_nms_stats(stats, nms=len(i))
+
+    output = list(x[i].split(torch.bincount(b[i], minlength=bs).tolist()))
+    if mps:
+        output = [xi.to(device) for xi in output]
+    return output
+
+
+def grouped_topk(g, scores, k, ng):
+    """Returns the indices of the k highest scores of each group (e.g. image), ordered by group then by score."""
+    i = (g.double() * 2 - scores.double()).argsort()  # scores are in [0, 1], so groups never interleave
+    counts = torch.bincount(g, minlength=ng)
+    rank = torch.arange(len(i), device=g.device) - (counts.cumsum(0) - counts)[g[i]]
+    return i[rank < k]
+
+
+def count_nms_stats(stats, **counts):
+    """Adds candidate counts to a non_max_suppression() stats dict, e.g. {'anchors': n, 'obj': n, ..., 'nms': n}."""
+    if stats is not None:
+        for k, n in counts.items():
+            stats[k] = stats.get(k, 0) + int(n)
+
+
 def strip_optimizer(f="best.pt", s=""):
     """
     Strips optimizer and optionally saves checkpoint to finalize training; arguments are file path 'f' and save path
@@ -26,7 +26,9 @@ def smooth(y, f=0.05):
     return np.convolve(yp, np.ones(nf) / nf, mode="valid")  # y-smoothed
 
 
-def ap_per_class(tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names=(), eps=1e-16, prefix=""):
+def ap_per_class(
+    tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names=(), eps=1e-16, prefix="", n=None, nt=None
+):
     """
     Compute the average precision, given the recall and precision curves.
 
@@ -38,6 +40,8 @@ def ap_per_class(tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names
         target_cls:  True object classes (nparray).
         plot:  Plot precision-recall curve at mAP@0.5
         save_dir:  Plot save directory
+        n:  Predictions per row (nparray), with tp holding TP counts per row, i.e. confidence histogram bins
+        nt:  Labels per class (nparray, nc), used in place of target_cls
     # Returns
         The average precision as computed in py-faster-rcnn.
     """
@@ -45,9 +49,15 @@ def ap_per_class(tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names
     # Sort by objectness
     i = np.argsort(-conf)
     tp, conf, pred_cls = tp[i], conf[i], pred_cls[i]
+    if n is not None:
+        n = n[i]
 
     # Find unique classes
-    unique_classes, nt = np.unique(target_cls, return_counts=True)
+    if nt is None:
+        unique_classes, nt = np.unique(target_cls, return_counts=True)
+    else:
+        unique_classes = np.flatnonzero(nt)
+        nt = nt[unique_classes]
     nc = unique_classes.shape[0]  # number of classes, number of detections
 
     # Create Precision-Recall curve and compute AP for each class
@@ -61,7 +71,7 @@ def ap_per_class(tp, conf, pred_cls, target_cls, plot=False, save_dir=".", names
             continue
 
         # Accumulate FPs and TPs
-        fpc = (1 - tp[i]).cumsum(0)
+        fpc = ((1 if n is None else n[i][:, None]) - tp[i]).cumsum(0)
         tpc = tp[i].cumsum(0)
 
         # Recall
@@ -123,15 +133,103 @@ def compute_ap(recall, precision):
     return ap, mpre, mrec
 
 
+class APAccumulator:
+    """
+    Accumulates (correct, conf, pcls, tcls) stats image by image into per-class confidence histograms of TP counts per
+    IoU threshold and prediction counts, i.e. bounded-memory mAP estimates mid-run; shards merge by adding histograms.
+    """
+
+    def __init__(self, nc, niou=10, bins=1000, exact=True, device=None):
+        """Initializes histograms with `bins` confidence bins on `device`; exact=True also keeps the raw stats for an
+        exact ap_per_class() at the end, at memory linear in the dataset.
+        """
+        self.nc, self.niou, self.bins, self.exact = nc, niou, bins, exact
+        self.tp = torch.zeros((nc, bins, niou), dtype=torch.long, device=device)  # TP counts per class, bin, IoU
+        self.n = torch.zeros((nc, bins), dtype=torch.long, device=device)  # prediction counts per class, bin
+        self.nt = torch.zeros(nc, dtype=torch.long, device=device)  # label counts per class
+        self.stats = []  # raw stats kept when exact
+
+    def update(self, correct, conf, pred_cls, target_cls):
+        """Adds one image's stats with scatter-adds on the histogram device, without host syncs."""
+        device = self.tp.device
+        cell = pred_cls.to(device).long() * self.bins + (conf.to(device) * self.bins).long().clamp_(0, self.bins - 1)
+        self.tp.view(-1, self.niou).index_add_(0, cell, correct.to(device).long())
+        self.n.view(-1).index_add_(0, cell, torch.ones_like(cell))
+        tcls = target_cls.to(device).long()
+        self.nt.index_add_(0, tcls, torch.ones_like(tcls))
+        if self.exact:
+            self.stats.append((correct, conf, pred_cls, target_cls))
+
+    def merge(self, other):
+        """Adds the histograms and raw stats of another accumulator or of its state_dict(), e.g. from another
+        process.
+        """
+        state = other.state_dict() if isinstance(other, APAccumulator) else other
+        device = self.tp.device
+        for k in ("tp", "n", "nt"):
+            getattr(self, k).add_(state[k].to(device))
+        if self.exact:
+            if state.get("stats") is None:
+                raise ValueError("APAccumulator(exact=True) can only merge accumulators that also kept raw stats")
+            if state["stats"]:  # empty when the other accumulator saw no images
+                self.stats.append(tuple(x.to(device) for x in state["stats"]))
+        return self
+
+    def state_dict(self):
+        """Returns the histograms, and the raw stats when exact, as CPU tensors for sending between processes."""
+        state = {k: getattr(self, k).cpu() for k in ("tp", "n", "nt")}
+        state["stats"] = [torch.cat(x, 0).cpu() for x in zip(*self.stats)] if self.exact else None
+        return state
+
+    def any(self):
+        """Returns True when any prediction was correct at the first IoU threshold, as required by ap_per_class()."""
+        return bool(self.tp[..., 0].any())
+
+    def compute(self, exact=None, **kwargs):
+        """Returns ap_per_class() results, from the raw stats when exact (default self.exact) else estimated from the
+        histograms with each prediction at its bin's centre confidence; kwargs are passed to ap_per_class().
+        """
+        exact = self.exact if exact is None else exact
+        if exact:
+            if not self.exact:
+                raise ValueError("exact metrics need APAccumulator(exact=True)")
+            stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*self.stats)]
+            return ap_per_class(*stats, **kwargs)
+        n = self.n.cpu().numpy()
+        pred_cls, b = np.nonzero(n)  # non-empty bins only
+        tp = self.tp.cpu().numpy()[pred_cls, b]
+        conf = (b + 0.5) / self.bins
+        return ap_per_class(tp, conf, pred_cls, None, n=n[pred_cls, b], nt=self.nt.cpu().numpy(), **kwargs)
+
+
 class ConfusionMatrix:
     # Updated version of https://github.com/kaanakan/object_detection_confusion_matrix
-    def __init__(self, nc, conf=0.25, iou_thres=0.45):
-        """Initializes ConfusionMatrix with given number of classes, confidence, and IoU threshold."""
-        self.matrix = np.zeros((nc + 1, nc + 1))
+    def __init__(self, nc, conf=0.25, iou_thres=0.45, device=None):
+        """
+        Initializes ConfusionMatrix with given number of classes, confidence, and IoU threshold; with a device, counts
+        accumulate there without host syncs until `matrix` is read.
+        """
+        self._matrix = np.zeros((nc + 1, nc + 1))
+        self._counts = torch.zeros((nc + 1) ** 2, dtype=torch.long, device=device) if device is not None else None
         self.nc = nc  # number of classes
         self.conf = conf
         self.iou_thres = iou_thres
 
+    @property
+    def matrix(self):
+        """Returns the (nc + 1, nc + 1) numpy matrix, first folding in counts accumulated on device."""
+        if self._counts is not None and self._counts.any():
+            self._matrix += self._counts.view(self.nc + 1, self.nc + 1).cpu().numpy()
+            self._counts.zero_()
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix):
+        """Replaces the matrix, discarding counts not yet folded in."""
+        self._matrix = matrix
+        if self._counts is not None:
+            self._counts.zero_()
+
     def process_batch(self, detections, labels):
         """
         Return intersection-over-union (Jaccard index) of boxes.
@@ -143,41 +241,49 @@ class ConfusionMatrix:
         Returns:
             None, updates confusion matrix accordingly
         """
+        nc, n1 = self.nc, self.nc + 1
         if detections is None:
-            gt_classes = labels.int()
-            for gc in gt_classes:
-                self.matrix[self.nc, gc] += 1  # background FN
+            self._add(nc * n1 + labels.long())  # background FN
             return
 
         detections = detections[detections[:, 4] > self.conf]
-        gt_classes = labels[:, 0].int()
-        detection_classes = detections[:, 5].int()
-        iou = box_iou(labels[:, 1:], detections[:, :4])
+        gt_classes = labels[:, 0].long()
+        detection_classes = detections[:, 5].long()
+        if not len(labels):
+            return  # nothing can match, and unmatched detections only count when something matched
+        if not len(detections):
+            self._add(nc * n1 + gt_classes)  # true background
+            return
 
-        x = torch.where(iou > self.iou_thres)
-        if x[0].shape[0]:
-            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()
-            if x[0].shape[0] > 1:
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
-        else:
-            matches = np.zeros((0, 3))
-
-        n = matches.shape[0] > 0
-        m0, m1, _ = matches.transpose().astype(int)
-        for i, gc in enumerate(gt_classes):
-            j = m0 == i
-            if n and sum(j) == 1:
-                self.matrix[detection_classes[m1[j]], gc] += 1  # correct
-            else:
-                self.matrix[self.nc, gc] += 1  # true background
-
-        if n:
-            for i, dc in enumerate(detection_classes):
-                if not any(m1 == i):
-                    self.matrix[dc, self.nc] += 1  # predicted background
+        # Each detection takes its highest-IoU label above the threshold, then each label keeps the highest-IoU
+        # detection that took it, so matches are one-to-one as with the sort/unique dedupe this replaces. Exact IoU ties
+        # go to the highest index, as a stable descending sort followed by a first-occurrence unique resolves them
+        iou = box_iou(labels[:, 1:], detections[:, :4])
+        best_iou, best_label = iou.flip(0).max(0)  # per detection
+        best_label = len(labels) - 1 - best_label
+        taken = (best_iou > self.iou_thres) & (best_label == torch.arange(len(labels), device=iou.device)[:, None])
+        match_iou, match_det = best_iou.expand_as(taken).masked_fill(~taken, -1).flip(1).max(1)  # per label
+        match_det = len(detections) - 1 - match_det
+        matched = match_iou > self.iou_thres
+        hits = torch.zeros_like(detection_classes).index_add_(0, match_det, matched.long())
+        unmatched = (hits == 0) & taken.any()  # predicted background only counts when something matched
+
+        rows = detection_classes[match_det].masked_fill(~matched, nc)  # correct, or true background
+        index = torch.cat((rows * n1 + gt_classes, detection_classes * n1 + nc))
+        self._add(index, torch.cat((torch.ones_like(gt_classes), unmatched.long())))
+
+    def _add(self, index, weights=None):
+        """Adds weights (default 1) to the flattened matrix cells at index in one scatter-add, without host syncs when
+        the counts live on device.
+        """
+        counts = self._counts
+        if counts is None:
+            counts = torch.zeros((self.nc + 1) ** 2, dtype=torch.long, device=index.device)
+        index = index.to(counts.device)
+        weights = torch.ones_like(index) if weights is None else weights.to(counts.device)
+        counts.index_add_(0, index, weights)
+        if self._counts is None:
+            self._matrix += counts.view(self.nc + 1, self.nc + 1).cpu().numpy()
 
     def tp_fp(self):
         """Calculates true positives (tp) and false positives (fp) excluding the background class from the confusion
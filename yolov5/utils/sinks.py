@@ -0,0 +1,292 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""Buffered and asynchronous detection result writers."""
+
+import csv
+import json
+import queue
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from pathlib import Path
+from threading import Thread
+
+
+class ResultSink(ABC):
+    """Buffers result rows and writes them through one file handle held open until close()."""
+
+    def __init__(self, path, buffer_size=4096):
+        """Initializes the sink for `path`; rows are written on flush() or once `buffer_size` rows are buffered."""
+        self.path = Path(path)
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.file = None
+
+    def write(self, row):
+        """Buffers one result row (a dict), flushing when the buffer is full."""
+        self.rows.append(row)
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows and flushes the file."""
+        if self.rows:
+            if self.file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._open()
+            self._write(self.rows)
+            self.rows = []
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """Flushes the remaining rows and closes the file."""
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _open(self):
+        """Opens the output file, appending to an existing one."""
+        self.file = open(self.path, "a", newline="")
+
+    @abstractmethod
+    def _write(self, rows):
+        """Writes rows to the open file."""
+
+    def __enter__(self):
+        """Returns the sink for use in a with-statement."""
+        return self
+
+    def __exit__(self, *args):
+        """Closes the sink on leaving the with-statement."""
+        self.close()
+
+
+class CSVSink(ResultSink):
+    """Writes rows to a CSV file, with a header when the file is new or empty."""
+
+    def __init__(self, path, buffer_size=4096, float_format="{:.2f}"):
+        """Initializes the CSV sink; float values are written with `float_format`."""
+        super().__init__(path, buffer_size)
+        self.float_format = float_format
+        self.writer = None
+
+    def _open(self):
+        """Opens the CSV file, noting before opening whether it still needs a header."""
+        self.write_header = not self.path.is_file() or self.path.stat().st_size == 0
+        super()._open()
+
+    def _write(self, rows):
+        """Writes rows with a DictWriter created for the first batch."""
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(rows[0]))
+            if self.write_header:
+                self.writer.writeheader()
+        self.writer.writerows(
+            {k: self.float_format.format(v) if isinstance(v, float) else v for k, v in row.items()} for row in rows
+        )
+
+
+class JSONLSink(ResultSink):
+    """Writes rows to a JSON Lines file, one object per line."""
+
+    def _write(self, rows):
+        """Writes each row as a JSON line."""
+        self.file.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+class ParquetSink(ResultSink):
+    """Writes rows to a Parquet file, one row group per flush; the file is complete once closed."""
+
+    def __init__(self, path, buffer_size=4096):
+        """Initializes the Parquet sink; pyarrow is required on first flush."""
+        super().__init__(path, buffer_size)
+        self.writer = None
+
+    def flush(self):
+        """Writes the buffered rows as one row group."""
+        if self.rows:
+            self._write(self.rows)
+            self.rows = []
+
+    def _write(self, rows):
+        """Writes rows as a row group, creating the ParquetWriter with the schema of the first batch."""
+        from utils.general import check_requirements
+
+        check_requirements("pyarrow")
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows)
+        if self.writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        """Flushes the remaining rows and writes the Parquet footer."""
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class LabelSink:
+    """Buffers *.txt label lines per file and appends each file once per flush."""
+
+    def __init__(self):
+        """Initializes an empty label buffer."""
+        self.lines = defaultdict(list)
+
+    def write(self, path, line):
+        """Buffers one label line for the label file `path`."""
+        self.lines[path].append(line)
+
+    def flush(self):
+        """Appends the buffered lines to their label files."""
+        for path, lines in self.lines.items():
+            with open(path, "a") as f:
+                f.writelines(lines)
+        self.lines.clear()
+
+    def close(self):
+        """Flushes the remaining lines."""
+        self.flush()
+
+
+class ResultSinks:
+    """Fans result rows out to several sinks, i.e. `ResultSinks.open(save_dir, csv=True, jsonl=True)`."""
+
+    def __init__(self, sinks=()):
+        """Initializes the fan-out over `sinks`."""
+        self.sinks = list(sinks)
+
+    @classmethod
+    def open(cls, save_dir, name="predictions", csv=False, jsonl=False, parquet=False):
+        """Creates the sinks for the requested formats, writing `save_dir/name.{csv,jsonl,parquet}`."""
+        save_dir = Path(save_dir)
+        sinks = [
+            sink(save_dir / f"{name}.{suffix}")
+            for enabled, sink, suffix in (
+                (csv, CSVSink, "csv"),
+                (jsonl, JSONLSink, "jsonl"),
+                (parquet, ParquetSink, "parquet"),
+            )
+            if enabled
+        ]
+        return cls(sinks)
+
+    def write(self, row):
+        """Writes one row to every sink."""
+        for sink in self.sinks:
+            sink.write(row)
+
+    def flush(self):
+        """Flushes every sink."""
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        """Closes every sink."""
+        for sink in self.sinks:
+            sink.close()
+
+    def __bool__(self):
+        """Returns True when at least one sink is open."""
+        return bool(self.sinks)
+
+    def __enter__(self):
+        """Returns the sinks for use in a with-statement."""
+        return self
+
+    def __exit__(self, *args):
+        """Closes the sinks on leaving the with-statement."""
+        self.close()
+
+
+class OrderedRows:
+    """Writes each item's rows to a sink in source order, holding back items that arrive early, i.e. regrouped batches."""
+
+    def __init__(self, sink):
+        """Initializes the reordering in front of `sink`, expecting item indices 0, 1, 2, ..."""
+        self.sink = sink
+        self.pending = {}  # index -> rows of items that arrived ahead of their turn
+        self.next = 0
+
+    def write(self, index, rows):
+        """Writes the rows of item `index` once every earlier item is written; None or past indices write through."""
+        if index is None or index < self.next:  # unordered sources, or further frames of a video already reached
+            for row in rows:
+                self.sink.write(row)
+            return
+        self.pending[index] = rows
+        while self.next in self.pending:
+            for row in self.pending.pop(self.next):
+                self.sink.write(row)
+            self.next += 1
+
+    def close(self):
+        """Writes rows still held back, i.e. after an earlier item failed, in index order."""
+        for index in sorted(self.pending):
+            for row in self.pending.pop(index):
+                self.sink.write(row)
+
+
+class AsyncWriter:
+    """Runs annotate/save jobs on writer threads behind bounded queues; submit() blocks while a queue is full."""
+
+    def __init__(self, workers=2, maxsize=32):
+        """Initializes `workers` writer threads each with a queue of `maxsize` jobs, workers=0 runs jobs inline."""
+        self.maxsize = maxsize
+        self.queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self.threads = [Thread(target=self._run, args=(q,), daemon=True) for q in self.queues]
+        for t in self.threads:
+            t.start()
+        self.jobs = 0
+        self.max_depth = 0  # deepest a queue got
+        self.blocked = 0.0  # seconds submit() waited on a full queue
+        self.error = None
+
+    def submit(self, fn, *args, key=None):
+        """Queues fn(*args); jobs with the same key run in order on the same thread, i.e. the frames of one video."""
+        self._raise()
+        self.jobs += 1
+        if not self.queues:
+            fn(*args)
+            return
+        q = self.queues[hash(key) % len(self.queues)] if key is not None else min(self.queues, key=queue.Queue.qsize)
+        t = time.perf_counter()
+        q.put((fn, args))  # backpressure, waits for a free slot
+        self.blocked += time.perf_counter() - t
+        self.max_depth = max(self.max_depth, q.qsize())
+
+    def close(self):
+        """Finishes every queued job, stops the threads and raises the first job error, if any."""
+        for q in self.queues:
+            q.put(None)
+        for t in self.threads:
+            t.join()
+        self.queues, self.threads = [], []
+        self._raise()
+
+    def stats(self):
+        """Returns a one-line summary of the queue depth and the time inference waited on the writers."""
+        return f"{self.jobs} jobs, max queue depth {self.max_depth}/{self.maxsize}, blocked {self.blocked:.2f}s"
+
+    def _run(self, q):
+        """Writer thread loop, runs jobs until the None sentinel."""
+        while True:
+            job = q.get()
+            if job is None:
+                return
+            fn, args = job
+            try:
+                fn(*args)
+            except Exception as e:
+                self.error = self.error or e
+
+    def _raise(self):
+        """Re-raises a job error on the submitting thread."""
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
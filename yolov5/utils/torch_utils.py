@@ -5,8 +5,10 @@ import math
 import os
 import platform
 import subprocess
+import threading
 import time
 import warnings
+from collections import OrderedDict
 from contextlib import contextmanager
 from copy import deepcopy
 from pathlib import Path
@@ -445,6 +447,28 @@ class EarlyStopping:
         return stop
 
 
+class BufferPool:
+    # YOLOv5 tensor buffer pool, reusable tensors keyed by (tag, shape, dtype, device), kept per thread
+    def __init__(self, max_size=16):
+        """Initializes the pool; each thread keeps its max_size most recently used tensors."""
+        self.max_size = max_size
+        self.local = threading.local()
+
+    def get(self, shape, dtype=torch.float32, device="cpu", pin_memory=False, tag="input"):
+        """Returns the pooled tensor for a key, allocated on first use; its previous contents are not preserved."""
+        buffers = self.local.__dict__.setdefault("buffers", OrderedDict())
+        device = torch.device(device)
+        key = tag, tuple(shape), dtype, device
+        if key in buffers:
+            buffers.move_to_end(key)
+        else:
+            pin = pin_memory and device.type == "cpu" and torch.cuda.is_available()
+            buffers[key] = torch.empty(tuple(shape), dtype=dtype, device=device, pin_memory=pin)
+            if len(buffers) > self.max_size:
+                buffers.popitem(last=False)  # evict least recently used
+        return buffers[key]
+
+
 class ModelEMA:
     """Updated Exponential Moving Average (EMA) from https://github.com/rwightman/pytorch-image-models
     Keeps a moving average of everything in the model state_dict (parameters and buffers)
@@ -21,9 +21,11 @@ Usage - formats:
 
 import argparse
 import json
+import multiprocessing
 import os
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import numpy as np
@@ -38,6 +40,7 @@ ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
 from models.common import DetectMultiBackend
 from utils.callbacks import Callbacks
+from utils.augmentations import LetterboxPreprocessor
 from utils.dataloaders import create_dataloader
 from utils.general import (
     LOGGER,
@@ -56,7 +59,7 @@ from utils.general import (
     xywh2xyxy,
     xyxy2xywh,
 )
-from utils.metrics import ConfusionMatrix, ap_per_class, box_iou
+from utils.metrics import APAccumulator, ConfusionMatrix, box_iou
 from utils.plots import output_to_target, plot_images, plot_val_study
 from utils.torch_utils import select_device, smart_inference_mode
 
@@ -101,20 +104,23 @@ def process_batch(detections, labels, iouv):
     Returns:
         correct (array[N, 10]), for 10 IoU levels
     """
-    correct = np.zeros((detections.shape[0], iouv.shape[0])).astype(bool)
+    n, m, niou = detections.shape[0], labels.shape[0], iouv.shape[0]
+    if n == 0 or m == 0:
+        return torch.zeros((n, niou), dtype=torch.bool, device=iouv.device)
+
+    # All IoU thresholds at once on the input device, without host syncs. Each detection takes its highest-IoU label
+    # of the same class, then each label keeps the lowest-index detection that took it, as the per-threshold dedupe did.
+    # Exact IoU ties go to the highest label index, as the descending sort followed by a first-occurrence unique did
     iou = box_iou(labels[:, 1:], detections[:, :4])
-    correct_class = labels[:, 0:1] == detections[:, 5]
-    for i in range(len(iouv)):
-        x = torch.where((iou >= iouv[i]) & correct_class)  # IoU > threshold and classes match
-        if x[0].shape[0]:
-            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).cpu().numpy()  # [label, detect, iou]
-            if x[0].shape[0] > 1:
-                matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
-                # matches = matches[matches[:, 2].argsort()[::-1]]
-                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
-            correct[matches[:, 1].astype(int), i] = True
-    return torch.tensor(correct, dtype=torch.bool, device=iouv.device)
+    iou = iou.masked_fill(labels[:, 0:1] != detections[:, 5], -1)  # class mismatches never match
+    best_iou, best_label = iou.flip(0).max(0)  # (n), best label per detection
+    best_label = m - 1 - best_label
+    matched = best_iou[None] >= iouv[:, None]  # (niou, n)
+    owner = matched[:, None] & (best_label[None] == torch.arange(m, device=iou.device)[:, None])[None]  # (niou, m, n)
+    index = torch.arange(n, device=iou.device).expand_as(owner)
+    first = index.masked_fill(~owner, n).amin(2)  # (niou, m), lowest detection per label, n if none
+    correct = torch.zeros((niou, n + 1), dtype=torch.bool, device=iou.device).scatter_(1, first, True)
+    return correct[:, :n].T.to(iouv.device)
 
 
 @smart_inference_mode()
@@ -141,6 +147,11 @@ def run(
     exist_ok=False,  # existing project/name ok, do not increment
     half=True,  # use FP16 half-precision inference
     dnn=False,  # use OpenCV DNN for ONNX inference
+    streaming_metrics=False,  # bounded-memory mAP estimated from confidence histograms instead of exact stats
+    metrics_interval=50,  # batches between running mAP estimates on the progress bar, 0 to disable
+    shards=1,  # worker processes to split the dataset across, each with its own model replica
+    shard_threads=0,  # intra-op threads per shard, 0 for cpu_count // shards
+    shard=None,  # (index, count) of the shard to validate in a worker process, returns its raw state for merging
     model=None,
     dataloader=None,
     save_dir=Path(""),
@@ -187,6 +198,33 @@ def run(
 
     # Dataloader
     if not training:
+        shard_kwargs = dict(
+            data=data,
+            weights=weights,
+            batch_size=batch_size,
+            imgsz=imgsz,
+            conf_thres=conf_thres,
+            iou_thres=iou_thres,
+            max_det=max_det,
+            task=task,
+            device=str(device),
+            workers=workers // shards,
+            single_cls=single_cls,
+            augment=augment,
+            verbose=verbose,
+            save_txt=save_txt,
+            save_hybrid=save_hybrid,
+            save_conf=save_conf,
+            save_json=save_json,
+            project=save_dir.parent,
+            name=save_dir.name,
+            exist_ok=True,  # the workers share this run's save_dir
+            half=half,
+            dnn=dnn,
+            streaming_metrics=streaming_metrics,
+            metrics_interval=0,
+            plots=plots,
+        )
         if pt and not single_cls:  # check --weights are trained on --data
             ncm = model.model.nc
             assert ncm == nc, (
@@ -204,12 +242,14 @@ def run(
             single_cls,
             pad=pad,
             rect=rect,
-            workers=workers,
+            workers=0 if shard else workers,
             prefix=colorstr(f"{task}: "),
         )[0]
+        if shard:
+            dataloader = shard_dataloader(dataloader, *shard, workers=workers)
 
     seen = 0
-    confusion_matrix = ConfusionMatrix(nc=nc)
+    confusion_matrix = ConfusionMatrix(nc=nc, device=device)
     names = model.names if hasattr(model, "names") else model.module.names  # get class names
     if isinstance(names, (list, tuple)):  # old format
         names = dict(enumerate(names))
@@ -217,89 +257,121 @@ def run(
     s = ("%22s" + "%11s" * 6) % ("Class", "Images", "Instances", "P", "R", "mAP50", "mAP50-95")
     tp, fp, p, r, f1, mp, mr, map50, ap50, map = 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0
     dt = Profile(device=device), Profile(device=device), Profile(device=device)  # profiling times
+    dm = Profile(device=device)  # matching predictions to labels
     loss = torch.zeros(3, device=device)
-    jdict, stats, ap, ap_class = [], [], [], []
+    jdict, ap, ap_class = [], [], []
+    plotting = []  # batch plot threads
+    stats = APAccumulator(nc, niou, exact=not streaming_metrics, device=device)  # (correct, conf, pcls, tcls)
+    preprocess = LetterboxPreprocessor(device=device, half=half)  # fused normalization into a reused input tensor
     callbacks.run("on_val_start")
-    pbar = tqdm(dataloader, desc=s, bar_format=TQDM_BAR_FORMAT)  # progress bar
-    for batch_i, (im, targets, paths, shapes) in enumerate(pbar):
-        callbacks.run("on_val_batch_start")
-        with dt[0]:
-            if cuda:
-                im = im.to(device, non_blocking=True)
-                targets = targets.to(device)
-            im = im.half() if half else im.float()  # uint8 to fp16/32
-            im /= 255  # 0 - 255 to 0.0 - 1.0
-            nb, _, height, width = im.shape  # batch size, channels, height, width
-
-        # Inference
-        with dt[1]:
-            preds, train_out = model(im) if compute_loss else (model(im, augment=augment), None)
-
-        # Loss
-        if compute_loss:
-            loss += compute_loss(train_out, targets)[1]  # box, obj, cls
-
-        # NMS
-        targets[:, 2:] *= torch.tensor((width, height, width, height), device=device)  # to pixels
-        lb = [targets[targets[:, 0] == i, 1:] for i in range(nb)] if save_hybrid else []  # for autolabelling
-        with dt[2]:
-            preds = non_max_suppression(
-                preds, conf_thres, iou_thres, labels=lb, multi_label=True, agnostic=single_cls, max_det=max_det
-            )
-
-        # Metrics
-        for si, pred in enumerate(preds):
-            labels = targets[targets[:, 0] == si, 1:]
-            nl, npr = labels.shape[0], pred.shape[0]  # number of labels, predictions
-            path, shape = Path(paths[si]), shapes[si][0]
-            correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
-            seen += 1
-
-            if npr == 0:
+    if shards > 1 and not training:
+        threads = shard_threads or max(1, (os.cpu_count() or 1) // shards)
+        LOGGER.info(f"Validating {len(dataloader.dataset)} images in {shards} shards of {threads} threads each...")
+        for state in run_shards(shards, threads, shard_kwargs, desc=s):  # in shard order, as a single process runs
+            stats.merge(state["stats"])
+            confusion_matrix.matrix += state["matrix"]
+            jdict += state["jdict"]
+            seen += state["seen"]
+            loss += state["loss"].to(device)
+            for x, t in zip((*dt, dm), state["t"]):
+                x.t += t
+    else:
+        pbar = tqdm(dataloader, desc=s, bar_format=TQDM_BAR_FORMAT, disable=bool(shard))  # progress bar
+        for batch_i, (im, targets, paths, shapes) in enumerate(pbar):
+            callbacks.run("on_val_batch_start")
+            with dt[0]:
+                if cuda:
+                    targets = targets.to(device)
+                im = preprocess.normalize(im)  # uint8 to fp16/32, 0 - 255 to 0.0 - 1.0
+                nb, _, height, width = im.shape  # batch size, channels, height, width
+
+            # Inference
+            with dt[1]:
+                preds, train_out = model(im) if compute_loss else (model(im, augment=augment), None)
+
+            # Loss
+            if compute_loss:
+                loss += compute_loss(train_out, targets)[1]  # box, obj, cls
+
+            # NMS
+            targets[:, 2:] *= torch.tensor((width, height, width, height), device=device)  # to pixels
+            lb = [targets[targets[:, 0] == i, 1:] for i in range(nb)] if save_hybrid else []  # for autolabelling
+            with dt[2]:
+                preds = non_max_suppression(
+                    preds, conf_thres, iou_thres, labels=lb, multi_label=True, agnostic=single_cls, max_det=max_det
+                )
+
+            # Metrics
+            for si, pred in enumerate(preds):
+                labels = targets[targets[:, 0] == si, 1:]
+                nl, npr = labels.shape[0], pred.shape[0]  # number of labels, predictions
+                path, shape = Path(paths[si]), shapes[si][0]
+                correct = torch.zeros(npr, niou, dtype=torch.bool, device=device)  # init
+                seen += 1
+
+                if npr == 0:
+                    if nl:
+                        stats.update(correct, *torch.zeros((2, 0), device=device), labels[:, 0])
+                        if plots:
+                            confusion_matrix.process_batch(detections=None, labels=labels[:, 0])
+                    continue
+
+                # Predictions
+                if single_cls:
+                    pred[:, 5] = 0
+                predn = pred.clone()
+                scale_boxes(im[si].shape[1:], predn[:, :4], shape, shapes[si][1])  # native-space pred
+
+                # Evaluate
                 if nl:
-                    stats.append((correct, *torch.zeros((2, 0), device=device), labels[:, 0]))
+                    tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
+                    scale_boxes(im[si].shape[1:], tbox, shape, shapes[si][1])  # native-space labels
+                    labelsn = torch.cat((labels[:, 0:1], tbox), 1)  # native-space labels
+                    with dm:
+                        correct = process_batch(predn, labelsn, iouv)
                     if plots:
-                        confusion_matrix.process_batch(detections=None, labels=labels[:, 0])
-                continue
-
-            # Predictions
-            if single_cls:
-                pred[:, 5] = 0
-            predn = pred.clone()
-            scale_boxes(im[si].shape[1:], predn[:, :4], shape, shapes[si][1])  # native-space pred
-
-            # Evaluate
-            if nl:
-                tbox = xywh2xyxy(labels[:, 1:5])  # target boxes
-                scale_boxes(im[si].shape[1:], tbox, shape, shapes[si][1])  # native-space labels
-                labelsn = torch.cat((labels[:, 0:1], tbox), 1)  # native-space labels
-                correct = process_batch(predn, labelsn, iouv)
-                if plots:
-                    confusion_matrix.process_batch(predn, labelsn)
-            stats.append((correct, pred[:, 4], pred[:, 5], labels[:, 0]))  # (correct, conf, pcls, tcls)
-
-            # Save/log
-            if save_txt:
-                (save_dir / "labels").mkdir(parents=True, exist_ok=True)
-                save_one_txt(predn, save_conf, shape, file=save_dir / "labels" / f"{path.stem}.txt")
-            if save_json:
-                save_one_json(predn, jdict, path, class_map)  # append to COCO-JSON dictionary
-            callbacks.run("on_val_image_end", pred, predn, path, names, im[si])
-
-        # Plot images
-        if plots and batch_i < 3:
-            plot_images(im, targets, paths, save_dir / f"val_batch{batch_i}_labels.jpg", names)  # labels
-            plot_images(im, output_to_target(preds), paths, save_dir / f"val_batch{batch_i}_pred.jpg", names)  # pred
-
-        callbacks.run("on_val_batch_end", batch_i, im, targets, paths, shapes, preds)
+                        confusion_matrix.process_batch(predn, labelsn)
+                stats.update(correct, pred[:, 4], pred[:, 5], labels[:, 0])  # (correct, conf, pcls, tcls)
+
+                # Save/log
+                if save_txt:
+                    (save_dir / "labels").mkdir(parents=True, exist_ok=True)
+                    save_one_txt(predn, save_conf, shape, file=save_dir / "labels" / f"{path.stem}.txt")
+                if save_json:
+                    save_one_json(predn, jdict, path, class_map)  # append to COCO-JSON dictionary
+                callbacks.run("on_val_image_end", pred, predn, path, names, im[si])
+
+            # Plot images
+            if plots and batch_i < 3 and (shard is None or shard[0] == 0):  # first shard has the first batches
+                f, ims = save_dir / f"val_batch{batch_i}", im.clone()  # the next batch overwrites the reused input
+                plotting.append(plot_images(ims, targets, paths, f"{f}_labels.jpg", names))  # labels
+                plotting.append(plot_images(ims, output_to_target(preds), paths, f"{f}_pred.jpg", names))  # pred
+
+            callbacks.run("on_val_batch_end", batch_i, im, targets, paths, shapes, preds)
+
+            # Running mAP estimate from the histograms
+            if metrics_interval and not training and (batch_i + 1) % metrics_interval == 0 and stats.any():
+                ap_est = stats.compute(exact=False, names=names)[5]
+                pbar.set_postfix_str(f"mAP50 ~{ap_est[:, 0].mean():.3g}, mAP50-95 ~{ap_est.mean():.3g}")
+
+    if shard:  # raw state for the parent process to merge
+        for thread in plotting:
+            thread.join()  # daemon plot threads would die with the worker process
+        return {
+            "stats": stats.state_dict(),
+            "matrix": confusion_matrix.matrix,
+            "jdict": jdict,
+            "seen": seen,
+            "loss": loss.cpu(),
+            "t": [x.t for x in (*dt, dm)],
+        }
 
     # Compute metrics
-    stats = [torch.cat(x, 0).cpu().numpy() for x in zip(*stats)]  # to numpy
-    if len(stats) and stats[0].any():
-        tp, fp, p, r, f1, ap, ap_class = ap_per_class(*stats, plot=plots, save_dir=save_dir, names=names)
+    if stats.any():
+        tp, fp, p, r, f1, ap, ap_class = stats.compute(plot=plots, save_dir=save_dir, names=names)
         ap50, ap = ap[:, 0], ap.mean(1)  # AP@0.5, AP@0.5:0.95
         mp, mr, map50, map = p.mean(), r.mean(), ap50.mean(), ap.mean()
-    nt = np.bincount(stats[3].astype(int), minlength=nc)  # number of targets per class
+    nt = stats.nt.cpu().numpy()  # number of targets per class
 
     # Print results
     pf = "%22s" + "%11i" * 2 + "%11.3g" * 4  # print format
@@ -308,7 +380,7 @@ def run(
         LOGGER.warning(f"WARNING ⚠️ no labels found in {task} set, can not compute metrics without labels")
 
     # Print results per class
-    if (verbose or (nc < 50 and not training)) and nc > 1 and len(stats):
+    if (verbose or (nc < 50 and not training)) and nc > 1 and seen:
         for i, c in enumerate(ap_class):
             LOGGER.info(pf % (names[c], seen, nt[c], p[i], r[i], ap50[i], ap[i]))
 
@@ -316,7 +388,11 @@ def run(
     t = tuple(x.t / seen * 1e3 for x in dt)  # speeds per image
     if not training:
         shape = (batch_size, 3, imgsz, imgsz)
-        LOGGER.info(f"Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {shape}" % t)
+        tm = dm.t / seen * 1e3
+        s = f"%.1fms pre-process, %.1fms inference, %.1fms NMS, {tm:.1f}ms metrics per image" % t
+        if shards > 1:  # shard times add up, so these are CPU times; shards run in parallel
+            s += f" (CPU time summed over {shards} shards, ~{(sum(t) + tm) / shards:.1f}ms wall time per image)"
+        LOGGER.info(f"Speed: {s} at shape {shape}")
 
     # Plots
     if plots:
@@ -362,6 +438,37 @@ def run(
     return (mp, mr, map50, map, *(loss.cpu() / len(dataloader)).tolist()), maps, t
 
 
+def shard_dataloader(dataloader, index, count, workers=8):
+    """Returns a dataloader over shard `index` of `count`, a contiguous run of whole batches so that rect batch shapes
+    and prediction order match a single-process run.
+    """
+    dataset, bs, nb = dataloader.dataset, dataloader.batch_size, len(dataloader)
+    indices = range(nb * index // count * bs, min(nb * (index + 1) // count * bs, len(dataset)))
+    return torch.utils.data.DataLoader(
+        torch.utils.data.Subset(dataset, indices),
+        batch_size=bs,
+        shuffle=False,
+        num_workers=min(os.cpu_count(), bs if bs > 1 else 0, workers),
+        pin_memory=dataloader.pin_memory,
+        collate_fn=dataloader.collate_fn,
+    )
+
+
+def run_shard(shard, threads, kwargs):
+    """Validates one shard in a worker process with `threads` intra-op threads, returning its raw state."""
+    torch.set_num_threads(threads)
+    return run(**kwargs, shard=shard)
+
+
+def run_shards(shards, threads, kwargs, desc=""):
+    """Validates `shards` shards in spawned worker processes, returning their raw states in shard order."""
+    with ProcessPoolExecutor(shards, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_shard, (i, shards), threads, kwargs) for i in range(shards)]
+        for _ in tqdm(as_completed(futures), total=shards, desc=desc, bar_format=TQDM_BAR_FORMAT):
+            pass
+        return [f.result() for f in futures]
+
+
 def parse_opt():
     """Parses command-line options for YOLOv5 model inference configuration."""
     parser = argparse.ArgumentParser()
@@ -387,6 +494,10 @@ def parse_opt():
     parser.add_argument("--exist-ok", action="store_true", help="existing project/name ok, do not increment")
     parser.add_argument("--half", action="store_true", help="use FP16 half-precision inference")
     parser.add_argument("--dnn", action="store_true", help="use OpenCV DNN for ONNX inference")
+    parser.add_argument("--streaming-metrics", action="store_true", help="bounded-memory mAP from histograms")
+    parser.add_argument("--metrics-interval", type=int, default=50, help="batches between running mAP estimates")
+    parser.add_argument("--shards", type=int, default=1, help="worker processes to split validation across")
+    parser.add_argument("--shard-threads", type=int, default=0, help="intra-op threads per shard, 0 for auto")
     opt = parser.parse_args()
     opt.data = check_yaml(opt.data)  # check YAML
     opt.save_json |= opt.data.endswith("coco.yaml")